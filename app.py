@@ -267,10 +267,20 @@ def run_demo():
     return jsonify({"job_id": job_id, "status": "queued"}), 202
 
 
+def _with_progress(job):
+    """Attach the download progress the demo script reports, if any."""
+    progress_path = OUTPUT_DIR / job["job_id"] / "progress.json"
+    try:
+        with open(progress_path, encoding="utf-8") as fin:
+            return {**job, "progress": json.load(fin)}
+    except (OSError, ValueError):
+        return job
+
+
 @app.route("/api/jobs", methods=["GET"])
 def list_jobs():
     ordered = sorted(jobs.values(), key=lambda j: j["created_at"], reverse=True)
-    return jsonify(ordered)
+    return jsonify([_with_progress(job) for job in ordered])
 
 
 @app.route("/api/jobs/<job_id>", methods=["GET"])
@@ -278,7 +288,7 @@ def get_job(job_id):
     job = jobs.get(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
-    return jsonify(job)
+    return jsonify(_with_progress(job))
 
 
 @app.route("/api/artifacts/<path:filepath>")
@@ -12,22 +12,13 @@ import sys
 from laika import AstroDog
 from laika.gps_time import GPSTime
 
-from tid import plot, util, scenario
+from tid import plot, scheduler, util, scenario
 from tid.config import Configuration
 
 
-if len(sys.argv) < 2:
-    print(f"Usage: {sys.argv[0]} output_folder")
-    sys.exit(0)
-output_folder = sys.argv[1]
-
-
 # load configuration data
 conf = Configuration()
 
-# create our helpful astro dog
-dog = AstroDog(cache_dir=conf.cache_dir)
-
 
 # spread throughout Japan
 # fmt: off
@@ -79,40 +70,57 @@ jp_stations = [
 # fmt: on
 
 
-# Use the most recently completed hour instead of waiting for the next one.
-# The original live.py waited until :06 past the next hour; here we go back
-# to the last completed hour boundary (and allow a few minutes for upstream
-# data to be posted).
-now = datetime.datetime.utcnow()
-# Roll back to the start of the current hour, then subtract 1 hour
-# to ensure the data window is fully closed on the server side.
-date = datetime.datetime(now.year, now.month, now.day, now.hour) - util.HOURS
-
-conf.logger.info(f"One-shot mode: processing window {date} – {date + util.HOURS}")
-
-# Pre-fetch satellite info
-dog.get_all_sat_info(GPSTime.from_datetime(date + util.HOURS))
-
-conf.logger.info("Starting scenario (downloading files, etc)")
-sc = scenario.Scenario.from_daterange(
-    date, util.HOURS, jp_stations, dog, use_cache=False
-)
-
-conf.logger.info("Downloading complete, creating connections")
-sc.make_connections()
-
-conf.logger.info("Connections created, resolving biases")
-sc.solve_biases()
-
-conf.logger.info("Preparing animation")
-extent = (123, 149, 33, 48)
-
-ani = plot.plot_map(
-    sc, extent=extent, frames=range(1, 119), raw=False, display=False
-)
-ani.save(
-    f"{output_folder}/{date.strftime('%Y-%m-%d_%H')}_wide_short_borders_350km.mp4",
-    dpi=350,
-)
-
-conf.logger.info("Done — animation saved.")
+def main(output_folder: str) -> None:
+    # create our helpful astro dog
+    dog = AstroDog(cache_dir=conf.cache_dir)
+
+    # Use the most recently completed hour instead of waiting for the next one.
+    # The original live.py waited until :06 past the next hour; here we go back
+    # to the last completed hour boundary (and allow a few minutes for upstream
+    # data to be posted).
+    now = datetime.datetime.utcnow()
+    # Roll back to the start of the current hour, then subtract 1 hour
+    # to ensure the data window is fully closed on the server side.
+    date = datetime.datetime(now.year, now.month, now.day, now.hour) - util.HOURS
+
+    conf.logger.info(f"One-shot mode: processing window {date} – {date + util.HOURS}")
+
+    # Pre-fetch satellite info
+    dog.get_all_sat_info(GPSTime.from_datetime(date + util.HOURS))
+
+    conf.logger.info("Starting scenario (downloading files, etc)")
+    sc = scenario.Scenario.from_daterange(
+        date,
+        util.HOURS,
+        jp_stations,
+        dog,
+        use_cache=False,
+        progress=scheduler.progress_file(f"{output_folder}/{scheduler.PROGRESS_FILE}"),
+    )
+
+    conf.logger.info("Downloading complete, creating connections")
+    sc.make_connections()
+
+    conf.logger.info("Connections created, resolving biases")
+    sc.solve_biases()
+
+    conf.logger.info("Preparing animation")
+    extent = (123, 149, 33, 48)
+
+    ani = plot.plot_map(
+        sc, extent=extent, frames=range(1, 119), raw=False, display=False
+    )
+    ani.save(
+        f"{output_folder}/{date.strftime('%Y-%m-%d_%H')}_wide_short_borders_350km.mp4",
+        dpi=350,
+    )
+
+    conf.logger.info("Done — animation saved.")
+
+
+# the scenario starts worker processes, which import this file again
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} output_folder")
+        sys.exit(0)
+    main(sys.argv[1])
@@ -0,0 +1,40 @@
+"""
+Time the breakpoint search that splits one satellite's observations into
+connections: scenario.connection_bounds against the set based search it
+replaced (kept in tid/tests/test_scenario.py to check they agree).
+
+Usage: python benchmarks/bench_connections.py [--observations 2880] [--repeat 200]
+"""
+import argparse
+import time
+
+import numpy
+
+from tid import scenario
+from tid.tests.test_scenario import random_signals, reference_bounds
+
+
+def run(args) -> None:
+    rand = numpy.random.default_rng(0)
+    prns = [random_signals(rand, args.observations) for _ in range(args.repeat)]
+
+    timings = {}
+    for name, find in (
+        ("set based", reference_bounds),
+        ("vectorized", scenario.connection_bounds),
+    ):
+        before = time.perf_counter()
+        for signals in prns:
+            find(*signals)
+        timings[name] = (time.perf_counter() - before) / len(prns)
+        print(f"{name}: {timings[name] * 1e3:.3f} ms per PRN")
+    print(f"speedup: {timings['set based'] / timings['vectorized']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--observations", type=int, default=2880, help="per PRN (2880 is a day)"
+    )
+    parser.add_argument("--repeat", type=int, default=200, help="PRNs to time")
+    run(parser.parse_args())
@@ -0,0 +1,148 @@
+"""
+Time parallel_populate_data end to end against the local stand-in archives
+(benchmarks/mock_archive.py), so download throughput can be measured and
+compared without the real servers. Each invocation starts from an empty cache;
+with --repeat, the later runs reuse it, timing the warm cache path instead.
+
+The satellite orbits come from laika's own servers, so they are left out:
+every GPS and GLONASS satellite is treated as known.
+
+Usage: python benchmarks/bench_download.py [--stations 100] [--latency 0.2] [--bandwidth 1e6]
+       [--repeat 2]
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import numpy
+import yaml
+
+sys.path.insert(0, os.path.dirname(__file__))
+# pylint: disable=wrong-import-position
+from mock_archive import Behaviour, MockArchive  # noqa: E402
+
+DAY = datetime(2019, 6, 12)  # the day tid.tests.test_rinex.write_rinex writes
+NETWORKS = ("cors", "Japan", "Korea", "Mongolia")
+PRNS = [f"G{i:02d}" for i in range(1, 33)] + [f"R{i:02d}" for i in range(1, 25)]
+
+
+def pick_stations(count: int, networks, station_networks, seed: int = 0):
+    """
+    Spread the stations across the networks: real station names for networks
+    with their own downloaders, made up names for CORS
+    """
+    rand = random.Random(seed)
+    stations = []
+    for i, network in enumerate(networks):
+        share = count // len(networks) + (i < count % len(networks))
+        if network == "cors":
+            names = [f"x{n:03d}" for n in range(1000)]
+            names = [name for name in names if name not in station_networks]
+        else:
+            names = sorted(
+                name for name, net in station_networks.items() if net == network
+            )
+        stations += rand.sample(names, min(share, len(names)))
+    return stations
+
+
+def run(args, rinex_path: Optional[str]) -> None:
+    with open(
+        os.path.join(os.path.dirname(__file__), "..", "tid", "lookup_tables")
+        + "/station_networks.json",
+        encoding="utf-8",
+    ) as fin:
+        station_networks = json.load(fin)
+    stations = pick_stations(args.stations, args.networks.split(","), station_networks)
+
+    behaviour = Behaviour(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        missing_rate=args.missing_rate,
+    )
+    with tempfile.TemporaryDirectory() as tmp, MockArchive(
+        b"", stations, behaviour
+    ) as archive:
+        # tid reads its configuration when first imported, so this goes first
+        config_path = os.path.join(tmp, "configuration.yml")
+        with open(config_path, "w", encoding="utf-8") as fout:
+            yaml.safe_dump(
+                {
+                    "cache_dir": os.path.join(tmp, "cache") + "/",
+                    "logging": {"level": "WARNING"},
+                    "archives": archive.urls(),
+                },
+                fout,
+            )
+        os.environ["TID_CONFIG"] = config_path
+        # pylint: disable=import-outside-toplevel
+        from laika.gps_time import GPSTime
+
+        from tid import get_data, orbits, scheduler
+        from tid.tests.test_rinex import write_rinex
+
+        if rinex_path is None:
+            rinex_path = os.path.join(tmp, "fixture.19o")
+            write_rinex(rinex_path, epochs=2880)
+        archive.rinex = Path(rinex_path).read_bytes()
+        # compress up front, so it isn't timed as part of the first download
+        for kind in ("o", "d"):
+            for compression in ("gz", "Z"):
+                archive.content(kind, compression)
+
+        def no_orbits(dog, start_time, duration):
+            ticks = int(duration.total_seconds() / 30) + 1
+            zeros = numpy.zeros((len(PRNS), ticks, 3))
+            return orbits.OrbitTable(PRNS, zeros, zeros)
+
+        get_data.build_orbit_table = no_orbits
+
+        reports = []
+        for attempt in range(args.repeat):
+            before = time.perf_counter()
+            _, data, _ = get_data.parallel_populate_data(
+                stations,
+                GPSTime.from_datetime(DAY),
+                timedelta(days=1),
+                None,
+                progress=reports.append,
+            )
+            elapsed = time.perf_counter() - before
+            final = reports[-1] if reports else scheduler.Progress(0, 0, 0, 0)
+            print(
+                f"run {attempt + 1}: {len(stations)} stations in {elapsed:.2f}s "
+                f"({len(stations) / elapsed:.1f}/s), {len(data)} with data, "
+                f"{final.failed} failed, {final.rinex_bytes / 1e6:.1f} MB of RINEX fetched; "
+                f"server saw {archive.requests} requests, "
+                f"sent {archive.bytes_sent / 1e6:.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument(
+        "--networks",
+        default="cors",
+        help=f"comma separated, any of {', '.join(NETWORKS)}",
+    )
+    parser.add_argument(
+        "--rinex", help="RINEX 2 file to serve for 2019-06-12 (default: synthetic)"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes/s")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs, later ones with a warm cache"
+    )
+    cli_args = parser.parse_args()
+    run(cli_args, cli_args.rinex)
@@ -0,0 +1,61 @@
+"""
+Compare the native RINEX 2 parser against georinex on real observation files,
+eg 30 second daily files from the cache directory
+
+Usage: python benchmarks/bench_rinex.py file.19o [file2.19o ...]
+"""
+import argparse
+from pathlib import Path
+import time
+
+import georinex
+import numpy
+
+from laika.gps_time import GPSTime
+
+from tid import get_data, rinex, util
+
+
+def main(paths):
+    total_georinex = 0.0
+    total_native = 0.0
+    for path in paths:
+        obs = rinex.read_obs(str(path), interval=util.DATA_RATE)
+        # tick 0 at midnight of the first day in the file
+        start_date = GPSTime.from_datetime(
+            obs.times.min().astype("datetime64[D]").astype("datetime64[us]").item()
+        )
+
+        before = time.perf_counter()
+        expected = get_data.from_xarray(
+            georinex.load(path, interval=30, use=["G", "R"], fast=False), start_date
+        )
+        middle = time.perf_counter()
+        actual = get_data.from_rinex(
+            rinex.read_obs(str(path), interval=util.DATA_RATE), start_date
+        )
+        after = time.perf_counter()
+
+        same = sorted(expected) == sorted(actual) and all(
+            numpy.array_equal(expected[prn][field], actual[prn][field], equal_nan=True)
+            for prn in expected
+            for field in ("tick", "C1C", "C2C", "L1C", "L2C")
+        )
+        total_georinex += middle - before
+        total_native += after - middle
+        print(
+            f"{path.name}: georinex {middle - before:.2f}s, "
+            f"native {after - middle:.3f}s, "
+            f"{'identical' if same else 'MISMATCH'}"
+        )
+
+    print(
+        f"total: georinex {total_georinex:.2f}s, native {total_native:.2f}s "
+        f"({total_georinex / max(total_native, 1e-9):.0f}x)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", type=Path, help="RINEX 2 obs files")
+    main(parser.parse_args().paths)
@@ -0,0 +1,539 @@
+"""
+A local stand-in for the GNSS archives we download from, so the download
+stack can be exercised (and timed) without the real servers.
+
+Serves HTTP and FTP, with each archive under its own top level directory and
+the same layout as the real thing below that, eg
+    http://127.0.0.1:PORT/noaa/2019/163/slac/slac1630.19d.gz
+    ftp://127.0.0.1:PORT/garner/2019/163/p4941630.19o.Z
+Day directories can be listed. The Korean and Mongolian download forms are
+imitated too. Every station gets the same RINEX content (recompressed as the
+archive would), and the servers can be made slow, flaky or incomplete.
+
+Use urls() for the archives section of a tid configuration.
+
+Usage: python benchmarks/mock_archive.py rinex_file --stations slac,p494 [--latency 0.2]
+"""
+import argparse
+from datetime import datetime
+import gzip
+import io
+import json
+import random
+import re
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import zipfile
+import zlib
+
+import hatanaka
+import ncompress
+
+# where each archive keeps a day's files: station directories (NOAA), a
+# subdirectory by file type (CDDIS and its mirrors), or all in one
+LAYOUTS = {
+    "noaa": "{year}/{doy}/{station}/",
+    "noaa_alt": "{year}/{doy}/{station}/",
+    "cddis": "{year}/{doy}/{yy}{kind}/",
+    "cddis_ftp": "{year}/{doy}/{yy}{kind}/",
+    "whu": "{year}/{doy}/{yy}{kind}/",
+    "garner": "{year}/{doy}/",
+    "unavco": "{year}/{doy}/",
+    "japan": "{year}/{doy}/",
+}
+FTP_ARCHIVES = ("cddis_ftp", "whu", "garner", "unavco")
+FORM_ARCHIVES = ("korea", "mongolia")
+
+_FILENAME = re.compile(
+    r"(?P<station>[a-z0-9]{4})(?P<doy>\d{3})(?P<code>[0a-x])\."
+    r"(?P<yy>\d{2})(?P<kind>[do])\.(?P<compression>gz|Z)"
+)
+_DAY = re.compile(r"(?P<year>\d{4})/(?P<doy>\d{3})/(?:(?P<sub>[^/]+)/)?")
+
+
+class Behaviour(NamedTuple):
+    """
+    How badly the servers behave
+    """
+
+    latency: float = 0.0  # seconds before each response starts
+    bandwidth: Optional[float] = None  # bytes per second per connection
+    error_rate: float = 0.0  # fraction of requests that fail outright
+    missing_rate: float = 0.0  # fraction of station-days that don't exist
+    hourly: bool = True  # whether archives with hourly files (Japan) have them
+
+
+class MockArchive:
+    """
+    The files the stand-in archives have, and the servers that serve them
+    """
+
+    def __init__(
+        self,
+        rinex: bytes,
+        stations: Iterable[str],
+        behaviour: Behaviour = Behaviour(),
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            rinex: the RINEX 2 observation file every station-day gets
+            stations: the stations the archives have
+            behaviour: how badly to behave
+            seed: for the random errors
+        """
+        self.rinex = rinex
+        self.stations = sorted(stations)
+        self.behaviour = behaviour
+        self._rand = random.Random(seed)
+        self._rand_lock = threading.Lock()
+        # Korean download keys, to the stations and day they're for
+        self._korean_jobs: Dict[int, Tuple[List[str], datetime]] = {}
+        self._content: Dict[Tuple[str, str], bytes] = {}
+        self._content_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._servers: List[socketserver.BaseServer] = []
+        self.http_port = 0
+        self.ftp_port = 0
+
+    def has(self, station: str, day: datetime) -> bool:
+        """
+        Whether a station-day exists (the same answer every time)
+        """
+        if station not in self.stations:
+            return False
+        key = f"{station}{day:%Y%j}".encode()
+        return zlib.crc32(key) / 2**32 >= self.behaviour.missing_rate
+
+    def should_fail(self) -> bool:
+        """
+        Decide whether to fail a request, and count it
+        """
+        with self._rand_lock:
+            self.requests += 1
+            return self._rand.random() < self.behaviour.error_rate
+
+    def content(self, kind: str, compression: str) -> bytes:
+        """
+        The file for any station-day, compressed as the archive would have it
+
+        Args:
+            kind: "o" for RINEX, "d" for Hatanaka compressed RINEX
+            compression: "gz" or "Z"
+        """
+        key = (kind, compression)
+        # compressed once, not by every request that comes in meanwhile
+        with self._content_lock:
+            if key in self._content:
+                return self._content[key]
+            if kind == "d":
+                data = hatanaka.compress(self.rinex, compression=compression)
+            elif compression == "gz":
+                data = gzip.compress(self.rinex)
+            else:
+                data = ncompress.compress(self.rinex)
+            self._content[key] = data
+            return data
+
+    def _day_files(self, archive: str, day: datetime, sub: Optional[str]) -> List[str]:
+        """
+        What an archive's day directory (or one of its subdirectories) holds
+        """
+        yy = day.strftime("%y")
+        doy = day.strftime("%j")
+        stations = [station for station in self.stations if self.has(station, day)]
+        if archive.startswith("noaa"):
+            if sub is None:
+                return [station + "/" for station in stations]
+            if sub not in stations:
+                return []
+            return [f"{sub}{doy}0.{yy}d.gz"]
+        if archive in ("cddis", "cddis_ftp", "whu"):
+            if sub is None:
+                return [f"{yy}d/", f"{yy}o/"]
+            if sub not in (f"{yy}d", f"{yy}o"):
+                return []
+            kind = sub[-1]
+            # CDDIS switched from .Z to .gz at the start of 2021
+            compression = "gz" if day.year >= 2021 and kind == "d" else "Z"
+            return [f"{station}{doy}0.{yy}{kind}.{compression}" for station in stations]
+        if sub is not None:
+            return []
+        if archive == "japan":
+            codes = "0" + ("abcdefghijklmnopqrstuvwx" if self.behaviour.hourly else "")
+            return [
+                f"{station}{doy}{code}.{yy}o.gz"
+                for station in stations
+                for code in codes
+            ]
+        return [f"{station}{doy}0.{yy}o.Z" for station in stations]
+
+    def lookup(self, path: str) -> Tuple[Optional[bytes], Optional[List[str]]]:
+        """
+        Find a file or directory in the archives
+
+        Args:
+            path: the path after the host, eg "/noaa/2019/163/"
+
+        Returns:
+            the file content, or None, and the directory listing, or None
+        """
+        archive, _, rest = path.lstrip("/").partition("/")
+        if archive not in LAYOUTS:
+            return None, None
+
+        day_match = _DAY.match(rest)
+        if day_match is None:
+            return None, None
+        day = datetime.strptime(day_match["year"] + day_match["doy"], "%Y%j")
+        directory, _, filename = rest.rpartition("/")
+        if not filename:
+            if len(directory.split("/")) > 3:
+                return None, None
+            return None, self._day_files(archive, day, day_match["sub"])
+
+        match = _FILENAME.fullmatch(filename)
+        if match is None or not self.has(match["station"], day):
+            return None, None
+        expected = LAYOUTS[archive].format(
+            year=day.year,
+            doy=day.strftime("%j"),
+            station=match["station"],
+            yy=match["yy"],
+            kind=match["kind"],
+        )
+        listing = self._day_files(archive, day, day_match["sub"])
+        if directory + "/" != expected or filename not in listing:
+            return None, None
+        return self.content(match["kind"], match["compression"]), None
+
+    def korean_job(self, form: Dict[str, List[str]]) -> Optional[int]:
+        """
+        Start a Korean download job, as createToZip.json does
+
+        Returns:
+            the key to fetch the zip with, or None if the form was bad
+        """
+        try:
+            stations = form["corsId"][0].lower().split(",")
+            day = datetime.strptime(form["obsStDay"][0], "%Y%m%d")
+        except (KeyError, ValueError):
+            return None
+        with self._rand_lock:
+            key = len(self._korean_jobs) + 1
+            self._korean_jobs[key] = (stations, day)
+        return key
+
+    def korean_zip(self, key: int) -> Optional[bytes]:
+        """
+        The zip of per-station zips for a Korean download job
+        """
+        if key not in self._korean_jobs:
+            return None
+        stations, day = self._korean_jobs[key]
+        outer = io.BytesIO()
+        with zipfile.ZipFile(outer, "w") as outer_zip:
+            for station in stations:
+                if not self.has(station, day):
+                    continue
+                inner = io.BytesIO()
+                with zipfile.ZipFile(inner, "w", zipfile.ZIP_DEFLATED) as inner_zip:
+                    inner_zip.writestr(
+                        day.strftime(f"{station.upper()}%j0.%yo"), self.rinex
+                    )
+                outer_zip.writestr(f"{station.upper()}.zip", inner.getvalue())
+        return outer.getvalue()
+
+    def urls(self, host: str = "127.0.0.1") -> Dict[str, str]:
+        """
+        The archive base URLs, for the archives section of a tid configuration
+        """
+        return {
+            archive: (
+                f"ftp://{host}:{self.ftp_port}/{archive}/"
+                if archive in FTP_ARCHIVES
+                else f"http://{host}:{self.http_port}/{archive}/"
+            )
+            for archive in list(LAYOUTS) + list(FORM_ARCHIVES)
+        }
+
+    def start(self, host: str = "127.0.0.1") -> "MockArchive":
+        """
+        Start serving, on threads, on free ports
+        """
+        http_server = ThreadingHTTPServer((host, 0), _http_handler(self))
+        ftp_server = _FTPServer((host, 0), _FTPHandler)
+        ftp_server.archive = self
+        self.http_port = http_server.server_address[1]
+        self.ftp_port = ftp_server.server_address[1]
+        for server in (http_server, ftp_server):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving
+        """
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self) -> "MockArchive":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def send(self, write, data: bytes) -> None:
+        """
+        Send data, no faster than the bandwidth limit
+        """
+        chunk_size = 1 << 14
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start : start + chunk_size]
+            write(chunk)
+            if self.behaviour.bandwidth:
+                time.sleep(len(chunk) / self.behaviour.bandwidth)
+        with self._rand_lock:
+            self.bytes_sent += len(data)
+
+
+def _html_index(path: str, entries: List[str]) -> str:
+    rows = "\n".join(
+        f'<a href="{entry}">{entry}</a>    12-Jun-2019 02:14    -' for entry in entries
+    )
+    return (
+        f"<html><head><title>Index of {path}</title></head><body>\n"
+        f'<h1>Index of {path}</h1>\n<pre><a href="../">Parent Directory</a>\n'
+        f"{rows}\n</pre></body></html>\n"
+    )
+
+
+def _http_handler(archive: MockArchive) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Serves the HTTP archives and the Korean and Mongolian forms
+        """
+
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+            pass
+
+        def _reply(
+            self,
+            status: int,
+            body: bytes = b"",
+            content_type: str = "application/octet-stream",
+            headers: Optional[Dict[str, str]] = None,
+        ) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            archive.send(self.wfile.write, body)
+
+        def _start(self) -> bool:
+            time.sleep(archive.behaviour.latency)
+            if archive.should_fail():
+                self._reply(503, b"try again later", "text/plain")
+                return False
+            return True
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            if not self._start():
+                return
+            url = urlparse(self.path)
+            if url.path == "/mongolia/monstatic":
+                token = "x" * 64
+                page = f'<input name="csrfmiddlewaretoken" value="{token}">'
+                self._reply(
+                    200,
+                    page.encode(),
+                    "text/html",
+                    {"Set-Cookie": f"csrftoken={token}; Path=/"},
+                )
+                return
+            if url.path == "/korea/getZip.do":
+                key = parse_qs(url.query).get("key", ["0"])[0]
+                content = archive.korean_zip(int(key)) if key.isdigit() else None
+                if content is None:
+                    self._reply(404)
+                else:
+                    self._reply(200, content, "application/zip")
+                return
+
+            content, listing = archive.lookup(url.path)
+            if listing is not None:
+                page = _html_index(url.path, listing)
+                self._reply(200, page.encode(), "text/html")
+            elif content is not None:
+                self._reply(200, content)
+            else:
+                self._reply(404, b"not found", "text/plain")
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode())
+            if not self._start():
+                return
+            url = urlparse(self.path)
+            if url.path == "/korea/createToZip.json":
+                key = archive.korean_job(form)
+                body = {"result": key is not None, "key": key}
+                self._reply(200, json.dumps(body).encode(), "application/json")
+                return
+            if url.path.startswith("/mongolia/download/"):
+                station = url.path.rsplit("/", 1)[-1]
+                try:
+                    day = datetime.strptime(form["datepicker"][0], "%Y-%m-%d")
+                except (KeyError, ValueError):
+                    day = None
+                if day is None or not archive.has(station, day):
+                    # no 404s here
+                    self._reply(200, b"<!DOCTYPE html><html></html>", "text/html")
+                else:
+                    self._reply(200, archive.content("o", "gz"))
+                return
+            self._reply(404)
+
+    return Handler
+
+
+class _FTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    archive: MockArchive
+
+
+class _FTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough FTP for ftplib: anonymous login, passive mode, RETR and LIST
+    """
+
+    server: _FTPServer
+
+    def _send(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def _data(self, passive: Optional[socket.socket], data: bytes) -> None:
+        if passive is None:
+            self._send("425 Use PASV first")
+            return
+        self._send("150 Opening BINARY mode data connection")
+        conn, _ = passive.accept()
+        with conn:
+            self.server.archive.send(conn.sendall, data)
+        self._send("226 Transfer complete")
+
+    def handle(self) -> None:
+        archive = self.server.archive
+        passive: Optional[socket.socket] = None
+        self._send("220 mock archive ready")
+        try:
+            for raw in self.rfile:
+                command, _, arg = raw.decode().strip().partition(" ")
+                command = command.upper()
+                if command == "USER":
+                    self._send("331 Password required")
+                elif command == "PASS":
+                    self._send("230 Logged in")
+                elif command in ("TYPE", "MODE", "STRU"):
+                    self._send("200 OK")
+                elif command == "SYST":
+                    self._send("215 UNIX Type: L8")
+                elif command == "PWD":
+                    self._send('257 "/"')
+                elif command == "CWD":
+                    self._send("250 OK")
+                elif command == "NOOP":
+                    self._send("200 OK")
+                elif command == "PASV":
+                    if passive is not None:
+                        passive.close()
+                    passive = socket.create_server((self.server.server_address[0], 0))
+                    host, port = passive.getsockname()[:2]
+                    numbers = host.replace(".", ",") + f",{port >> 8},{port & 0xFF}"
+                    self._send(f"227 Entering Passive Mode ({numbers})")
+                elif command in ("RETR", "LIST", "NLST"):
+                    time.sleep(archive.behaviour.latency)
+                    if archive.should_fail():
+                        self._send("421 Service not available, try again later")
+                        continue
+                    content, listing = archive.lookup(arg or "/")
+                    if command == "RETR" and content is not None:
+                        self._data(passive, content)
+                    elif command != "RETR" and listing is not None:
+                        self._data(passive, _ftp_listing(listing, command == "NLST"))
+                    else:
+                        self._send("550 No such file or directory")
+                    if passive is not None:
+                        passive.close()
+                        passive = None
+                elif command == "QUIT":
+                    self._send("221 Goodbye")
+                    return
+                else:
+                    self._send("502 Command not implemented")
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if passive is not None:
+                passive.close()
+
+
+def _ftp_listing(entries: List[str], names_only: bool) -> bytes:
+    lines = []
+    for entry in entries:
+        if names_only:
+            lines.append(entry.rstrip("/"))
+        elif entry.endswith("/"):
+            lines.append(
+                f"drwxr-xr-x   2 ftp ftp     4096 Jun 13 02:14 {entry.rstrip('/')}"
+            )
+        else:
+            lines.append(f"-rw-r--r--   1 ftp ftp   812345 Jun 13 02:14 {entry}")
+    return "".join(line + "\r\n" for line in lines).encode()
+
+
+def main(args: argparse.Namespace) -> None:
+    with open(args.rinex, "rb") as fin:
+        rinex = fin.read()
+    behaviour = Behaviour(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        missing_rate=args.missing_rate,
+    )
+    archive = MockArchive(rinex, args.stations.split(","), behaviour)
+    archive.start(args.host)
+    print("archives:")
+    for name, url in archive.urls(args.host).items():
+        print(f"  {name}: {url}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        archive.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("rinex", help="RINEX 2 observation file to serve")
+    parser.add_argument("--stations", required=True, help="comma separated")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes/s")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    main(parser.parse_args())
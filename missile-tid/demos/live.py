@@ -11,23 +11,9 @@ from laika.gps_time import GPSTime
 from tid import plot, util, scenario
 from tid.config import Configuration
 
-
-if len(sys.argv) < 2:
-    print(f"Usage: {sys.argv[0]} output_folder [hours to run]")
-    sys.exit(0)
-output_folder = sys.argv[1]
-if len(sys.argv) == 2:
-    count = float("inf")
-else:
-    count = int(sys.argv[2])
-
-
 # load configuration data
 conf = Configuration()
 
-# create our helpful astro dog
-dog = AstroDog(cache_dir=conf.cache_dir)
-
 
 # spread throughout Japan
 # fmt: off
@@ -89,43 +75,71 @@ def next_update(time: datetime.datetime):
         )
 
 
-next_time = next_update(datetime.datetime.utcnow())
+def main(output_folder: str, count: float) -> None:
+    # create our helpful astro dog
+    dog = AstroDog(cache_dir=conf.cache_dir)
 
-tick = 0
-while tick < count:
-    # just run this to get sat info earlier, because it's slow -_-
-    dog.get_all_sat_info(GPSTime.from_datetime(next_time))
+    next_time = next_update(datetime.datetime.utcnow())
 
-    conf.logger.info(
-        f"Waiting until next window ({next_time - datetime.datetime.utcnow()})"
+    # keep the last few hours, so TIDs crossing the hour aren't cut off
+    window = datetime.timedelta(
+        hours=conf.live.get("window_hours", scenario.WINDOW_HOURS)
     )
-    while datetime.datetime.utcnow() < next_time:
-        time.sleep(10)
+    sc = None
 
-    date = datetime.datetime(
-        next_time.year, next_time.month, next_time.day, next_time.hour
-    )
-    conf.logger.info("Starting scenario (downloading files, etc)")
-    sc = scenario.Scenario.from_daterange(
-        date - util.HOURS, util.HOURS, jp_stations, dog, use_cache=False
-    )
+    tick = 0
+    while tick < count:
+        # just run this to get sat info earlier, because it's slow -_-
+        dog.get_all_sat_info(GPSTime.from_datetime(next_time))
 
-    conf.logger.info("Downloading complete, creating connections")
-    sc.make_connections()
+        conf.logger.info(
+            f"Waiting until next window ({next_time - datetime.datetime.utcnow()})"
+        )
+        while datetime.datetime.utcnow() < next_time:
+            time.sleep(10)
 
-    conf.logger.info("Connections created, resolving biases")
-    sc.solve_biases()
+        date = datetime.datetime(
+            next_time.year, next_time.month, next_time.day, next_time.hour
+        )
+        if sc is None:
+            conf.logger.info("Starting scenario (downloading files, etc)")
+            sc = scenario.RollingScenario.from_window(date, window, jp_stations, dog)
+
+            conf.logger.info("Downloading complete, creating connections")
+            sc.make_connections()
+        else:
+            # only the new hour is downloaded, and only its connections are made
+            while sc.start_date + sc.duration < date:
+                conf.logger.info("Adding the next hour (downloading files, etc)")
+                sc.advance()
+
+        conf.logger.info("Connections created, resolving biases")
+        sc.solve_biases()
+
+        conf.logger.info("Preparing animation")
+        extent = (123, 149, 33, 48)
+
+        # just the latest hour
+        end_tick = int(sc.duration.total_seconds() / util.DATA_RATE)
+        ani = plot.plot_map(
+            sc,
+            extent=extent,
+            frames=range(end_tick - 119, end_tick - 1),
+            raw=False,
+            display=False,
+        )
+        ani.save(
+            f"{output_folder}/{date.strftime('%Y-%m-%d_%H')}_wide_short_borders_350km.mp4",
+            dpi=350,
+        )
 
-    conf.logger.info("Preparing animation")
-    extent = (123, 149, 33, 48)
+        next_time = next_update(datetime.datetime.utcnow())
+        tick += 1
 
-    ani = plot.plot_map(
-        sc, extent=extent, frames=range(1, 119), raw=False, display=False
-    )
-    ani.save(
-        f"{output_folder}/{date.strftime('%Y-%m-%d_%H')}_wide_short_borders_350km.mp4",
-        dpi=350,
-    )
 
-    next_time = next_update(datetime.datetime.utcnow())
-    tick += 1
+# the scenario starts worker processes, which import this file again
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} output_folder [hours to run]")
+        sys.exit(0)
+    main(sys.argv[1], float("inf") if len(sys.argv) == 2 else int(sys.argv[2]))
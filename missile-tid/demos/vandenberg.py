@@ -8,7 +8,7 @@ from typing import Optional
 
 from laika import AstroDog
 
-from tid import plot, util, scenario
+from tid import plot, scheduler, util, scenario
 from tid.config import Configuration
 
 logger = logging.getLogger(__name__)
@@ -40,7 +40,12 @@ def main(output_path: Optional[Path] = None):
     # fmt: on
 
     logger.info("Starting scenario (downloading files, etc)")
-    sc = scenario.Scenario.from_daterange(date, 1 * util.DAYS, ca_stations, dog)
+    progress = None
+    if output_path:
+        progress = scheduler.progress_file(str(output_path / scheduler.PROGRESS_FILE))
+    sc = scenario.Scenario.from_daterange(
+        date, 1 * util.DAYS, ca_stations, dog, progress=progress
+    )
 
     logger.info("Downloading complete, creating connections")
     sc.make_connections()
@@ -19,21 +19,17 @@ Biases we want to solve:
 from __future__ import annotations  # defer type annotations due to circular stuff
 
 from abc import ABC, abstractmethod
-from collections import Counter
-from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Dict, Tuple
 
 import numpy
 from scipy import optimize, sparse
 
-from laika.lib import coordinates
-
 from tid.util import DATA_RATE
 
 
 # deal with circular type definitions for Scenario
 if TYPE_CHECKING:
     from tid.scenario import Scenario
-    from tid.connections import Connection
 
 LAT_RES = 2.5  # 2.5 degrees
 LON_RES = 5  # 5 degrees
@@ -83,8 +79,16 @@ def _sparse_lsq_solve(
     return optimize.lsq_linear(matrix_a, matrix_b).x
 
 
-EntryVector = Tuple[
-    float, Tuple[float, float, float], float, int, int, float, Optional[int]
+# measurements of the same place and time by a connection, averaged together
+ENTRY_TYPE = [
+    ("vtec_total", "f8"),
+    ("tec_loc", "3f8"),  # rounded lat, lon and tick
+    ("hits", "i8"),  # how many measurements were averaged
+    ("sat", "i8"),
+    ("station", "i8"),
+    ("slant_total", "f8"),
+    ("is_glonass", "?"),
+    ("glonass_chan", "i8"),
 ]
 
 
@@ -97,186 +101,114 @@ class SimpleBiasSolver(BiasSolver):
     def __init__(self, scenario: Scenario) -> None:
         # scenario object, from which we will extract some useful info
         self.scenario = scenario
+        self.table = scenario.connection_table()
 
-        self.stations = sorted(self.scenario.conn_map.keys())
-        self.sats = sorted(list(self._get_sats()))
+        self.stations = self.table.stations
+        self.sats = self.table.prns
 
         self.total_tec_values = 0
 
-    def _get_sats(self) -> Iterable[str]:
+    def _get_entries(self) -> numpy.ndarray:
         """
-        Return all the PRNs seen by all stations across all observations
+        Gather up the data from all the connections for the LSQ bias calculation
 
         Returns:
-            a set of all PRNs
-        """
-        sats = set()
-        for station_dict in self.scenario.conn_map.values():
-            sats |= set(station_dict.keys())
-        return sats
-
-    def _add_connection(
-        self, connection: Connection, entries: List[EntryVector]
-    ) -> None:
-        """
-        Add the data from the given connection to the matrices for the LSQ bias calculation
-
-        Args:
-            connection: the connection whose data we wish to add
+            numpy array of ENTRY_TYPE
         """
+        table = self.table
         # round time (ticks) to the desired amount
         tick_scale_factor = TIME_RES / DATA_RATE
         rounded_ticks = (
-            numpy.round(connection.ticks / tick_scale_factor, 0) * tick_scale_factor
+            numpy.round(table.ticks / tick_scale_factor, 0) * tick_scale_factor
         )
 
         # round lat and lon to the desired amount
         ll_scale_factor = numpy.array([LAT_RES, LON_RES])
-        scaled_lat_lons = (
-            coordinates.ecef2geodetic(connection.ipps)[..., 0:2] / ll_scale_factor
-        )
+        scaled_lat_lons = table.latlons / ll_scale_factor
         rounded_lat_lons = numpy.round(scaled_lat_lons, 0) * ll_scale_factor
 
         # we can average out data and prevent extra entries by stashing stuff for the same
-        # tec measurement together
-        holding_cell: Dict[Tuple[float, float, float], List[Tuple[float, float]]] = {}
-        for tick, (lat, lon), (vtec, slant) in zip(
-            rounded_ticks, rounded_lat_lons, connection.vtecs.T
-        ):
-            tec_loc = (lat, lon, tick)
-            if tec_loc not in holding_cell:
-                holding_cell[tec_loc] = []
-            holding_cell[tec_loc].append((vtec, slant))
-
-        sat_idx = self.sats.index(connection.prn)
-        station_idx = self.stations.index(connection.station)
-        # go back and coalesce stuff for each tic
-        for tec_loc, hits in holding_cell.items():
-            vtec_total = sum(hit[0] for hit in hits)
-            slant_total = sum(hit[1] for hit in hits)
-            entries.append(
-                (
-                    vtec_total,
-                    tec_loc,
-                    len(hits),
-                    sat_idx,
-                    station_idx,
-                    slant_total,
-                    connection.glonass_chan if connection.is_glonass else None,
-                )
-            )
+        # tec measurement by the same connection together
+        keys, groups = numpy.unique(
+            numpy.column_stack((table.con_ids, rounded_lat_lons, rounded_ticks)),
+            axis=0,
+            return_inverse=True,
+        )
+        groups = groups.reshape(-1)
+        vtecs, slants = table.vtecs
+        cons = keys[:, 0].astype(int)
+
+        entries = numpy.zeros(len(keys), dtype=ENTRY_TYPE)
+        entries["vtec_total"] = numpy.bincount(groups, vtecs, minlength=len(keys))
+        entries["tec_loc"] = keys[:, 1:]
+        entries["hits"] = numpy.bincount(groups, minlength=len(keys))
+        entries["sat"] = table.prn[cons]
+        entries["station"] = table.station[cons]
+        entries["slant_total"] = numpy.bincount(groups, slants, minlength=len(keys))
+        entries["is_glonass"] = table.is_glonass[cons]
+        entries["glonass_chan"] = table.glonass_chan[cons]
+        return entries
 
     def _coalesce_entries(
-        self, entries: Sequence[EntryVector]
+        self, entries: numpy.ndarray
     ) -> Tuple[numpy.ndarray, numpy.ndarray]:
         """
-        In _add_connection, we used python lists temporarily to store data.
-        Here we'll squish that all back into a temporary matrix
+        Turn the entries from _get_entries into the least squares problem
 
         Args:
-            entries: the list of entry data created at in _add_connection
+            entries: numpy array of ENTRY_TYPE
 
         Returns:
             numpy array of the target values to reach in least square optimization
             numpy array of the dictionary-of-keys entries for a sparse array implementation
                 which will be the design matrix for our least squares optimization
         """
-        # first find which tec_locs were used
-        counts = Counter(entry[1] for entry in entries)
-        tec_id_map = {}
-        idx = 0
-        for tec_loc, count in counts.items():
-            if count > 1:
-                tec_id_map[tec_loc] = idx
-                idx += 1
-        self.total_tec_values = len(tec_id_map)
+        # first find which tec_locs were used more than once
+        _, loc_ids, counts = numpy.unique(
+            entries["tec_loc"], axis=0, return_inverse=True, return_counts=True
+        )
+        loc_ids = loc_ids.reshape(-1)
+        shared = counts > 1
+        self.total_tec_values = int(numpy.sum(shared))
+        used = shared[loc_ids]
+        entries = entries[used]
+        tec_idxs = (numpy.cumsum(shared) - 1)[loc_ids[used]]
 
         # this matrix represents the unknowns for all our observations
         # the format is something like rows of
         # [true vTEC values][prn errors][station errors 0th order, station errors 1st order]
-        # for now represent it as a list of dictionaries-of-keys
-        # then later we can convert this to a sparse.csr_matrix
+        # each measurement has 4 entries in it, in dictionary-of-keys form to
+        # be converted to a sparse.csr_matrix
+        slant_totals = entries["slant_total"]
+        glonass = entries["is_glonass"]
+        station_cols = self.total_tec_values + len(self.sats) + entries["station"] * 3
         matrix_a_list = numpy.zeros(
-            65536,  # guess a default size, not too harmful to get it wrong
+            (len(entries), 4),
             dtype=[
                 ("row", numpy.int32),
                 ("col", numpy.int32),
                 ("value", numpy.float64),
             ],
         )
-        matrix_a_size = 0  # number of entries in the matrix
-        b_values = []
-
-        def _mat_insert(row: int, col: int, value: float) -> None:
-            """
-            Helper function to insert data into a memory efficient format for array conversion
-
-            Args:
-                row: the row of the data entry
-                col: the column of the data entry
-                value: the value of the data entry
-
-            Note:
-                modifies matrix_a_list and matrix_a_size from outer scope
-            """
-            nonlocal matrix_a_list, matrix_a_size
-            if matrix_a_size >= matrix_a_list.shape[0]:
-                # double the size
-                matrix_a_list = numpy.resize(matrix_a_list, matrix_a_size * 2)
-
-            matrix_a_list[matrix_a_size] = (row, col, value)
-            matrix_a_size += 1
-
-        measurements = 0
-        for entry in entries:
-            (
-                vtec_total,
-                tec_loc,
-                hit_cnt,
-                sat_idx,
-                station_idx,
-                slant_total,
-                glonass_chan,
-            ) = entry
-            tec_idx = tec_id_map.get(tec_loc)
-            if tec_idx is None:
-                continue
-            b_values.append(vtec_total - hit_cnt * TEC_GUESS)
-            _mat_insert(measurements, tec_idx, hit_cnt)
-            _mat_insert(
-                measurements,
-                self.total_tec_values + sat_idx,
-                -slant_total,
-            )
-            if glonass_chan is not None:
-                # correction for GLONASS: offset + linear component
-                _mat_insert(
-                    measurements,
-                    self.total_tec_values + len(self.sats) + station_idx * 3 + 1,
-                    slant_total,
-                )
-                _mat_insert(
-                    measurements,
-                    self.total_tec_values + len(self.sats) + station_idx * 3 + 2,
-                    slant_total * glonass_chan,
-                )
-            else:
-                # correction for GPS: single entry
-                _mat_insert(
-                    measurements,
-                    self.total_tec_values + len(self.sats) + station_idx * 3,
-                    slant_total,
-                )
-                # explicitly put in the 0 value to make sure the matrix size is correct
-                _mat_insert(
-                    measurements,
-                    self.total_tec_values + len(self.sats) + station_idx * 3 + 2,
-                    0,
-                )
-            measurements += 1
-
-        matrix_a_list = numpy.resize(matrix_a_list, matrix_a_size)
-        return numpy.array(b_values), matrix_a_list
+        matrix_a_list["row"] = numpy.arange(len(entries))[:, numpy.newaxis]
+        matrix_a_list["col"][:, 0] = tec_idxs
+        matrix_a_list["value"][:, 0] = entries["hits"]
+        matrix_a_list["col"][:, 1] = self.total_tec_values + entries["sat"]
+        matrix_a_list["value"][:, 1] = -slant_totals
+        # correction for GLONASS: offset + linear component,
+        # for GPS: a single entry, with the 0 explicitly there to make sure
+        # the matrix size is correct
+        matrix_a_list["col"][:, 2] = numpy.where(
+            glonass, station_cols + 1, station_cols
+        )
+        matrix_a_list["value"][:, 2] = slant_totals
+        matrix_a_list["col"][:, 3] = station_cols + 2
+        matrix_a_list["value"][:, 3] = numpy.where(
+            glonass, slant_totals * entries["glonass_chan"], 0
+        )
+
+        b_values = entries["vtec_total"] - entries["hits"] * TEC_GUESS
+        return b_values, matrix_a_list.reshape(-1)
 
     def solve_biases(
         self,
@@ -289,13 +221,7 @@ class SimpleBiasSolver(BiasSolver):
             dictionary mapping station names to their bias vectors (GPS, GLONASS_0, GLONASS_1)
         """
 
-        entries: List[EntryVector] = []
-        for prn_map in self.scenario.conn_map.values():
-            for conn_tick_map in prn_map.values():
-                for connection in conn_tick_map.connections:
-                    self._add_connection(connection, entries)
-
-        matrix_b, matrix_a_list = self._coalesce_entries(entries)
+        matrix_b, matrix_a_list = self._coalesce_entries(self._get_entries())
 
         res = _sparse_lsq_solve(matrix_a_list, matrix_b)
 
@@ -0,0 +1,412 @@
+"""
+On-disk caches for processed station data.
+
+Each decoded station-day is stored in the same form we use in memory: one flat
+binary file of observation records grouped by PRN, which can be memory mapped
+straight back in, plus a small JSON sidecar with the PRN offsets, the station
+position and GLONASS metadata.
+
+Station-days that could not be found anywhere are remembered too, so we don't
+keep going through every mirror for them.
+
+Several jobs may share the cache at once, so everything is written by atomic
+rename, and work on each entry is serialised by file locks so that only one
+process downloads or decodes it.
+"""
+import contextlib
+from datetime import datetime, timedelta
+import fcntl
+import json
+import os
+import threading
+from typing import Any, cast, Dict, Iterator, NamedTuple, Optional
+
+from atomicwrites import atomic_write
+import numpy
+
+from tid import types
+
+# bump this whenever the layout of the cached data changes
+CACHE_VERSION = 2
+
+SIDECAR_SUFFIX = ".dense.json"
+DATA_SUFFIX = ".dense"
+
+LOCKS_DIR = "locks"
+LOCK_SUFFIX = ".lock"
+
+UNAVAILABLE_FILE = "unavailable.jsonl"
+# how long to believe a station-day is unavailable, by the age of the data:
+# recent data may just not be posted yet, old data is not going to show up
+UNAVAILABLE_TTLS = (
+    (timedelta(days=1), timedelta(minutes=15)),
+    (timedelta(days=7), timedelta(hours=6)),
+    (timedelta(days=30), timedelta(days=1)),
+)
+UNAVAILABLE_TTL_OLD = timedelta(days=90)
+# failures that weren't a clean "not found" (timeouts, server errors...)
+UNAVAILABLE_TTL_TRANSIENT = timedelta(minutes=15)
+# how many superseded or expired records the file may build up before it is
+# rewritten with just the current ones
+UNAVAILABLE_COMPACT_AFTER = 1000
+
+
+class StationDay(NamedTuple):
+    """
+    A station-day of observations restored from the cache
+    """
+
+    # time that tick 0 of the cached data corresponds to
+    epoch: numpy.datetime64
+    # approximate receiver ECEF XYZ location in meters, if known
+    position: Optional[types.ECEF_XYZ]
+    # GLONASS PRN to frequency channel, where the RINEX file listed it
+    glonass_slots: Dict[str, int]
+    # the observations, ticks relative to epoch
+    data: types.DenseMeasurements
+
+
+def station_day_path(rinex_obs_file: str) -> str:
+    """
+    Where the processed form of a RINEX file is cached
+
+    Args:
+        rinex_obs_file: path to the raw RINEX file
+
+    Returns:
+        path of the sidecar, whose existence marks a complete cache entry
+    """
+    return rinex_obs_file + SIDECAR_SUFFIX
+
+
+@contextlib.contextmanager
+def single_flight(lock_path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock, across threads and processes, while working on a
+    cache entry. Whoever holds it should check whether the entry has appeared
+    in the meantime before doing the work themselves.
+
+    Args:
+        lock_path: the lock file, created if need be (and left in place, as
+            removing it would race with other processes opening it)
+    """
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "ab") as lock_file:
+        # flock locks belong to the open file, so threads exclude each other too
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_station_day(
+    path: str,
+    data: types.DenseMeasurements,
+    epoch: numpy.datetime64,
+    position: Optional[types.ECEF_XYZ],
+    glonass_slots: Optional[Dict[str, int]] = None,
+) -> None:
+    """
+    Save a decoded station-day to the cache
+
+    Args:
+        path: the sidecar path, from station_day_path
+        data: the observations, ticks relative to epoch
+        epoch: time that tick 0 corresponds to
+        position: approximate receiver location, if known
+        glonass_slots: GLONASS PRN to frequency channel, if known
+    """
+    prns = sorted(data)
+    offsets = numpy.cumsum([0] + [len(data[prn]) for prn in prns])
+    dtype = data[prns[0]].dtype if prns else None
+
+    data_path = path[: -len(SIDECAR_SUFFIX)] + DATA_SUFFIX
+    with atomic_write(data_path, mode="wb", overwrite=True) as fout:
+        for prn in prns:
+            fout.write(numpy.ascontiguousarray(data[prn]).tobytes())
+
+    sidecar = {
+        "version": CACHE_VERSION,
+        "dtype": repr(dtype.descr) if dtype is not None else None,
+        "epoch": str(epoch.astype("datetime64[s]")),
+        "position": None if position is None else [float(x) for x in position],
+        "glonass_slots": glonass_slots or {},
+        "prns": {
+            prn: [int(start), int(end)]
+            for prn, start, end in zip(prns, offsets[:-1], offsets[1:])
+        },
+    }
+    # written last, so a sidecar always points at complete data
+    with atomic_write(path, mode="w", overwrite=True, encoding="utf-8") as fout:
+        json.dump(sidecar, fout)
+
+
+def read_station_day(path: str, dtype: numpy.dtype) -> Optional[StationDay]:
+    """
+    Restore a station-day from the cache. The observations are copy-on-write
+    memory maps of the cached file, so they may be modified freely.
+
+    Args:
+        path: the sidecar path, from station_day_path
+        dtype: the record type we expect the data to have
+
+    Returns:
+        the cached station-day, or None if there is no usable cache entry
+    """
+    sidecar = _read_sidecar(path, dtype)
+    if sidecar is None:
+        return None
+
+    dtype = numpy.dtype(dtype)
+    data_path = path[: -len(SIDECAR_SUFFIX)] + DATA_SUFFIX
+    total = max((end for _, end in sidecar["prns"].values()), default=0)
+    if total == 0:
+        records = numpy.zeros(0, dtype=dtype)
+    else:
+        try:
+            records = numpy.memmap(data_path, dtype=dtype, mode="c", shape=(total,))
+        except (OSError, ValueError):
+            return None
+
+    position = sidecar["position"]
+    return StationDay(
+        epoch=numpy.datetime64(sidecar["epoch"]),
+        position=None if position is None else numpy.array(position),
+        glonass_slots=sidecar["glonass_slots"],
+        data=cast(
+            types.DenseMeasurements,
+            {prn: records[start:end] for prn, (start, end) in sidecar["prns"].items()},
+        ),
+    )
+
+
+def _read_sidecar(path: str, dtype: numpy.dtype) -> Optional[Dict[str, Any]]:
+    """
+    Read a station-day's sidecar, if it was written the way we would write it now
+
+    Args:
+        path: the sidecar path, from station_day_path
+        dtype: the record type we expect the data to have
+
+    Returns:
+        the sidecar's contents, or None if it is missing, unreadable, or
+        was written by another cache version or with another record type
+    """
+    try:
+        with open(path, encoding="utf-8") as fin:
+            sidecar = json.load(fin)
+    except (OSError, ValueError):
+        return None
+
+    if sidecar.get("version") != CACHE_VERSION:
+        return None
+    if sidecar["prns"] and sidecar["dtype"] != repr(numpy.dtype(dtype).descr):
+        return None
+    return sidecar
+
+
+def is_station_day(path: str, dtype: numpy.dtype) -> bool:
+    """
+    Whether a path refers to a usable cached station-day (rather than a raw
+    RINEX file, or an entry left by another cache version that needs
+    decoding again)
+
+    Args:
+        path: the path to check
+        dtype: the record type we expect the data to have
+
+    Returns:
+        True iff the path is a current station-day sidecar
+    """
+    return path.endswith(SIDECAR_SUFFIX) and _read_sidecar(path, dtype) is not None
+
+
+def unavailable_ttl(age: timedelta, missing: bool = True) -> timedelta:
+    """
+    How long a failure to fetch some data should be remembered
+
+    Args:
+        age: how old the data was when we failed to fetch it
+        missing: whether the data was reported missing, rather than the
+            fetch failing some other way
+
+    Returns:
+        the time to wait before trying again
+    """
+    for max_age, ttl in UNAVAILABLE_TTLS:
+        if age < max_age:
+            break
+    else:
+        ttl = UNAVAILABLE_TTL_OLD
+    if not missing:
+        ttl = min(ttl, UNAVAILABLE_TTL_TRANSIENT)
+    return ttl
+
+
+def _unavailable_expired(
+    entry: Dict[str, Any], data_time: datetime, now: datetime
+) -> bool:
+    """
+    Whether it's time to try fetching some unavailable data again
+
+    Args:
+        entry: the record of the failure
+        data_time: the time the data is for
+        now: the current time (UTC)
+
+    Returns:
+        True iff the record no longer applies
+    """
+    failed_at = datetime.fromisoformat(entry["failed_at"])
+    ttl = unavailable_ttl(failed_at - data_time, entry.get("missing", True))
+    return now - failed_at >= ttl
+
+
+class NegativeCache:
+    """
+    Persistent record of data we failed to fetch, so we can skip asking again.
+    Stored as a JSON lines file (the last entry for a key wins), which is safe
+    to share between threads and processes. Records are appended, and once
+    enough of them are out of date the file is rewritten without those.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: the file in which to keep the records
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # which file (it is replaced when compacted) and how much of it we've read
+        self._inode: Optional[int] = None
+        self._loaded_size = 0
+        self._loaded_lines = 0
+
+    def _refresh(self, now: datetime) -> Dict[str, Dict[str, Any]]:
+        """
+        Pick up anything appended since we last looked (maybe by other
+        processes), leaving out records that have expired
+
+        Args:
+            now: the current time (UTC)
+
+        Returns:
+            the current entries, by key
+        """
+        try:
+            with open(self.path, "rb") as fin:
+                inode = os.fstat(fin.fileno()).st_ino
+                if inode != self._inode:
+                    # new, or compacted by someone, so read it from the start
+                    self._entries = {}
+                    self._inode = inode
+                    self._loaded_size = self._loaded_lines = 0
+                fin.seek(self._loaded_size)
+                for line in fin:
+                    # a partial line is still being written, get it next time
+                    if not line.endswith(b"\n"):
+                        break
+                    self._loaded_size += len(line)
+                    self._loaded_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        data_time = datetime.fromisoformat(entry["data_time"])
+                        if _unavailable_expired(entry, data_time, now):
+                            self._entries.pop(entry["key"], None)
+                        else:
+                            self._entries[entry["key"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            pass
+        return self._entries
+
+    def _compact(self, now: datetime) -> None:
+        """
+        Rewrite the file with only the records that still apply.
+        Must be called with self._lock and the file lock held.
+
+        Args:
+            now: the current time (UTC)
+        """
+        self._inode = None
+        entries = list(self._refresh(now).values())
+        with atomic_write(
+            self.path, mode="w", overwrite=True, encoding="utf-8"
+        ) as fout:
+            for entry in entries:
+                fout.write(json.dumps(entry) + "\n")
+        # the new file is exactly what we already have
+        stat = os.stat(self.path)
+        self._inode = stat.st_ino
+        self._loaded_size = stat.st_size
+        self._loaded_lines = len(entries)
+
+    def check(
+        self, key: str, data_time: datetime, now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Whether some data is known to be unavailable
+
+        Args:
+            key: identifies the data, eg network/station/day
+            data_time: the time the data is for
+            now: the current time (UTC), defaults to the actual current time
+
+        Returns:
+            the record of the failure if we shouldn't try again yet, otherwise None
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            entry = self._refresh(now).get(key)
+        if entry is None or _unavailable_expired(entry, data_time, now):
+            return None
+        return entry
+
+    def record(
+        self,
+        key: str,
+        data_time: datetime,
+        error: str,
+        missing: bool = True,
+        now: Optional[datetime] = None,
+    ) -> None:
+        """
+        Remember that we failed to fetch some data
+
+        Args:
+            key: identifies the data, eg network/station/day
+            data_time: the time the data is for
+            error: what went wrong
+            missing: whether the data was reported missing, rather than the
+                fetch failing some other way
+            now: the current time (UTC), defaults to the actual current time
+        """
+        now = now or datetime.utcnow()
+        entry = {
+            "key": key,
+            "data_time": data_time.isoformat(),
+            "failed_at": now.isoformat(),
+            "error": error,
+            "missing": missing,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock, single_flight(self.path + LOCK_SUFFIX):
+            # the lock keeps compaction from losing records appended meanwhile,
+            # and small appends are atomic, so readers never see half of this
+            with open(self.path, "a", encoding="utf-8") as fout:
+                fout.write(line)
+            entries = self._refresh(now)
+            # forget what has expired since it was read
+            for stale in [
+                key
+                for key, entry in entries.items()
+                if _unavailable_expired(
+                    entry, datetime.fromisoformat(entry["data_time"]), now
+                )
+            ]:
+                del entries[stale]
+            if self._loaded_lines > len(entries) + UNAVAILABLE_COMPACT_AFTER:
+                self._compact(now)
@@ -11,8 +11,10 @@ import yaml
 from ._errors import TidRuntimeError
 
 # TODO switch to appdirs https://github.com/ActiveState/appdirs
-default_config = os.path.join(
-    os.path.dirname(__file__), "..", "config", "configuration.yml"
+# (or wherever TID_CONFIG says, eg to point a benchmark at a stand-in server)
+default_config = os.environ.get(
+    "TID_CONFIG",
+    os.path.join(os.path.dirname(__file__), "..", "config", "configuration.yml"),
 )
 
 _GLOBAL_CONFIG = None
@@ -40,6 +42,10 @@ class Configuration:
             )
             self.logger = logging.getLogger("tid")
 
+            self.downloads = self.conf.get("downloads", {})
+            self.archives = self.conf.get("archives", {})
+            self.live = self.conf.get("live", {})
+
             self.credentials = self.conf.get("credentials", {})
 
         if self.credentials:
@@ -4,6 +4,7 @@ between satellites and ground stations.
 Things to manage those are stored here
 """
 from __future__ import annotations  # defer type annotations due to circular stuff
+import bisect
 import collections.abc as collections
 from functools import cached_property
 from typing import (
@@ -13,9 +14,8 @@ from typing import (
     Callable,
     Iterable,
     Iterator,
+    List,
     Optional,
-    Sequence,
-    Set,
     Tuple,
     Union,
 )
@@ -23,8 +23,6 @@ from typing import (
 import numpy
 from scipy import optimize
 
-from laika.lib import coordinates
-
 from tid import tec, types, util
 
 # deal with circular type definitions for Scenario
@@ -75,9 +73,6 @@ class Connection:
         self.tick_start = scenario.station_data[station][prn][idx_start]["tick"]
         self.tick_end = scenario.station_data[station][prn][idx_end]["tick"]
 
-        self.missing_ticks: Set[int] = set()
-        self._init_missing_ticks()
-
         # integer ambiguities, the phase correction information
         # that is the goal of this whole connections stuff
         self.n_chan1 = None
@@ -87,16 +82,6 @@ class Connection:
         self.offset = None  # this value has units of Meters
         self.offset_error = None
 
-    def _init_missing_ticks(self) -> None:
-        """
-        Fill out missing ticks table, used when trying to query some data
-        from connections
-        """
-        gap_idxs = numpy.where(numpy.diff(self.observations["tick"]) > 1)[0]
-        for gap_idx in gap_idxs:
-            first, last = self.observations["tick"][gap_idx : gap_idx + 2]
-            self.missing_ticks |= set(range(first + 1, last))
-
     def tick_idx(self, tick) -> Optional[int]:
         """
         Because we might miss ticks in our observations, this has a helpful mapping
@@ -108,13 +93,36 @@ class Connection:
         Returns:
             idx where that tick is found, or None if it doesn't exist
         """
-        if tick in self.missing_ticks:
-            return None
-        guess = tick - self.tick_start
-        for missing in self.missing_ticks:
-            if tick > missing:
-                guess -= 1
-        return guess
+        idx = int(self.tick_idxs(numpy.array([tick]))[0])
+        return None if idx < 0 else idx
+
+    def tick_idxs(self, ticks: numpy.ndarray) -> numpy.ndarray:
+        """
+        tick_idx for a whole array of ticks at once
+
+        Args:
+            ticks: numpy array of the tick numbers to look up
+
+        Returns:
+            numpy array of the idx where each tick is found, -1 where it doesn't exist
+        """
+        # the observations' ticks are sorted, so the lookup is a binary search
+        con_ticks = self.observations["tick"]
+        idxs = numpy.minimum(numpy.searchsorted(con_ticks, ticks), len(con_ticks) - 1)
+        return numpy.where(con_ticks[idxs] == ticks, idxs, -1)
+
+    def shift(self, idx_count: int, tick_count: int) -> None:
+        """
+        Renumber this connection after data before it has been dropped
+
+        Args:
+            idx_count: how many observations were dropped before it
+            tick_count: how many ticks the scenario's start moved forward by
+        """
+        self.idx_start -= idx_count
+        self.idx_end -= idx_count
+        self.tick_start -= tick_count
+        self.tick_end -= tick_count
 
     @property
     def is_glonass(self) -> bool:
@@ -172,6 +180,24 @@ class Connection:
             ],
         )
 
+    @property
+    def geometry(self) -> numpy.ndarray:
+        """
+        Convenience function: the elevations, pierce points and slant factors
+        worked out by the scenario for the observations in this connection
+        """
+        return self.scenario.observation_geometry(self.station, self.prn)[
+            self.idx_start : self.idx_end + 1
+        ]
+
+    @property
+    def sat_pos(self) -> types.ECEF_XYZ_LIST:
+        """
+        Convenience function: where the satellite was for each observation
+        in this connection, looked up from the scenario's orbit table
+        """
+        return self.scenario.sat_positions(self.prn, self.observations)
+
     def elevation(
         self, sat_pos: Union[types.ECEF_XYZ, types.ECEF_XYZ_LIST]
     ) -> Union[types.ECEF_XYZ, types.ECEF_XYZ_LIST]:
@@ -256,23 +282,27 @@ class Connection:
         Returns:
             numpy array of XYZ ECEF coordinates in meters of the IPPs
         """
-        return tec.ion_locs(
-            self.scenario.station_locs[self.station],
-            cast(types.ECEF_XYZ_LIST, self.observations["sat_pos"]),
-        )
+        return self.geometry["ipp"]
 
     @property
     def vtecs(self) -> numpy.ndarray:
         """
-        The vtec values associated with this connection
+        The vtec values associated with this connection. These are cached by
+        the scenario until its biases change.
 
         Returns:
-            numpy array of (
+            read-only numpy array of (
                 vtec value in TECu,
                 unitless slant_to_vertical factor
             )
         """
-        return tec.calculate_vtecs(self)
+        cached = self.scenario.vtec_cache.get(self)
+        if cached is None or cached[0] != self.scenario.bias_version:
+            vtecs = tec.calculate_vtecs(self)
+            vtecs.flags.writeable = False
+            cached = (self.scenario.bias_version, vtecs)
+            self.scenario.vtec_cache[self] = cached
+        return cached[1]
 
     # @property
     def times(self) -> numpy.ndarray:
@@ -293,9 +323,7 @@ class Connection:
         Basically a simplified Klobuchar-type model
         """
         # convert into units of "semi-circles"
-        lats, lons = (
-            coordinates.ecef2geodetic(self.ipps, radians=True)[..., 0:2].T / numpy.pi
-        )
+        lats, lons = self.geometry["latlon"].T / 180
         dtimes = self.observations["tick"] * numpy.timedelta64(
             30, "s"
         ) + numpy.datetime64(self.scenario.start_date)
@@ -337,9 +365,7 @@ class Connection:
         Basically a simplified Klobuchar-type model
         """
         # convert into units of "semi-circles"
-        lats, lons = (
-            coordinates.ecef2geodetic(self.ipps, radians=True)[..., 0:2].T / numpy.pi
-        )
+        lats, lons = self.geometry["latlon"].T / 180
         dtimes = self.observations["tick"] * numpy.timedelta64(
             30, "s"
         ) + numpy.datetime64(self.scenario.start_date)
@@ -377,9 +403,7 @@ class Connection:
         it to a combination of time, latitude, and longitude dependence.
         Basically a simplified Klobuchar-type model
         """
-        lats, lons = (
-            coordinates.ecef2geodetic(self.ipps, radians=True)[..., 0:2].T / numpy.pi
-        )
+        lats, lons = self.geometry["latlon"].T / 180
         dtimes = self.observations["tick"] * numpy.timedelta64(
             30, "s"
         ) + numpy.datetime64(self.scenario.start_date)
@@ -395,24 +419,43 @@ class Connection:
         return numpy.cos(phase) * a
 
 
-class SparseList(collections.Sequence):
+class TickSeries(collections.Sequence):
     """
-    Helper to represent data from connections where we may be missing stuff
-    Don't store all those 0s!
+    Helper to represent data from connections, one value per tick, where we
+    may be missing stuff. Values are kept as float32, and whether there is a
+    value for each tick as a bitmask, so a whole day of them stays small.
+
+    Indexing with a single tick gives its value, or the default if there is
+    none. Slices and index arrays give another TickSeries.
     """
 
     def __init__(
         self,
-        index_ranges: Sequence[Tuple[int, int]],
-        data: Iterable[Union[Sequence, numpy.ndarray]],
-        tick_lookup: Iterable[Callable[[int], Optional[int]]],
+        values: numpy.ndarray,
+        valid: numpy.ndarray,
+        con_ids: Optional[numpy.ndarray] = None,
         default: Any = 0.0,
     ):
-        self.ranges = index_ranges
-        self.data = data
-        self.tick_lookup = tick_lookup
+        """
+        Args:
+            values: numpy array of the value(s) for each tick, 0 where there is none
+            valid: numpy array of booleans, whether there is a value for each tick
+            con_ids: optional numpy array of the index of the connection each
+                tick's value came from, -1 where there is none
+            default: what a tick with no value reads as
+        """
+        self.values = numpy.asarray(values, dtype=numpy.float32)
+        self._valid_bits = numpy.packbits(valid)
+        self._length = len(valid)
+        self.con_ids = con_ids
         self.default = default
-        self.max = 0 if len(index_ranges) == 0 else max(i[1] for i in index_ranges)
+
+    @property
+    def valid(self) -> numpy.ndarray:
+        """
+        numpy array of booleans, whether there is a value for each tick
+        """
+        return numpy.unpackbits(self._valid_bits, count=self._length).astype(bool)
 
     def __len__(self) -> int:
         """
@@ -422,37 +465,45 @@ class SparseList(collections.Sequence):
         Returns:
             the integer length
         """
-        return self.max + 1
+        return self._length
 
     def __iter__(self) -> Iterator[Any]:
-        for i in range(self.max + 1):
-            yield self[i]
+        for value, has_value in zip(self.values, self.valid):
+            yield value if has_value else self.default
 
     def __getitem__(self, tick: Any) -> Any:
         """
         Fetch the given tick data
 
         Args:
-            tick: the tick number to fetch
+            tick: the tick number to fetch, or a slice or array of them
 
         Returns:
-            the data associated with that tick, or the default value if it was not found
-        """
-        if isinstance(tick, slice):
-            return [self[i] for i in range(*tick.indices(len(self)))]
-
-        if not isinstance(tick, int):
-            raise IndexError
+            the data associated with that tick, or the default value if it was
+            not found (or a TickSeries of the selected ticks)
+        """
+        if isinstance(tick, (int, numpy.integer)):
+            if not 0 <= tick < self._length:
+                return self.default
+            if not self._valid_bits[tick >> 3] & (0x80 >> (tick & 7)):
+                return self.default
+            return self.values[tick]
+
+        return TickSeries(
+            self.values[tick],
+            self.valid[tick],
+            None if self.con_ids is None else self.con_ids[tick],
+            self.default,
+        )
 
-        for data_range, datum, tick_lookup in zip(
-            self.ranges, self.data, self.tick_lookup
-        ):
-            if data_range[0] <= tick <= data_range[1]:
-                idx = tick_lookup(tick)
-                if idx is None:
-                    return self.default
-                return datum[idx]
-        return self.default
+    def __array__(self, dtype=None, copy=None) -> numpy.ndarray:
+        """
+        The values as a plain numpy array (eg for plotting), with the default
+        where there are none, or NaN if the default is None
+        """
+        fill = numpy.nan if self.default is None else self.default
+        valid = self.valid.reshape((-1,) + (1,) * (self.values.ndim - 1))
+        return numpy.where(valid, self.values, fill).astype(dtype or numpy.float32)
 
 
 class ConnTickMap:
@@ -462,7 +513,50 @@ class ConnTickMap:
     """
 
     def __init__(self, connections: Iterable[Connection]) -> None:
-        self.connections = connections
+        """
+        Args:
+            connections: the connections, in tick order (they never overlap)
+        """
+        self.connections = list(connections)
+        # the ticks each connection covers, to binary search through
+        self._tick_starts = [int(con.tick_start) for con in self.connections]
+        self.tick_starts = numpy.array(self._tick_starts, dtype=int)
+        self.tick_ends = numpy.array(
+            [con.tick_end for con in self.connections], dtype=int
+        )
+
+    def _find(self, tick: int) -> int:
+        """
+        Find the connection covering a tick
+
+        Args:
+            tick: the tick to look up
+
+        Returns:
+            the index of the connection in self.connections, or -1 if there is none
+        """
+        idx = bisect.bisect_right(self._tick_starts, tick) - 1
+        if idx < 0 or tick > self.tick_ends[idx]:
+            return -1
+        return idx
+
+    def lookup(self, ticks: numpy.ndarray) -> numpy.ndarray:
+        """
+        Find the connections covering a whole array of ticks at once
+
+        Args:
+            ticks: numpy array of the ticks to look up
+
+        Returns:
+            numpy array of the index in self.connections of the connection
+            covering each tick, -1 where there is none
+        """
+        ticks = numpy.asarray(ticks)
+        if not self.connections:
+            return numpy.full(ticks.shape, -1)
+        idxs = numpy.searchsorted(self.tick_starts, ticks, side="right") - 1
+        covered = (idxs >= 0) & (ticks <= self.tick_ends[numpy.maximum(idxs, 0)])
+        return numpy.where(covered, idxs, -1)
 
     def __getitem__(self, tick: int) -> Connection:
         """
@@ -473,10 +567,10 @@ class ConnTickMap:
 
         Raises KeyError if tick is not in any of the connections
         """
-        for con in self.connections:
-            if tick in con:
-                return con
-        raise KeyError
+        idx = self._find(tick)
+        if idx < 0:
+            raise KeyError
+        return self.connections[idx]
 
     def __contains__(self, tick: int) -> bool:
         """
@@ -488,95 +582,321 @@ class ConnTickMap:
         Returns:
             True iff we have data for the tick
         """
-        for con in self.connections:
-            if tick in con:
-                return True
-        return False
+        return self._find(tick) >= 0
 
-    def get_vtecs(self) -> Sequence[float]:
+    def _tick_series(
+        self,
+        con_data: Iterable[Tuple[int, numpy.ndarray, numpy.ndarray]],
+        shape: Tuple[int, ...] = (),
+        default: Any = 0.0,
+        tick_count: Optional[int] = None,
+    ) -> TickSeries:
         """
-        Get vtec data for this set of connections
+        Lay out data from some of the connections along the ticks
+
+        Args:
+            con_data: for each connection with data, its index in self.connections,
+                the ticks it has data for and the data for those ticks
+            shape: the shape of the data for each tick
+            default: what a tick with no data reads as
+            tick_count: how many ticks to cover, by default up to the last with data
 
         Returns:
-            SparseList of raw VTEC TECu values, one per tick, 0.0 if unknown
+            TickSeries of the data
+        """
+        con_data = list(con_data)
+        if tick_count is None:
+            tick_count = max(
+                (int(ticks[-1]) + 1 for _, ticks, _ in con_data), default=1
+            )
+        values = numpy.zeros((tick_count,) + shape, dtype=numpy.float32)
+        valid = numpy.zeros(tick_count, dtype=bool)
+        con_ids = numpy.full(tick_count, -1, dtype=numpy.int16)
+        for con_id, ticks, data in con_data:
+            kept = ticks < tick_count
+            values[ticks[kept]] = data[kept]
+            valid[ticks[kept]] = True
+            con_ids[ticks[kept]] = con_id
+        return TickSeries(values, valid, con_ids, default)
+
+    def get_vtecs(self, tick_count: Optional[int] = None) -> TickSeries:
         """
-        return SparseList(
-            [(con.tick_start, con.tick_end) for con in self.connections],
-            [con.vtecs[0] for con in self.connections],
-            [con.tick_idx for con in self.connections],
+        Get vtec data for this set of connections
+
+        Args:
+            tick_count: optional number of ticks to cover
+
+        Returns:
+            TickSeries of raw VTEC TECu values, one per tick, 0.0 if unknown
+        """
+        return self._tick_series(
+            (
+                (i, con.observations["tick"], con.vtecs[0])
+                for i, con in enumerate(self.connections)
+            ),
+            tick_count=tick_count,
         )
 
-    def get_filtered_vtecs(self) -> Sequence[float]:
+    def get_filtered_vtecs(self, tick_count: Optional[int] = None) -> TickSeries:
         """
         Get bandpass filtered vtec data for this set of connections
 
+        Args:
+            tick_count: optional number of ticks to cover
+
         Returns:
-            SparseList of 2nd order butterworth bandpass filtered VTEC TECu values,
+            TickSeries of 2nd order butterworth bandpass filtered VTEC TECu values,
             one per tick, 0.0 if unknown
         """
-        index_ranges = []
-        data = []
-        tick_lookup = []
-
-        for con in self.connections:
+        con_data = []
+        for i, con in enumerate(self.connections):
             if con.idx_end - con.idx_start < util.BUTTER_MIN_LENGTH:
                 # not enough data to filter
                 continue
-            index_ranges.append((con.tick_start, con.tick_end))
             filtered = util.bpfilter(con.vtecs[0])
             if filtered is None:
                 continue
-            data.append(filtered)
-            tick_lookup.append(con.tick_idx)
-        return SparseList(index_ranges, data, tick_lookup)
+            con_data.append((i, con.observations["tick"], filtered))
+        return self._tick_series(con_data, tick_count=tick_count)
 
-    def get_delta_vtecs(self) -> Sequence[float]:
+    def get_delta_vtecs(self, tick_count: Optional[int] = None) -> TickSeries:
         """
         Get vtec difference data for this set of connections
 
-        Returns:
-            SparseList vtec differences, 0.0 if unknown
-        """
-        index_ranges = []
-        data = []
-        tick_lookup = []
+        Args:
+            tick_count: optional number of ticks to cover
 
-        for con in self.connections:
-            index_ranges.append((con.tick_start, con.tick_end - 1))
-            filtered = numpy.diff(con.vtecs[0])
-            data.append(filtered)
-            tick_lookup.append(con.tick_idx)
-        return SparseList(index_ranges, data, tick_lookup)
+        Returns:
+            TickSeries of vtec differences, 0.0 if unknown
+        """
+        return self._tick_series(
+            (
+                (i, con.observations["tick"][:-1], numpy.diff(con.vtecs[0]))
+                for i, con in enumerate(self.connections)
+            ),
+            tick_count=tick_count,
+        )
 
-    def get_ipps(self) -> Sequence[Optional[types.ECEF_XYZ]]:
+    def get_ipps(self, tick_count: Optional[int] = None) -> TickSeries:
         """
         Get the ionospheric pierce points for each tick in this set of connections.
 
+        Args:
+            tick_count: optional number of ticks to cover
+
         Returns:
-            SparseList of (
+            TickSeries of (
                 ECEF XYZ coordinates in meters, or None if there is no
                 data for that tick
             )
         """
-        return SparseList(
-            [(con.tick_start, con.tick_end) for con in self.connections],
-            [con.ipps for con in self.connections],
-            [con.tick_idx for con in self.connections],
+        return self._tick_series(
+            (
+                (i, con.observations["tick"], con.ipps)
+                for i, con in enumerate(self.connections)
+            ),
+            shape=(3,),
             default=None,
+            tick_count=tick_count,
         )
 
-    def get_ipps_latlon(self) -> Sequence[Optional[Tuple[float, float]]]:
+    def get_ipps_latlon(self, tick_count: Optional[int] = None) -> TickSeries:
         """
         Get the ionospheric pierce points for each tick in this set of connections.
 
+        Args:
+            tick_count: optional number of ticks to cover
+
         Returns:
-            SparseList of (
+            TickSeries of (
                 lat, lon values, or None if there is no data for that tick
             )
         """
-        return SparseList(
-            [(con.tick_start, con.tick_end) for con in self.connections],
-            [coordinates.ecef2geodetic(con.ipps)[..., 0:2] for con in self.connections],
-            [con.tick_idx for con in self.connections],
+        return self._tick_series(
+            (
+                (i, con.observations["tick"], con.geometry["latlon"])
+                for i, con in enumerate(self.connections)
+            ),
+            shape=(2,),
             default=None,
+            tick_count=tick_count,
+        )
+
+
+class ConnectionTable:
+    """
+    Every connection in a scenario as the rows of a table, kept column by
+    column, so work over all of them is done with array operations instead
+    of connection by connection.
+
+    Per observation data (ticks, vtecs, pierce points...) are flat arrays of
+    each connection's observations in turn, con_ids giving the row each
+    observation belongs to. The Connection objects are still what the
+    scenario keeps, and table[row] gives the one for a row.
+    """
+
+    def __init__(self, scenario: Scenario) -> None:
+        """
+        Args:
+            scenario: the scenario whose connections to tabulate
+        """
+        self.scenario = scenario
+        self.stations = sorted(scenario.conn_map.keys())
+        self.prns = sorted(
+            {prn for prn_map in scenario.conn_map.values() for prn in prn_map}
+        )
+        prn_ids = {prn: i for i, prn in enumerate(self.prns)}
+
+        self.connections: List[Connection] = []
+        station_ids: List[int] = []
+        sat_ids: List[int] = []
+        for station_id, station in enumerate(self.stations):
+            for prn, conn_tick_map in sorted(scenario.conn_map[station].items()):
+                self.connections.extend(conn_tick_map.connections)
+                station_ids += [station_id] * len(conn_tick_map.connections)
+                sat_ids += [prn_ids[prn]] * len(conn_tick_map.connections)
+        cons = self.connections
+
+        # indices into self.stations and self.prns
+        self.station = numpy.array(station_ids, dtype=int)
+        self.prn = numpy.array(sat_ids, dtype=int)
+        self.idx_start = numpy.array([con.idx_start for con in cons], dtype=int)
+        self.idx_end = numpy.array([con.idx_end for con in cons], dtype=int)
+        self.tick_start = numpy.array([con.tick_start for con in cons], dtype=int)
+        self.tick_end = numpy.array([con.tick_end for con in cons], dtype=int)
+        self.offset = numpy.array([con.offset for con in cons], dtype=float)
+        self.offset_error = numpy.array([con.offset_error for con in cons], dtype=float)
+        self.carrier_correction = numpy.array(
+            [con.carrier_correction_meters for con in cons], dtype=float
+        )
+        self.is_glonass = numpy.array([con.is_glonass for con in cons], dtype=bool)
+        self.glonass_chan = numpy.array([con.glonass_chan for con in cons], dtype=int)
+        self.frequencies = numpy.array(
+            [con.frequencies for con in cons], dtype=float
+        ).reshape((-1, 2))
+
+        self.lengths = self.idx_end - self.idx_start + 1
+        self.con_ids = numpy.repeat(numpy.arange(len(cons)), self.lengths)
+        # (bias version, vtecs) once worked out
+        self._vtecs: Optional[Tuple[int, numpy.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def __getitem__(self, row: int) -> Connection:
+        """
+        Args:
+            row: the row of the table
+
+        Returns:
+            the Connection for that row
+        """
+        return self.connections[row]
+
+    def _gather(
+        self,
+        link_arrays: Callable[[str, str], numpy.ndarray],
+        field: str,
+        shape: Tuple[int, ...] = (),
+    ) -> numpy.ndarray:
+        """
+        Pick every connection's observations out of arrays lined up with the
+        scenario's station_data
+
+        Args:
+            link_arrays: gives the array for a station and satellite
+            field: the field of those arrays to pick
+            shape: the shape of that field for each observation
+
+        Returns:
+            flat numpy array of the field for each connection's observations in turn
+        """
+        links = self.station * len(self.prns) + self.prn
+        firsts = numpy.flatnonzero(numpy.diff(links, prepend=-1))
+        lasts = numpy.append(firsts[1:], len(links))
+        parts = [numpy.zeros((0,) + shape)]
+        # rows are grouped by station and satellite, so take each group at once
+        for first, last in zip(firsts, lasts):
+            array = link_arrays(
+                self.stations[self.station[first]], self.prns[self.prn[first]]
+            )
+            idxs = util.concat_ranges(
+                self.idx_start[first:last], self.lengths[first:last]
+            )
+            parts.append(array[field][idxs])
+        return numpy.concatenate(parts)
+
+    def _station_data(self, station: str, prn: str) -> numpy.ndarray:
+        """
+        The scenario's observations of a satellite from a station
+        """
+        return self.scenario.station_data[station][prn]
+
+    @cached_property
+    def ticks(self) -> numpy.ndarray:
+        """
+        The tick of each observation
+        """
+        return self._gather(self._station_data, "tick").astype(int)
+
+    @cached_property
+    def ipps(self) -> types.ECEF_XYZ_LIST:
+        """
+        ECEF XYZ coordinates in meters of each observation's ionospheric pierce point
+        """
+        return cast(
+            types.ECEF_XYZ_LIST,
+            self._gather(self.scenario.observation_geometry, "ipp", (3,)),
         )
+
+    @cached_property
+    def latlons(self) -> numpy.ndarray:
+        """
+        Latitude and longitude in degrees of each observation's pierce point
+        """
+        return self._gather(self.scenario.observation_geometry, "latlon", (2,))
+
+    @property
+    def vtecs(self) -> numpy.ndarray:
+        """
+        The vtec values of every observation, worked out all at once, and
+        again if the scenario's biases change
+
+        Returns:
+            read-only numpy array of (
+                vtec value in TECu,
+                unitless slant_to_vertical factor
+            )
+        """
+        if self._vtecs is None or self._vtecs[0] != self.scenario.bias_version:
+            vtecs = tec.calculate_table_vtecs(
+                self,
+                self._gather(self._station_data, "L1C"),
+                self._gather(self._station_data, "L2C"),
+                self._gather(self.scenario.observation_geometry, "s_to_v"),
+            )
+            vtecs.flags.writeable = False
+            self._vtecs = (self.scenario.bias_version, vtecs)
+        return self._vtecs[1]
+
+    def filtered_vtecs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Bandpass filter every connection's vtecs
+
+        Returns:
+            flat numpy array of 2nd order butterworth bandpass filtered VTEC TECu
+                values, 0.0 for connections too short to filter
+            numpy array of booleans, whether each observation was filtered
+        """
+        vtecs = self.vtecs[0]
+        filtered = numpy.zeros(len(vtecs))
+        valid = numpy.zeros(len(vtecs), dtype=bool)
+        starts = numpy.cumsum(self.lengths) - self.lengths
+        for row in numpy.flatnonzero(self.lengths > util.BUTTER_MIN_LENGTH):
+            span = slice(starts[row], starts[row] + self.lengths[row])
+            result = util.bpfilter(vtecs[span])
+            if result is None:
+                continue
+            filtered[span] = result
+            valid[span] = True
+        return filtered, valid
@@ -1,19 +1,22 @@
 """
 Functions to help with download and basic processing of GPS data
 """
+import concurrent.futures
 from datetime import datetime, timedelta
-import io
+import functools
 import json
 import logging
-import multiprocessing
 import os
 import re
-from typing import cast, Dict, Iterable, Optional, Sequence, Tuple
+import shutil
+import tempfile
+import threading
+from typing import cast, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 import zipfile
 from laika.constants import SECS_IN_DAY
 
+from atomicwrites import atomic_write
 import numpy
-import requests
 
 import hatanaka
 import georinex
@@ -21,11 +24,20 @@ import xarray
 
 from laika import AstroDog
 from laika.dgps import get_station_position
-from laika.downloader import download_cors_station, download_and_cache_file
 from laika.gps_time import GPSTime
 from laika.rinex_file import DownloadError
 
-from tid import config, tec, types, util
+from tid import (
+    cache,
+    config,
+    listings,
+    mirrors,
+    orbits,
+    rinex,
+    scheduler,
+    types,
+    util,
+)
 
 
 LOG = logging.getLogger(__name__)
@@ -36,10 +48,8 @@ DENSE_TYPE = [
     ("C2C", "f8"),
     ("L1C", "f8"),
     ("L2C", "f8"),
-    ("sat_pos", "3f8"),  # satellite position XYZ ECEF in meters
 ]
 
-DOWNLOAD_WORKERS = 20  # how many processes to spawn for downloading files
 
 # ecef locations for stations, so we can know what is nearby
 with open(
@@ -55,6 +65,28 @@ with open(
 
 conf = config.Configuration()
 
+# base URLs of the archives we download from, by the name used in the config
+ARCHIVES = {
+    "noaa": "https://geodesy.noaa.gov/corsdata/rinex/",
+    "noaa_alt": "https://alt.ngs.noaa.gov/corsdata/rinex/",
+    # direct CDDIS archive for IGS station observation data
+    # (requires NASA Earthdata credentials in ~/.netrc)
+    "cddis": os.getenv(
+        "CDDIS_OBS_BASE_URL", "https://cddis.nasa.gov/archive/gnss/data/daily/"
+    ),
+    "cddis_ftp": "ftp://cddis.nasa.gov/gnss/data/daily/",
+    "whu": "ftp://igs.gnsswhu.cn/pub/gps/data/daily/",
+    "garner": "ftp://garner.ucsd.edu/archive/garner/rinex/",
+    "unavco": "ftp://data-out.unavco.org/pub/rinex/obs/",
+    "japan": "https://copyfighter.org:6670/japan/data/GR_2.11/",
+    "korea": "http://gnssdata.or.kr/download/",
+    "mongolia": "http://monpos.gazar.gov.mn/",
+}
+ARCHIVES.update(conf.archives)
+
+# station-days we couldn't find anywhere, so we don't keep asking every mirror
+unavailable = cache.NegativeCache(os.path.join(conf.cache_dir, cache.UNAVAILABLE_FILE))
+
 
 def char_code_for_partial(time: GPSTime) -> str:
     """
@@ -120,34 +152,282 @@ def _download_misc_igs_station(
     if partial:
         raise NotImplementedError
 
-    cache_subdir = dog.cache_dir + "misc_igs_obs/"
     t = time.as_datetime()
-    # different path formats...
-
-    folder_path = t.strftime("%Y/%j/")
     filename = station_name + t.strftime("%j0.%yo")
-    url_bases = (
-        "ftp://garner.ucsd.edu/archive/garner/rinex/",
-        "ftp://data-out.unavco.org/pub/rinex/obs/",
+    folder_path = t.strftime("%Y/%j/")
+    cddis_folder_path = folder_path + t.strftime("%yo/")
+    cache_subdir = dog.cache_dir + "misc_igs_obs/"
+    # where laika's download_and_cache_file used to put these
+    cached = _cached_file(
+        cache_subdir + folder_path + filename,
+        cache_subdir + cddis_folder_path + filename,
     )
-    try:
-        filepath = download_and_cache_file(
-            url_bases, folder_path, cache_subdir, filename, compression=".Z"
+    if cached is not None:
+        return cached
+
+    # different path formats...
+    mirror_list = []
+    if listings.index.has(
+        "garner", ARCHIVES["garner"] + folder_path, filename + ".Z", t
+    ):
+        mirror_list.append(
+            mirrors.Mirror("garner", ARCHIVES["garner"] + folder_path + filename + ".Z")
         )
-        return filepath
-    except IOError:
-        url_bases = (
-            "ftp://igs.gnsswhu.cn/pub/gps/data/daily/",
-            "ftp://cddis.nasa.gov/gnss/data/daily/",
+    # UNAVCO doesn't give us listings, so it's always worth a try
+    mirror_list.append(
+        mirrors.Mirror(
+            "garner",
+            ARCHIVES["unavco"] + folder_path + filename + ".Z",
         )
-        folder_path += t.strftime("%yo/")
-        try:
-            filepath = download_and_cache_file(
-                url_bases, folder_path, cache_subdir, filename, compression=".Z"
+    )
+    # the Wuhan archive mirrors CDDIS
+    if listings.index.has(
+        "cddis", ARCHIVES["cddis"] + cddis_folder_path, filename + ".Z", t
+    ):
+        mirror_list += [
+            mirrors.Mirror("cddis", base + cddis_folder_path + filename + ".Z")
+            for base in (ARCHIVES["whu"], ARCHIVES["cddis_ftp"])
+        ]
+    return mirrors.fetch_first(mirror_list, cache_subdir + folder_path + filename)
+
+
+def _download_cors_station(
+    dog: AstroDog, time: GPSTime, station_name: str
+) -> Optional[str]:
+    """
+    Downloader for CORS stations (and other IGS stations CDDIS has). Attempts
+    to download rinex observables for the given station and time
+    Should only be used internally by data_for_station
+
+    Args:
+        dog: laika AstroDog object
+        time: laika GPSTime object
+        station_name: string representation a station name
+
+    Returns:
+        string representing a path to the downloaded file
+        or None, if the file was not able to be downloaded
+    """
+    t = time.as_datetime()
+    filename = station_name + t.strftime("%j0.%yd")
+    cors_folder_path = t.strftime("%Y/%j/") + station_name + "/"
+    cddis_folder_path = t.strftime("%Y/%j/%yd/")
+    cache_subdir = dog.cache_dir + "cors_obs/"
+    cached = _cached_file(
+        cache_subdir + cors_folder_path + filename,
+        cache_subdir + cddis_folder_path + filename,
+    )
+    if cached is not None:
+        return cached
+
+    mirror_list = []
+    # one listing of the day tells us every station NOAA has
+    if listings.index.has(
+        "noaa", ARCHIVES["noaa"] + t.strftime("%Y/%j/"), station_name, t
+    ):
+        mirror_list += [
+            mirrors.Mirror("noaa", base + cors_folder_path + filename + ".gz")
+            for base in (ARCHIVES["noaa"], ARCHIVES["noaa_alt"])
+        ]
+    # CDDIS switched from .Z to .gz at the start of 2021
+    for ext in (".gz", ".Z") if t.year >= 2021 else (".Z", ".gz"):
+        if listings.index.has(
+            "cddis", ARCHIVES["cddis"] + cddis_folder_path, filename + ext, t
+        ):
+            mirror_list.append(
+                mirrors.Mirror(
+                    "cddis", ARCHIVES["cddis"] + cddis_folder_path + filename + ext
+                )
             )
-            return filepath
-        except IOError:
-            return None
+    if not mirror_list:
+        return None
+    return mirrors.fetch_first(
+        mirror_list,
+        cache_subdir + t.strftime("%Y/%j/") + station_name + t.strftime("%j0.%yo"),
+    )
+
+
+def _cached_file(*paths: str) -> Optional[str]:
+    """
+    Find a file we already downloaded
+
+    Args:
+        paths: the places it may have been put
+
+    Returns:
+        the first of them that exists, or None
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _korean_path(dog: AstroDog, time: GPSTime, station_name: str) -> str:
+    """
+    Where a Korean station-day's rinex obs file is cached
+    """
+    return dog.cache_dir + time.as_datetime().strftime(
+        f"korean_obs/%Y/%j/{station_name}%j0.%yo"
+    )
+
+
+def _korean_cached(dog: AstroDog, time: GPSTime, station_name: str) -> bool:
+    """
+    Whether we already have a Korean station-day, raw or processed
+    """
+    path = _korean_path(dog, time, station_name)
+    return os.path.isfile(path) or os.path.isfile(cache.station_day_path(path))
+
+
+def download_korean_stations(
+    dog: AstroDog, time: GPSTime, station_names: Iterable[str]
+) -> Dict[str, Optional[str]]:
+    """
+    Downloads a day of rinex observables for several Korean stations at once.
+    The server bundles them into one zip of per-station zips, which we unpack
+    as it comes in rather than holding all of it in memory.
+
+    Args:
+        dog: laika AstroDog object
+        time: laika GPSTime object
+        station_names: the stations to fetch
+
+    Returns:
+        station names to the paths of their downloaded files,
+        or None for those the server didn't have
+
+    Raises:
+        DownloadError if the server wouldn't make the zip
+    """
+    station_names = list(station_names)
+    paths: Dict[str, Optional[str]] = {name: None for name in station_names}
+    if not station_names:
+        return paths
+
+    start_day = time.as_datetime().strftime("%Y%m%d")
+    postdata = {
+        "corsId": ",".join(name.upper() for name in station_names),
+        "obsStDay": start_day,
+        "obsEdDay": start_day,
+        "dataTyp": util.DATA_RATE,
+    }
+    with scheduler.host_slot("gnssdata"):
+        json_url = ARCHIVES["korea"] + "createToZip.json"
+        res = scheduler.session().post(json_url, data=postdata).text
+        if not res:
+            raise DownloadError
+        res_dat = json.loads(res)
+        if not res_dat.get("result", None):
+            raise DownloadError
+
+        # zip files need seeking, so spool it to disk
+        with tempfile.TemporaryFile() as spool:
+            with scheduler.session().get(
+                ARCHIVES["korea"] + f"getZip.do?key={res_dat['key']}", stream=True
+            ) as zipstream:
+                zipstream.raise_for_status()
+                for chunk in zipstream.iter_content(1 << 16):
+                    spool.write(chunk)
+            spool.seek(0)
+
+            with zipfile.ZipFile(spool) as zipdat:
+                for zipf in zipdat.filelist:
+                    with zipdat.open(zipf) as station_zip, zipfile.ZipFile(
+                        station_zip
+                    ) as station:
+                        for rinex_file in station.filelist:
+                            if not rinex_file.filename.endswith("o"):
+                                continue
+                            name = os.path.basename(rinex_file.filename)[:4].lower()
+                            if name not in paths:
+                                continue
+                            path = _korean_path(dog, time, name)
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                            with station.open(rinex_file) as rinex_in, atomic_write(
+                                path, mode="wb", overwrite=True
+                            ) as rinex_out:
+                                shutil.copyfileobj(rinex_in, rinex_out)
+                            paths[name] = path
+    return paths
+
+
+class KoreanBatches:
+    """
+    Korean station-days we know are going to be asked for, so that the
+    first request for a day fetches all of them in one go
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # day to the stations still to fetch, and the locks for each day
+        self._planned: Dict[str, Set[str]] = {}
+        self._day_locks: Dict[str, threading.Lock] = {}
+        # station-days already tried, to what went wrong (None for "not found")
+        self._failed: Dict[Tuple[str, str], Optional[Exception]] = {}
+
+    def plan(self, time: GPSTime, station_names: Iterable[str]) -> None:
+        """
+        Say which stations are going to be asked for on a day
+
+        Args:
+            time: laika GPSTime object for the day
+            station_names: the Korean stations that will be wanted
+        """
+        day = time.as_datetime().strftime("%Y%j")
+        with self._lock:
+            self._planned.setdefault(day, set()).update(station_names)
+
+    def fetch(self, dog: AstroDog, time: GPSTime, station_name: str) -> Optional[str]:
+        """
+        Get a Korean station-day, along with the rest of its day's batch
+
+        Args:
+            dog: laika AstroDog object
+            time: laika GPSTime object
+            station_name: string representation a station name
+
+        Returns:
+            string representing a path to the downloaded file
+            or None, if the file was not able to be downloaded
+        """
+        day = time.as_datetime().strftime("%Y%j")
+        path = _korean_path(dog, time, station_name)
+        with self._lock:
+            day_lock = self._day_locks.setdefault(day, threading.Lock())
+
+        # whoever gets here first fetches the batch, the rest wait for it
+        with day_lock:
+            if os.path.isfile(path):
+                return path
+            if (day, station_name) in self._failed:
+                error = self._failed[(day, station_name)]
+                if error is not None:
+                    raise error
+                return None
+
+            with self._lock:
+                batch = self._planned.pop(day, set()) | {station_name}
+            # (the others may have been fetched, or even processed, since)
+            batch = {
+                name
+                for name in batch
+                if name == station_name or not _korean_cached(dog, time, name)
+            }
+            try:
+                paths = download_korean_stations(dog, time, sorted(batch))
+            except Exception as err:
+                # the rest of the batch gets the same answer
+                for name in batch - {station_name}:
+                    self._failed[(day, name)] = err
+                raise
+            for name, name_path in paths.items():
+                if name_path is None:
+                    self._failed[(day, name)] = None
+            return paths[station_name]
+
+
+korean_batches = KoreanBatches()
 
 
 def _download_korean_station(
@@ -155,10 +435,10 @@ def _download_korean_station(
 ) -> Optional[str]:
     """
     Downloader for Korean stations. Attempts to download rinex observables
-    for the given station and time.
+    for the given station and time, fetching any other stations planned for
+    the same day along with it.
     Should only be used internally by data_for_station
 
-    TODO: we can download from multiple stations at once and save some time here....
     TODO: separate network: ftp://gnss-ftp.kasi.re.kr and ftp://nfs.kasi.re.kr (IGS only?) and
         https://gnss.eseoul.go.kr/timeselection
 
@@ -175,44 +455,7 @@ def _download_korean_station(
     if partial:
         raise NotImplementedError
 
-    json_url = "http://gnssdata.or.kr/download/createToZip.json"
-    zip_url = "http://gnssdata.or.kr/download/getZip.do?key=%d"
-
-    cache_subdir = dog.cache_dir + "korean_obs/"
-    t = time.as_datetime()
-    # different path formats...
-    folder_path = cache_subdir + t.strftime("%Y/%j/")
-    filename = folder_path + station_name + t.strftime("%j0.%yo")
-
-    if os.path.isfile(filename):
-        return filename
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path, exist_ok=True)
-
-    start_day = t.strftime("%Y%m%d")
-    postdata = {
-        "corsId": station_name.upper(),
-        "obsStDay": start_day,
-        "obsEdDay": start_day,
-        "dataTyp": util.DATA_RATE,
-    }
-    res = requests.post(json_url, data=postdata).text
-    if not res:
-        raise DownloadError
-    res_dat = json.loads(res)
-    if not res_dat.get("result", None):
-        raise DownloadError
-
-    key = res_dat["key"]
-    zipstream = requests.get(zip_url % key, stream=True)
-    with zipfile.ZipFile(io.BytesIO(zipstream.content)) as zipdat:
-        for zipf in zipdat.filelist:
-            with zipfile.ZipFile(io.BytesIO(zipdat.read(zipf))) as station:
-                for rinex in station.filelist:
-                    if rinex.filename.endswith("o"):
-                        with open(filename, "wb") as rinex_out:
-                            rinex_out.write(station.read(rinex))
-    return filename
+    return korean_batches.fetch(dog, time, station_name)
 
 
 def _download_japanese_station(
@@ -245,15 +488,22 @@ def _download_japanese_station(
         timecode = "0"
     filename = station_name + t.strftime(f"%j{timecode}.%yo")
 
-    url_bases = ("https://copyfighter.org:6670/japan/data/GR_2.11/",)
-    try:
-        filepath = download_and_cache_file(
-            url_bases, folder_path, cache_subdir, filename, compression=".gz"
+    if _cached_file(cache_subdir + folder_path + filename) is None and not (
+        listings.index.has(
+            "copyfighter", ARCHIVES["japan"] + folder_path, filename + ".gz", t
         )
-        return filepath
-    except IOError:
+    ):
         return None
 
+    return mirrors.fetch_first(
+        [
+            mirrors.Mirror(
+                "copyfighter", ARCHIVES["japan"] + folder_path + filename + ".gz"
+            )
+        ],
+        cache_subdir + folder_path + filename,
+    )
+
 
 mongolian_csrf_info = {}
 
@@ -263,7 +513,7 @@ def _get_mongolian_csrf() -> None:
     We need a CSRF token to download things. This will load the page and populate
     the tokens to be used
     """
-    req = requests.get("http://monpos.gazar.gov.mn/monstatic")
+    req = scheduler.session().get(ARCHIVES["mongolia"] + "monstatic")
     mongolian_csrf_info["csrftoken"] = req.cookies["csrftoken"]
 
     idx = req.text.index('value="', req.text.index("csrfmiddlewaretoken"))
@@ -295,31 +545,33 @@ def _download_mongolian_station(
     t = time.as_datetime()
     # different path formats...
     folder_path = cache_subdir + t.strftime("%Y/%j/")
+    disk_path = folder_path + station_name + t.strftime(".%yo")
+    if os.path.isfile(disk_path):
+        return disk_path
     if not os.path.exists(folder_path):
         os.makedirs(folder_path, exist_ok=True)
 
-    mongolian_csrf_info
-    if not mongolian_csrf_info:
-        _get_mongolian_csrf()
-
     datestr = t.strftime("%Y-%m-%d")
-    req = requests.post(
-        "http://monpos.gazar.gov.mn/download/" + station_name,
-        data={
-            "csrfmiddlewaretoken": mongolian_csrf_info["csrfmiddlewaretoken"],
-            "datepicker": datestr,
-        },
-        cookies={"csrftoken": mongolian_csrf_info["csrftoken"]},
-    )
+    with scheduler.host_slot("monpos"):
+        if not mongolian_csrf_info:
+            _get_mongolian_csrf()
+
+        req = scheduler.session().post(
+            ARCHIVES["mongolia"] + "download/" + station_name,
+            data={
+                "csrfmiddlewaretoken": mongolian_csrf_info["csrfmiddlewaretoken"],
+                "datepicker": datestr,
+            },
+            cookies={"csrftoken": mongolian_csrf_info["csrftoken"]},
+        )
     if req.status_code != 200:
         return None
 
-    disk_path = folder_path + station_name + t.strftime(".%yo")
-    with open(disk_path, "wb") as f:
-        decompressed = hatanaka.decompress(req.content)
-        # doesn't 404 I guess?
-        if b"<!DOCTYPE html>" in decompressed:
-            return None
+    decompressed = hatanaka.decompress(req.content)
+    # doesn't 404 I guess?
+    if b"<!DOCTYPE html>" in decompressed:
+        return None
+    with atomic_write(disk_path, mode="wb", overwrite=True) as f:
         f.write(decompressed)
     return disk_path
 
@@ -329,11 +581,10 @@ def cors_get_station_lists_for_day(date: datetime) -> Iterable[str]:
     Given a date, returns the stations that the US CORS network
     reports as available
     """
-    url = "https://geodesy.noaa.gov/corsdata/rinex/"
-    resp = requests.get(url + date.strftime("%Y/%j/"))
-
-    pat = '<a href="..../">([a-z0-9]{4})/</a>'
-    return re.findall(pat, resp.text)
+    listing = listings.index.get(
+        "noaa", ARCHIVES["noaa"] + date.strftime("%Y/%j/"), date
+    )
+    return [name for name in listing or () if re.fullmatch("[a-z0-9]{4}", name)]
 
 
 def fetch_rinex_for_station(
@@ -370,20 +621,18 @@ def fetch_rinex_for_station(
     if network is None:
         # step 1: get the station rinex data
         try:
-            rinex_obs_file = download_cors_station(
-                time, station_name, cache_dir=dog.cache_dir
-            )
-        except (KeyError, DownloadError):
-            # station position not in CORS map, try another thing
+            rinex_obs_file = _download_cors_station(dog, time, station_name)
+        except hatanaka.hatanaka.HatanakaException:
+            # not gonna handle this ourselves, sadly
+            return None
+        if rinex_obs_file is None:
+            # not a CORS station, try another thing
             if station_name in STATION_LOCATIONS:
                 rinex_obs_file = _download_misc_igs_station(
                     dog, time, station_name, partial=partial
                 )
             else:
                 return None
-        except hatanaka.hatanaka.HatanakaException:
-            # not gonna handle this ourselves, sadly
-            return None
 
     else:
         rinex_obs_file = handlers[network](dog, time, station_name, partial=partial)
@@ -474,21 +723,83 @@ def from_xarray_sat(rinex: xarray.Dataset, start_date: GPSTime) -> types.Observa
     return cast(types.Observations, outp)
 
 
-def from_xarray(rinex: xarray.Dataset, start_date: GPSTime) -> types.DenseMeasurements:
+def from_xarray(
+    rinex_data: xarray.Dataset, start_date: GPSTime
+) -> types.DenseMeasurements:
+    """
+    Convert georinex's xarray format into our sparser format.
+    All satellites are converted at once, which gives the same results as
+    from_xarray_sat on each satellite but without xarray's per-selection overhead.
+
+    Args:
+        rinex_data: the georinex xarray file
+        start_date: when tick 0 occurred
+
+    Returns:
+        dense raw gps data
+    """
+    svs = [str(sv) for sv in rinex_data.sv.to_numpy()]
+    times = rinex_data["time"].to_numpy().astype("datetime64[ns]")
+    # flatten the (time, sv) grids time-major, so each satellite stays in time order
+    flat = rinex.RinexObs(
+        position=None,
+        svs=svs,
+        sv_idx=numpy.tile(numpy.arange(len(svs)), len(times)),
+        times=numpy.repeat(times, len(svs)),
+        obs={
+            name: rinex_data[name].transpose("time", "sv").to_numpy().ravel()
+            for name in ("C1", "C2", "P2", "L1", "L2")
+            if name in rinex_data
+        },
+        glonass_slots={},
+    )
+    return from_rinex(flat, start_date)
+
+
+def from_rinex(obs: rinex.RinexObs, start_date: GPSTime) -> types.DenseMeasurements:
     """
-    Convert georinex's xarray format into our sparser format
+    Convert natively parsed RINEX observations into our sparser format
 
     Args:
-        rinex: the georinex xarray file
+        obs: the observations from rinex.read_obs
         start_date: when tick 0 occurred
 
     Returns:
         dense raw gps data
     """
-    sv_dict_out = cast(types.DenseMeasurements, {})
-    for svid in rinex.sv.to_numpy():
-        sv_dict_out[svid] = from_xarray_sat(rinex.sel(sv=svid), start_date)
-    return sv_dict_out
+    if "C1" not in obs.obs:
+        return cast(
+            types.DenseMeasurements,
+            {sv: numpy.zeros(0, dtype=DENSE_TYPE) for sv in obs.svs},
+        )
+
+    # truncate to observations with data, grouped by satellite (still in time order)
+    keep = numpy.flatnonzero(~numpy.isnan(obs.obs["C1"]))
+    keep = keep[numpy.argsort(obs.sv_idx[keep], kind="stable")]
+    sv_idx = obs.sv_idx[keep]
+    outp = numpy.zeros(len(keep), dtype=DENSE_TYPE)
+
+    obs_map = {"C1C": "C1", "C2C": "C2", "C2P": "P2", "L1C": "L1", "L2C": "L2"}
+    for field in ["C1C", "C2C", "L1C", "L2C"]:
+        # if the channel doesn't exist, set to NaN
+        if obs_map[field] not in obs.obs:
+            outp[field][:] = numpy.nan
+        else:
+            outp[field][:] = obs.obs[obs_map[field]][keep]
+
+    # if the C2C channel is empty/crap for a satellite, replace it with C2P
+    if obs_map["C2P"] in obs.obs:
+        c2_counts = numpy.bincount(
+            sv_idx, weights=~numpy.isnan(outp["C2C"]), minlength=len(obs.svs)
+        )
+        no_c2 = numpy.isin(sv_idx, numpy.flatnonzero(c2_counts == 0))
+        outp["C2C"][no_c2] = obs.obs[obs_map["C2P"]][keep][no_c2]
+
+    timedeltas = obs.times[keep] - numpy.datetime64(start_date.as_datetime())
+    outp["tick"] = (timedeltas / numpy.timedelta64(util.DATA_RATE, "s")).astype(int)
+
+    bounds = numpy.searchsorted(sv_idx, numpy.arange(1, len(obs.svs)))
+    return cast(types.DenseMeasurements, dict(zip(obs.svs, numpy.split(outp, bounds))))
 
 
 def data_for_station(
@@ -519,8 +830,14 @@ def data_for_station(
     if rinex_obs_file is None:
         raise DownloadError
 
-    rinex = georinex.load(rinex_obs_file, interval=30)
-    return from_xarray(rinex, start_date)
+    try:
+        obs = rinex.read_obs(rinex_obs_file, interval=util.DATA_RATE)
+    except ValueError:
+        # georinex is much slower, but copes with more unusual files
+        LOG.info("falling back to georinex for %s", rinex_obs_file)
+        rinex_data = georinex.load(rinex_obs_file, interval=30, use=["G", "R"])
+        return from_xarray(rinex_data, start_date)
+    return from_rinex(obs, start_date)
 
 
 def get_sat_info_old_okay(
@@ -559,58 +876,119 @@ def get_sat_info_old_okay(
     return res
 
 
+def build_orbit_table(
+    dog: AstroDog, start_time: GPSTime, duration: timedelta
+) -> orbits.OrbitTable:
+    """
+    Work out where every satellite is at every tick
+
+    Args:
+        dog: laika AstroDog to use
+        start_time: when the 0th tick occurs
+        duration: how long until the last tick
+
+    Returns:
+        the satellite orbits at each tick
+    """
+    sat_orbits = orbits.ChebyshevOrbits.build(
+        functools.partial(get_sat_info_old_okay, dog),
+        start_time,
+        duration,
+        os.path.join(conf.cache_dir, "orbits"),
+    )
+    tick_count = int(duration.total_seconds() / util.DATA_RATE)
+    return orbits.OrbitTable.from_orbits(sat_orbits, start_time, tick_count + 1)
+
+
+def drop_unknown_orbits(
+    orbit_table: orbits.OrbitTable, station: str, data: types.DenseMeasurements
+) -> None:
+    """
+    Drop a station's measurements for which we can't know where the satellite was
+
+    Args:
+        orbit_table: the satellite orbits at each tick
+        station: the station name
+        data: the station's measurements, modified in place
+    """
+    for sat in list(data):
+        if sat not in orbit_table:
+            # no info for this satellite, probably not orbiting, remove it
+            print("bad", station, sat)
+            del data[sat]
+            continue
+        # gaps in the ephemerides, or outside of our time range
+        known = orbit_table.known(sat, data[sat]["tick"])
+        if not known.all():
+            data[sat] = cast(types.Observations, data[sat][known])
+
+
 def populate_sat_info(
     dog: AstroDog,
     start_time: GPSTime,
     duration: timedelta,
     station_dict: types.StationPrnMap[types.Observations],
-) -> None:
+) -> orbits.OrbitTable:
     """
-    Populate the satellite locations for our measurements
+    Find the satellite locations for our measurements, dropping any measurements
+    for which we can't know where the satellite was
 
     Args:
         dog: laika AstroDog to use
         start_time: when the 0th tick occurs
         duration: how long until the last tick
-        station_dict: mapping to the Observations that need correcting
+        station_dict: mapping to the Observations that need checking
 
-    TODO: can numba (or something) help us parallelize the lower loops?
+    Returns:
+        the satellite orbits at each tick
     """
+    orbit_table = build_orbit_table(dog, start_time, duration)
+    for station, data in station_dict.items():
+        drop_unknown_orbits(orbit_table, station, cast(types.DenseMeasurements, data))
+    return orbit_table
 
-    satellites = {
-        sat: idx for idx, sat in enumerate(get_sat_info_old_okay(dog, start_time))
-    }
-    tick_count = int(duration.total_seconds() / util.DATA_RATE)
-    # get an accurate view of the satellites at 30 second intervals
-    sat_info = numpy.zeros(
-        (len(satellites), tick_count + 1), dtype=[("pos", "3f8"), ("vel", "3f8")]
-    )
 
-    for tick in range(tick_count + 1):
-        tick_info = get_sat_info_old_okay(dog, start_time + util.DATA_RATE * tick)
-        for svid, info in tick_info.items():
-            if svid not in satellites:
-                continue
-            sat_info[satellites[svid]][tick] = (info[0], info[1])
-
-    bad_datas = set()
-    for station in station_dict:
-        for sat in station_dict[station]:
-            if sat not in satellites:
-                # no info for this satellite, probably not orbiting, remove it
-                bad_datas.add((station, sat))
-                continue
-            ticks = station_dict[station][sat]["tick"]
-            time_delays = station_dict[station][sat]["C1C"] / tec.C
-            delta_pos = (
-                sat_info[satellites[sat]]["vel"][ticks] * time_delays[:, numpy.newaxis]
-            )
-            corrected_pos = sat_info[satellites[sat]]["pos"][ticks] - delta_pos
-            station_dict[station][sat]["sat_pos"][:] = corrected_pos
+class DenseAccumulator:
+    """
+    Collects chunks (days or hours) of dense measurements for a station, and
+    joins them all at once at the end, rather than re-copying the growing
+    arrays every time another chunk arrives
+    """
 
-    for station, sat in bad_datas:
-        print("bad", station, sat)
-        del station_dict[station][sat]
+    def __init__(self) -> None:
+        self.chunks: Dict[str, List[types.Observations]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def add(self, data: types.DenseMeasurements) -> None:
+        """
+        Add a chunk of measurements
+
+        Args:
+            data: the measurements, in any order relative to earlier chunks
+        """
+        for prn, observations in data.items():
+            self.chunks.setdefault(prn, []).append(observations)
+
+    def merged(self) -> types.DenseMeasurements:
+        """
+        Combine everything added so far
+
+        Returns:
+            the measurements for each PRN sorted by tick, where chunks overlap
+            the first chunk added wins
+        """
+        combined = cast(types.DenseMeasurements, {})
+        for prn, chunks in self.chunks.items():
+            data = chunks[0] if len(chunks) == 1 else numpy.concatenate(chunks)
+            ticks = data["tick"]
+            if len(ticks) > 1 and not numpy.all(ticks[1:] > ticks[:-1]):
+                data = data[numpy.argsort(ticks, kind="stable")]
+                ticks = data["tick"]
+                data = data[numpy.concatenate(([True], ticks[1:] != ticks[:-1]))]
+            combined[prn] = cast(types.Observations, data)
+        return combined
 
 
 def merge_data(
@@ -626,18 +1004,10 @@ def merge_data(
     Returns:
         the combined data
     """
-    combined = data1.copy()
-    for prn in data2:
-        # prn only has data in the second dataset
-        if prn not in data1:
-            combined[prn] = data2[prn]
-        # otherwise we need an actual merge
-        else:
-            combined[prn] = cast(
-                types.Observations, numpy.append(data1[prn], data2[prn])
-            )
-
-    return cast(types.DenseMeasurements, combined)
+    accumulator = DenseAccumulator()
+    accumulator.add(data1)
+    accumulator.add(data2)
+    return accumulator.merged()
 
 
 def populate_data(
@@ -645,7 +1015,11 @@ def populate_data(
     start_date: GPSTime,
     duration: timedelta,
     dog: AstroDog,
-) -> Tuple[Dict[str, types.ECEF_XYZ], types.StationPrnMap[types.Observations]]:
+) -> Tuple[
+    Dict[str, types.ECEF_XYZ],
+    types.StationPrnMap[types.Observations],
+    orbits.OrbitTable,
+]:
     """
     Download/populate the station data and station location info
 
@@ -656,7 +1030,8 @@ def populate_data(
 
     Returns:
         dictionary of station names to their locations,
-        dictionary of station names to sat names to their dense data
+        dictionary of station names to sat names to their dense data,
+        the satellite orbits at each tick
 
     TODO: is this a good place to be caching results?
     """
@@ -667,6 +1042,7 @@ def populate_data(
     station_data = cast(types.StationPrnMap[types.Observations], {})
 
     for station in stations:
+        accumulator = DenseAccumulator()
         gps_date = start_date
         while (gps_date) < start_date + duration.total_seconds():
             try:
@@ -677,54 +1053,46 @@ def populate_data(
                 if station not in station_locs:
                     station_locs[station] = location_for_station(dog, gps_date, station)
 
-            except DownloadError:
+            except (DownloadError, mirrors.FetchError):
                 continue
             except IndexError:
                 print("index error: ", station)
                 continue
             finally:
                 gps_date += (1 * util.DAYS).total_seconds()
-            if station not in station_data:
-                station_data[station] = latest_data
-            else:
-                # we've already got some data, so merge it together
-                # give mypy a hint here about our type aliases
-                station_data[station] = merge_data(
-                    cast(types.DenseMeasurements, station_data[station]),
-                    latest_data,
-                )
+            accumulator.add(latest_data)
 
         # didn't download data, ignore it
-        if station not in station_data:
+        if not accumulator:
             continue
+        station_data[station] = accumulator.merged()
 
-    populate_sat_info(dog, start_date, duration, station_data)
+    orbit_table = populate_sat_info(dog, start_date, duration, station_data)
 
-    return station_locs, station_data
+    return station_locs, station_data, orbit_table
 
 
-def download_and_process(
-    argtuple: Tuple[GPSTime, str, bool]
-) -> Tuple[GPSTime, str, Optional[str]]:
+def _processed_path(date: GPSTime, station: str, partial: bool) -> Optional[str]:
     """
-    Fetch the data for a station at a date, return a path to the NetCDF4 version of it
+    Look for an already processed (cached) station-day for a station at a date
 
     Args:
-        argtuple: the date and station for which we want the data, and whether to get partial data
+        date: the date for which we want the data
+        station: the station for which we want the data
+        partial: whether we want partial (hourly) data
 
     Returns:
-        date requested, station requested, and the path to the nc file, or
-        None if it can't be retrieved
+        the path to the cached station-day, or None if it has not been processed
+        yet (or was processed by another cache version)
     """
-    date, station, partial = argtuple
-
     if partial:
         char_code = char_code_for_partial(date)
     else:
         char_code = "0"
 
-    # first search for already processed NetCDF4 files
-    path_name = date.as_datetime().strftime(f"%Y/%j/{station}%j{char_code}.%yo.nc")
+    path_name = cache.station_day_path(
+        date.as_datetime().strftime(f"%Y/%j/{station}%j{char_code}.%yo")
+    )
     for cache_folder in [
         "misc_igs_obs",
         "japanese_obs",
@@ -733,18 +1101,208 @@ def download_and_process(
         "cors_obs",
     ]:
         fname = f"{conf.cache_dir}/{cache_folder}/{path_name}"
-        if os.path.exists(fname):
-            return date, station, fname
+        # entries from another cache version are decoded again, into the same place
+        if _is_processed(fname):
+            return fname
+    return None
+
+
+def _is_processed(path: str) -> bool:
+    """
+    Whether a path is a station-day cached the way we would cache it now
+
+    Args:
+        path: the path to check
+
+    Returns:
+        True iff the path is a current station-day sidecar
+    """
+    return cache.is_station_day(path, numpy.dtype(DENSE_TYPE))
+
+
+def fetch_station_day(argtuple: Tuple[GPSTime, str, bool]) -> Optional[str]:
+    """
+    Fetch the data for a station at a date. This is the network bound half of
+    download_and_process, and is safe to run on threads.
+
+    Args:
+        argtuple: the date and station for which we want the data, and whether to get partial data
+
+    Returns:
+        the path to the cached station-day if there is one, otherwise the path to the
+        raw RINEX file, or None if it can't be retrieved (or recently couldn't be)
+    """
+    date, station, partial = argtuple
+
+    processed = _processed_path(date, station, partial)
+    if processed is not None:
+        return processed
+
+    char_code = char_code_for_partial(date) if partial else "0"
+    network = STATION_NETWORKS.get(station, "default")
+    key = f"{network}/{station}/" + date.as_datetime().strftime(f"%Y/%j{char_code}")
+    failure = unavailable.check(key, date.as_datetime())
+    if failure is not None:
+        LOG.debug("skipping %s, unavailable: %s", key, failure["error"])
+        return None
+
+    # other jobs may want it too: the first one fetches it, the rest wait
+    lock_path = os.path.join(conf.cache_dir, cache.LOCKS_DIR, key + cache.LOCK_SUFFIX)
+    with cache.single_flight(lock_path):
+        processed = _processed_path(date, station, partial)
+        if processed is not None:
+            return processed
+        failure = unavailable.check(key, date.as_datetime())
+        if failure is not None:
+            return None
+
+        try:
+            rinex_obs_file = fetch_rinex_for_station(
+                None, date, station, partial=partial
+            )
+        except (DownloadError, NotImplementedError) as err:
+            unavailable.record(key, date.as_datetime(), repr(err))
+            raise
+        except Exception as err:
+            # could be a temporary problem (eg mirrors.FetchError), so don't
+            # remember it for long
+            unavailable.record(key, date.as_datetime(), repr(err), missing=False)
+            raise
+
+        if rinex_obs_file is None:
+            unavailable.record(key, date.as_datetime(), "not found")
+    if rinex_obs_file is not None and _is_processed(
+        cache.station_day_path(rinex_obs_file)
+    ):
+        return cache.station_day_path(rinex_obs_file)
+    return rinex_obs_file
 
-    rinex_obs_file = fetch_rinex_for_station(None, date, station, partial=partial)
-    if rinex_obs_file is not None:
-        if os.path.exists(rinex_obs_file + ".nc"):
-            return date, station, rinex_obs_file + ".nc"
-        rinex = georinex.load(rinex_obs_file, interval=30, use=["G", "R"], fast=False)
-        rinex["time"] = rinex.time.astype(numpy.datetime64)
-        rinex.to_netcdf(rinex_obs_file + ".nc")
-        return date, station, rinex_obs_file + ".nc"
-    return date, station, None
+
+def _day_start(times: numpy.ndarray) -> numpy.datetime64:
+    """
+    The midnight at the start of the first of some times
+
+    Args:
+        times: numpy array of numpy.datetime64
+
+    Returns:
+        the start of the day, or the GPS epoch if there were no times
+    """
+    if len(times) == 0:
+        return numpy.datetime64("1980-01-06", "ns")
+    return times.min().astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def decode_rinex(rinex_obs_file: str) -> str:
+    """
+    Convert a raw RINEX file into its processed form, and cache it.
+    This is the CPU bound half of download_and_process.
+
+    Args:
+        rinex_obs_file: path to the raw RINEX observation file
+
+    Returns:
+        the path to the cached station-day
+    """
+    path = cache.station_day_path(rinex_obs_file)
+    # other jobs may be decoding the same file
+    with cache.single_flight(rinex_obs_file + cache.LOCK_SUFFIX):
+        if not _is_processed(path):
+            _decode_rinex(rinex_obs_file, path)
+    return path
+
+
+def _decode_rinex(rinex_obs_file: str, path: str) -> None:
+    """
+    Convert a raw RINEX file into its processed form, and cache it
+
+    Args:
+        rinex_obs_file: path to the raw RINEX observation file
+        path: where to cache it, from cache.station_day_path
+    """
+    try:
+        obs = rinex.read_obs(rinex_obs_file, interval=util.DATA_RATE)
+        epoch = _day_start(obs.times)
+        data = from_rinex(
+            obs, GPSTime.from_datetime(epoch.astype("datetime64[us]").item())
+        )
+        position, glonass_slots = obs.position, obs.glonass_slots
+    except ValueError:
+        # georinex is much slower, but copes with more unusual files
+        LOG.info("falling back to georinex for %s", rinex_obs_file)
+        rinex_data = georinex.load(
+            rinex_obs_file, interval=30, use=["G", "R"], fast=False
+        )
+        rinex_data["time"] = rinex_data.time.astype(numpy.datetime64)
+        epoch = _day_start(rinex_data.time.to_numpy())
+        data = from_xarray(
+            rinex_data, GPSTime.from_datetime(epoch.astype("datetime64[us]").item())
+        )
+        position, glonass_slots = rinex_data.attrs.get("position"), {}
+
+    cache.write_station_day(path, data, epoch, position, glonass_slots)
+
+
+def download_and_process(
+    argtuple: Tuple[GPSTime, str, bool]
+) -> Tuple[GPSTime, str, Optional[str]]:
+    """
+    Fetch the data for a station at a date, return a path to the cached,
+    processed version of it
+
+    Args:
+        argtuple: the date and station for which we want the data, and whether to get partial data
+
+    Returns:
+        date requested, station requested, and the path to the cached station-day,
+        or None if it can't be retrieved
+    """
+    date, station, _ = argtuple
+
+    path = fetch_station_day(argtuple)
+    if path is not None and not _is_processed(path):
+        path = decode_rinex(path)
+    return date, station, path
+
+
+def _load_station_chunks(
+    results: Sequence[Optional[str]], start_date: GPSTime
+) -> Tuple[Optional[types.ECEF_XYZ], Optional[types.DenseMeasurements]]:
+    """
+    Read back and combine the processed chunks (days or hours) for a station
+
+    Args:
+        results: the cached station-day paths in time order, None where missing
+        start_date: when tick 0 occurs
+
+    Returns:
+        the station location if known, and its measurements if there are any
+    """
+    position = None
+    accumulator = DenseAccumulator()
+    for result in results:
+        if result is None:
+            continue
+
+        station_day = cache.read_station_day(result, numpy.dtype(DENSE_TYPE))
+        if station_day is None:
+            LOG.warning("unreadable cache entry %s", result)
+            continue
+        if position is None:
+            position = station_day.position
+
+        # cached ticks count from the start of the file's day, not ours
+        tick_offset = int(
+            (station_day.epoch - numpy.datetime64(start_date.as_datetime()))
+            / numpy.timedelta64(util.DATA_RATE, "s")
+        )
+        for observations in station_day.data.values():
+            observations["tick"] += tick_offset
+        accumulator.add(station_day.data)
+
+    if not accumulator:
+        return position, None
+    return position, accumulator.merged()
 
 
 def parallel_populate_data(
@@ -752,20 +1310,27 @@ def parallel_populate_data(
     start_date: GPSTime,
     duration: timedelta,
     dog: AstroDog,
-) -> Tuple[Dict[str, types.ECEF_XYZ], types.StationPrnMap[types.Observations]]:
+    progress: Optional[scheduler.ProgressCallback] = None,
+) -> Tuple[
+    Dict[str, types.ECEF_XYZ],
+    types.StationPrnMap[types.Observations],
+    orbits.OrbitTable,
+]:
     """
-    Download/populate the station data and station location info
+    Download/populate the station data and station location info.
+    The satellite orbits are worked out while the downloads run, and each
+    station is finished off as soon as all of its data has arrived.
 
     Args:
         stations: list of station names
         date_list: ordered list of the dates for which to fetch data
-        dog: astro dog to use
+        dog: astro dog to use, only from the orbit thread
+        progress: called with the download totals each time a station-day finishes
 
     Returns:
         dictionary of station names to their locations,
-        dictionary of station names to sat names to their dense data
-
-    TODO: is this a good place to be caching results?
+        dictionary of station names to sat names to their dense data,
+        the satellite orbits at each tick
     """
 
     # dict of station names -> XYZ ECEF locations in meters
@@ -776,56 +1341,75 @@ def parallel_populate_data(
     # if we want < 1 day of data, get preliminary stuff
     partial = duration.days < 1
 
-    to_download = []
-    for station in stations:
-        gps_date = start_date
-        while gps_date < start_date + duration.total_seconds():
-            to_download.append((gps_date, station, partial))
-            if partial:
-                gps_date += (1 * util.HOURS).total_seconds()
-            else:
-                gps_date += (1 * util.DAYS).total_seconds()
-
-    with multiprocessing.Pool(DOWNLOAD_WORKERS) as pool:
-        download_res = pool.map(download_and_process, to_download)
-
-    downloaded_map = {
-        # break it up like this to deal with GPSTime not being hashable
-        (start_date.week, start_date.tow, station): result
-        for start_date, station, result in download_res
+    dates = []
+    gps_date = start_date
+    while gps_date < start_date + duration.total_seconds():
+        dates.append(gps_date)
+        if partial:
+            gps_date += (1 * util.HOURS).total_seconds()
+        else:
+            gps_date += (1 * util.DAYS).total_seconds()
+    # break it up like this to deal with GPSTime not being hashable
+    date_idx = {(date.week, date.tow): i for i, date in enumerate(dates)}
+
+    stations = list(stations)
+    to_download = [(date, station, partial) for station in stations for date in dates]
+    if not partial:
+        # the Korean server can give us all of a day's stations at once
+        korean = [s for s in stations if STATION_NETWORKS.get(s) == "Korea"]
+        for date in dates:
+            korean_batches.plan(date, korean)
+    results: Dict[str, List[Optional[str]]] = {
+        station: [None] * len(dates) for station in stations
     }
+    remaining = {station: len(dates) for station in stations}
+    # stations that finished before the orbits were ready
+    unchecked: List[str] = []
 
-    for station in stations:
-        gps_date = start_date
-        while gps_date < start_date + duration.total_seconds():
-            result = downloaded_map.get((gps_date.week, gps_date.tow, station))
-            if partial:
-                gps_date += (1 * util.HOURS).total_seconds()
-            else:
-                gps_date += (1 * util.DAYS).total_seconds()
+    # the orbits only depend on the time range, so work them out in the meantime
+    with concurrent.futures.ThreadPoolExecutor(1) as orbit_pool:
+        orbit_future = orbit_pool.submit(build_orbit_table, dog, start_date, duration)
 
-            if result is None:
+        download_scheduler = scheduler.DownloadScheduler(
+            max_in_flight=conf.downloads.get("max_in_flight", scheduler.MAX_IN_FLIGHT)
+        )
+        for (date, station, _), result in download_scheduler.stream(
+            to_download,
+            fetch_station_day,
+            decode_rinex,
+            _is_processed,
+            progress=progress,
+        ):
+            results[station][date_idx[(date.week, date.tow)]] = result
+            remaining[station] -= 1
+            if remaining[station] > 0:
                 continue
 
-            latest_data = xarray.load_dataset(result)
-            if station not in station_locs:
-                station_locs[station] = latest_data.position
-
-            dense_data = from_xarray(latest_data, start_date)
-            if station not in station_data:
-                station_data[station] = dense_data
-            else:
-                # we've already got some data, so merge it together
-                # give mypy a hint here about our type aliases
-                station_data[station] = merge_data(
-                    cast(types.DenseMeasurements, station_data[station]),
-                    dense_data,
-                )
-
-        # didn't download data, ignore it
-        if station not in station_data:
-            continue
-
-    populate_sat_info(dog, start_date, duration, station_data)
+            position, dense_data = _load_station_chunks(
+                results.pop(station), start_date
+            )
+            if position is not None:
+                station_locs[station] = position
+            # didn't download data, ignore it
+            if dense_data is None:
+                continue
+            station_data[station] = dense_data
+            unchecked.append(station)
+
+            if orbit_future.done():
+                for done_station in unchecked:
+                    drop_unknown_orbits(
+                        orbit_future.result(),
+                        done_station,
+                        cast(types.DenseMeasurements, station_data[done_station]),
+                    )
+                unchecked.clear()
+
+        orbit_table = orbit_future.result()
+
+    for station in unchecked:
+        drop_unknown_orbits(
+            orbit_table, station, cast(types.DenseMeasurements, station_data[station])
+        )
 
-    return station_locs, station_data
+    return station_locs, station_data, orbit_table
@@ -0,0 +1,270 @@
+"""
+Directory listings of the archives we download from.
+
+One listing of a day's directory tells us about every station at once, so
+rather than asking an archive for each station in turn (and waiting for each
+"not found"), we fetch the listing once, remember which files it has, and only
+ask for files that are there.
+
+Listings are cached on disk. Listings of old days don't change, listings of
+recent days are fetched again as new files get posted.
+"""
+from datetime import datetime
+import ftplib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+from atomicwrites import atomic_write
+
+from tid import cache, config, scheduler
+
+LOG = logging.getLogger(__name__)
+
+# filename (or directory name, without the trailing "/") to size in bytes,
+# if the listing gave one
+Listing = Dict[str, Optional[int]]
+
+LISTINGS_DIR = "listings"
+
+# human readable sizes, as in Apache's directory indexes
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+_HTML_ENTRY = re.compile(
+    r'<a href="(?P<href>[^"?/][^"]*)">[^<]*</a>\s*'
+    r"(?:\d{2}-\w{3}-\d{4} \d{2}:\d{2}|\d{4}-\d{2}-\d{2} \d{2}:\d{2})?(?::\d{2})?\s*"
+    r"(?P<size>\d+(?:\.\d+)?[KMG]?)?",
+    re.IGNORECASE,
+)
+_OTHER_TAGS = re.compile(r"<(?!/?a[\s>])[^>]*>", re.IGNORECASE)
+
+conf = config.Configuration()
+
+
+def _parse_size(size: Optional[str]) -> Optional[int]:
+    if not size:
+        return None
+    unit = size[-1].upper() if size[-1].isalpha() else ""
+    number = size[:-1] if unit else size
+    return int(float(number) * _SIZE_UNITS[unit])
+
+
+def parse_html(text: str) -> Listing:
+    """
+    Parse an HTML directory index, as served by Apache or nginx (NOAA CORS,
+    the Japanese GR_2.11 tree)
+
+    Args:
+        text: the HTML
+
+    Returns:
+        the entries of the directory
+    """
+    # table style indexes put each column in its own cell
+    text = _OTHER_TAGS.sub(" ", text)
+    listing: Listing = {}
+    for match in _HTML_ENTRY.finditer(text):
+        href = match.group("href")
+        if "://" in href or href.startswith("#"):
+            continue
+        if href.endswith("/"):
+            listing[href.rstrip("/")] = None
+        else:
+            listing[href] = _parse_size(match.group("size"))
+    return listing
+
+
+def parse_cddis(text: str) -> Listing:
+    """
+    Parse a CDDIS archive listing (what you get by adding "*?list" to a
+    directory URL): one "filename size" per line
+
+    Args:
+        text: the listing
+
+    Returns:
+        the entries of the directory
+    """
+    listing: Listing = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or line.startswith("#"):
+            continue
+        size = fields[1] if len(fields) > 1 and fields[1].isdigit() else None
+        listing[fields[0]] = int(size) if size is not None else None
+    return listing
+
+
+def parse_ftp(lines: Iterable[str]) -> Listing:
+    """
+    Parse the response to an FTP LIST command, as given by unix-like servers
+    (garner)
+
+    Args:
+        lines: the lines of the response
+
+    Returns:
+        the entries of the directory
+    """
+    listing: Listing = {}
+    for line in lines:
+        fields = line.split(None, 8)
+        if len(fields) < 9 or line.startswith("total"):
+            continue
+        name = fields[8].strip()
+        if name in (".", ".."):
+            continue
+        if line.startswith("l"):
+            name = name.split(" -> ")[0]
+        if line.startswith("d"):
+            listing[name] = None
+        else:
+            listing[name] = int(fields[4]) if fields[4].isdigit() else None
+    return listing
+
+
+def _fetch(url: str) -> Listing:
+    """
+    Fetch and parse a directory listing
+
+    Args:
+        url: the directory
+
+    Returns:
+        the entries of the directory
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "ftp":
+        lines = []
+        ftp = ftplib.FTP(timeout=60)
+        try:
+            ftp.connect(parsed.hostname, parsed.port or ftplib.FTP_PORT)
+            ftp.login()
+            ftp.retrlines(f"LIST {parsed.path}", lines.append)
+        finally:
+            ftp.close()
+        return parse_ftp(lines)
+
+    if "cddis" in parsed.netloc:
+        resp = scheduler.session().get(url + "*?list", timeout=60)
+        resp.raise_for_status()
+        return parse_cddis(resp.text)
+
+    resp = scheduler.session().get(url, timeout=60)
+    resp.raise_for_status()
+    return parse_html(resp.text)
+
+
+class ListingIndex:
+    """
+    Listings of archive directories, each fetched at most once per refresh
+    and shared between threads
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        """
+        Args:
+            cache_dir: where to keep the fetched listings
+        """
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        # url to when we fetched it and what we got (None if that failed)
+        self._listings: Dict[str, Tuple[datetime, Optional[Listing]]] = {}
+
+    def _path(self, url: str) -> str:
+        parsed = urlparse(url)
+        return os.path.join(
+            self.cache_dir,
+            LISTINGS_DIR,
+            parsed.netloc.replace(":", "_"),
+            parsed.path.strip("/") + ".json",
+        )
+
+    def _load(self, url: str) -> Optional[Tuple[datetime, Listing]]:
+        """
+        Get a listing from the disk cache, and when it was fetched
+        """
+        try:
+            with open(self._path(url), encoding="utf-8") as fin:
+                cached = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        return datetime.fromisoformat(cached["fetched"]), cached["files"]
+
+    def _save(self, url: str, listing: Listing, now: datetime) -> None:
+        path = self._path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write(path, mode="w", overwrite=True, encoding="utf-8") as fout:
+                json.dump({"fetched": now.isoformat(), "files": listing}, fout)
+        except OSError:
+            LOG.warning("could not cache listing of %s", url)
+
+    def get(
+        self, host: str, url: str, date: datetime, now: Optional[datetime] = None
+    ) -> Optional[Listing]:
+        """
+        Get the listing of an archive directory
+
+        Args:
+            host: the request slot to use, one of the keys of scheduler.HOST_LIMITS
+            url: the directory, ending with "/"
+            date: the day the directory holds data for
+            now: the current time, defaults to datetime.utcnow()
+
+        Returns:
+            the entries of the directory, or None if we couldn't get a listing
+        """
+        if now is None:
+            now = datetime.utcnow()
+        with self._lock:
+            key_lock = self._key_locks.setdefault(url, threading.Lock())
+
+        # one thread fetches, the rest wait for it
+        with key_lock:
+            known: Optional[Tuple[datetime, Optional[Listing]]]
+            known = self._listings.get(url)
+            if known is None:
+                known = self._load(url)
+            # a listing goes stale as quickly as a "not found" would
+            if known is not None and now - known[0] < cache.unavailable_ttl(
+                known[0] - date, missing=known[1] is not None
+            ):
+                self._listings[url] = known
+                return known[1]
+
+            listing: Optional[Listing] = None
+            try:
+                with scheduler.host_slot(host):
+                    listing = _fetch(url)
+            # all we lose is not knowing what's there
+            # pylint: disable=broad-except
+            except Exception as err:
+                LOG.info("could not list %s: %r", url, err)
+            else:
+                self._save(url, listing, now)
+            self._listings[url] = (now, listing)
+            return listing
+
+    def has(self, host: str, url: str, name: str, date: datetime) -> bool:
+        """
+        Check whether an archive directory might have a file
+
+        Args:
+            host: the request slot to use, one of the keys of scheduler.HOST_LIMITS
+            url: the directory, ending with "/"
+            name: the file (or subdirectory) we want
+            date: the day the directory holds data for
+
+        Returns:
+            False if the directory's listing says it doesn't have it, otherwise True
+        """
+        listing = self.get(host, url, date)
+        return listing is None or name in listing
+
+
+index = ListingIndex(conf.cache_dir)
@@ -0,0 +1,311 @@
+"""
+Fetching a file that several mirrors might have.
+
+Rather than trying each mirror in turn (and sitting through each one's failure
+or timeout), we start with the mirror that has been fastest and most reliable so
+far and, if it hasn't come back after a short delay, start the next one as well.
+The first valid response wins and the others are abandoned.
+
+How each mirror does is remembered between runs, so the ordering improves.
+"""
+import concurrent.futures
+import ftplib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from urllib.parse import urlparse
+
+from atomicwrites import atomic_write
+import hatanaka
+import requests
+
+from tid import config, scheduler
+
+LOG = logging.getLogger(__name__)
+
+STAGGER = 2.0  # seconds to give a mirror before also trying the next one
+TIMEOUT = 60  # seconds without any data before giving up on a mirror
+CHUNK_SIZE = 1 << 16
+
+STATS_FILE = "mirror_stats.json"
+DEFAULT_LATENCY = 5.0  # assumed seconds per fetch for mirrors we haven't used
+LATENCY_WEIGHT = 0.2  # how much each new fetch moves the latency estimate
+
+conf = config.Configuration()
+
+
+class Mirror(NamedTuple):
+    """
+    One place a file might be found
+    """
+
+    host: str  # request slot to use, one of the keys of scheduler.HOST_LIMITS
+    url: str  # full URL of the (possibly compressed) file
+
+
+class _Cancelled(Exception):
+    """
+    Another mirror already won, stop downloading
+    """
+
+
+class FetchError(Exception):
+    """
+    A mirror failed for a reason other than not having the file (a timeout,
+    a server error, an error page instead of RINEX...), so it may yet have it
+    """
+
+
+def _is_missing(err: Exception) -> bool:
+    """
+    Whether a download failed because the mirror really doesn't have the file
+
+    Args:
+        err: what the download raised
+
+    Returns:
+        True for an HTTP 404 or an FTP 550, False for anything else
+    """
+    if isinstance(err, requests.HTTPError):
+        return err.response is not None and err.response.status_code == 404
+    if isinstance(err, ftplib.error_perm):
+        return str(err).startswith("550")
+    return False
+
+
+class MirrorStats:
+    """
+    Latency and reliability of each mirror server, persisted between runs
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: the JSON file in which the statistics are kept
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as fin:
+                self.servers: Dict[str, Dict[str, float]] = json.load(fin)
+        except (OSError, ValueError):
+            self.servers = {}
+
+    def expected_time(self, server: str) -> float:
+        """
+        How long we expect to wait for a file from a server, failures included
+
+        Args:
+            server: the server's network location, eg "cddis.nasa.gov"
+
+        Returns:
+            the expected seconds
+        """
+        stats = self.servers.get(server, {})
+        latency = stats.get("latency", DEFAULT_LATENCY)
+        # Laplace smoothed success rate, so one failure isn't fatal
+        success_rate = (stats.get("successes", 0) + 1) / (stats.get("attempts", 0) + 2)
+        return latency / success_rate
+
+    def order(self, mirrors: Sequence[Mirror]) -> List[Mirror]:
+        """
+        Put mirrors in the order they should be tried
+
+        Args:
+            mirrors: the mirrors, in our default order of preference
+
+        Returns:
+            the mirrors, best first (ties keep their default order)
+        """
+        with self._lock:
+            return sorted(
+                mirrors,
+                key=lambda mirror: self.expected_time(urlparse(mirror.url).netloc),
+            )
+
+    def update(self, server: str, latency: Optional[float]) -> None:
+        """
+        Record how a fetch went, and save the statistics
+
+        Args:
+            server: the server's network location
+            latency: seconds the fetch took, or None if it failed
+        """
+        with self._lock:
+            stats = self.servers.setdefault(
+                server, {"latency": DEFAULT_LATENCY, "attempts": 0, "successes": 0}
+            )
+            stats["attempts"] += 1
+            if latency is not None:
+                stats["successes"] += 1
+                stats["latency"] += LATENCY_WEIGHT * (latency - stats["latency"])
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with atomic_write(
+                    self.path, mode="w", overwrite=True, encoding="utf-8"
+                ) as fout:
+                    json.dump(self.servers, fout)
+            except OSError:
+                LOG.warning("could not save mirror statistics to %s", self.path)
+
+
+stats = MirrorStats(os.path.join(conf.cache_dir, STATS_FILE))
+
+
+def _download_http(url: str, cancel: threading.Event) -> bytes:
+    """
+    Download over HTTP(S), using ~/.netrc credentials if the server wants them
+
+    Args:
+        url: what to download
+        cancel: set when we should stop
+
+    Returns:
+        the content
+    """
+    chunks = []
+    with scheduler.session().get(url, stream=True, timeout=(10, TIMEOUT)) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            if cancel.is_set():
+                raise _Cancelled
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _download_ftp(url: str, cancel: threading.Event) -> bytes:
+    """
+    Download over FTP (FTP over TLS for CDDIS, which requires it)
+
+    Args:
+        url: what to download
+        cancel: set when we should stop
+
+    Returns:
+        the content
+    """
+    parsed = urlparse(url)
+    chunks = []
+
+    def receive(chunk: bytes) -> None:
+        if cancel.is_set():
+            raise _Cancelled
+        chunks.append(chunk)
+
+    if "cddis" in parsed.netloc:
+        ftp: ftplib.FTP = ftplib.FTP_TLS(timeout=TIMEOUT)
+    else:
+        ftp = ftplib.FTP(timeout=TIMEOUT)
+    try:
+        ftp.connect(parsed.hostname, parsed.port or ftplib.FTP_PORT)
+        ftp.login()
+        if isinstance(ftp, ftplib.FTP_TLS):
+            ftp.prot_p()
+        ftp.retrbinary(f"RETR {parsed.path}", receive, blocksize=CHUNK_SIZE)
+    finally:
+        ftp.close()
+    return b"".join(chunks)
+
+
+def _attempt(mirror: Mirror, cancel: threading.Event) -> Optional[bytes]:
+    """
+    Try to get a RINEX file from one mirror
+
+    Args:
+        mirror: where to get it from
+        cancel: set when we should stop
+
+    Returns:
+        the decompressed RINEX content, or None if this mirror doesn't have
+        the file (or another mirror won)
+
+    Raises:
+        FetchError if this mirror failed in some other way
+    """
+    server = urlparse(mirror.url).netloc
+    download = _download_ftp if mirror.url.startswith("ftp") else _download_http
+    try:
+        with scheduler.host_slot(mirror.host):
+            if cancel.is_set():
+                return None
+            start = time.monotonic()
+            raw = download(mirror.url, cancel)
+            elapsed = time.monotonic() - start
+        # also checks that it really is RINEX (eg not an HTML error page)
+        content = hatanaka.decompress(raw)
+        if b"RINEX VERSION / TYPE" not in content[:1024]:
+            raise ValueError("not a RINEX file")
+    except _Cancelled:
+        return None
+    # whatever went wrong, we'll try the other mirrors
+    # pylint: disable=broad-except
+    except Exception as err:
+        LOG.debug("failed to fetch %s: %r", mirror.url, err)
+        stats.update(server, None)
+        if _is_missing(err):
+            return None
+        raise FetchError(f"{mirror.url}: {err!r}") from err
+
+    stats.update(server, elapsed)
+    return content
+
+
+def fetch_first(
+    mirrors: Sequence[Mirror], dest: str, stagger: float = STAGGER
+) -> Optional[str]:
+    """
+    Get a RINEX file from whichever mirror gives it to us first, and cache it
+
+    Args:
+        mirrors: where it might be, in our default order of preference
+        dest: where to save the decompressed file
+        stagger: seconds to wait for a mirror before also trying the next one
+
+    Returns:
+        dest, or None if every mirror said it doesn't have the file
+
+    Raises:
+        FetchError if no mirror gave us the file and some failed in a way
+        that doesn't tell us whether they have it
+    """
+    if os.path.isfile(dest):
+        return dest
+
+    remaining = stats.order(mirrors)
+    cancel = threading.Event()
+    content = None
+    errors: List[FetchError] = []
+    with concurrent.futures.ThreadPoolExecutor(max(len(remaining), 1)) as pool:
+        pending: Dict[concurrent.futures.Future, Mirror] = {}
+        while content is None and (remaining or pending):
+            if remaining:
+                mirror = remaining.pop(0)
+                pending[pool.submit(_attempt, mirror, cancel)] = mirror
+            done, _ = concurrent.futures.wait(
+                pending,
+                timeout=stagger if remaining else None,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                del pending[future]
+                try:
+                    result = future.result()
+                except FetchError as err:
+                    errors.append(err)
+                    continue
+                if content is None:
+                    content = result
+        # tell the stragglers to give up
+        cancel.set()
+
+    if content is None:
+        if errors:
+            raise FetchError("; ".join(str(err) for err in errors))
+        return None
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with atomic_write(dest, mode="wb", overwrite=True) as fout:
+        fout.write(content)
+    return dest
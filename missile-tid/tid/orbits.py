@@ -0,0 +1,443 @@
+"""
+Satellite orbit interpolation.
+
+Evaluating ephemerides through laika is slow: one call per time, and each call
+works through every satellite. Orbits are very smooth though, so instead we
+sample all satellites at a handful of Chebyshev nodes in each segment of the
+day, fit polynomials once, and then evaluate positions and velocities for any
+number of times in a single vectorized call.
+
+Fitted coefficients are cached on disk per (GPS) day, so later scenarios for the
+same day don't need to touch the ephemerides at all.
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from atomicwrites import atomic_write
+import numpy
+from numpy.polynomial import chebyshev
+
+from laika.constants import SECS_IN_DAY, SPEED_OF_LIGHT
+from laika.gps_time import GPSTime
+
+from tid import util
+
+LOG = logging.getLogger(__name__)
+
+SEGMENT_SECONDS = 3600  # each polynomial covers this much time
+SEGMENTS_PER_DAY = SECS_IN_DAY // SEGMENT_SECONDS
+DEGREE = 10  # polynomial degree, mm level agreement for GPS and GLONASS orbits
+# ephemerides for recent days are still being refined, don't persist those fits
+FINAL_AFTER = timedelta(days=2)
+
+SatInfoFunc = Callable[[GPSTime], Dict[str, Tuple[numpy.ndarray, ...]]]
+
+
+def _day_start(time: GPSTime) -> GPSTime:
+    """
+    Start of the GPS day containing a time
+
+    Args:
+        time: the time of interest
+
+    Returns:
+        GPSTime at midnight (GPS time) of that day
+    """
+    return GPSTime(time.week, time.tow - time.tow % SECS_IN_DAY)
+
+
+def _chebval(x: numpy.ndarray, coeffs: numpy.ndarray) -> numpy.ndarray:
+    """
+    Evaluate a different Chebyshev series at each point (Clenshaw's method)
+
+    Args:
+        x: points, scaled to [-1, 1], shape (n,)
+        coeffs: series coefficients for each point, shape (n, DEGREE + 1, 3)
+
+    Returns:
+        the values, shape (n, 3)
+    """
+    x = x[:, numpy.newaxis]
+    b_1 = numpy.zeros((len(x), 3))
+    b_2 = numpy.zeros((len(x), 3))
+    for k in range(coeffs.shape[1] - 1, 0, -1):
+        b_1, b_2 = 2 * x * b_1 - b_2 + coeffs[:, k], b_1
+    return x * b_1 - b_2 + coeffs[:, 0]
+
+
+class ChebyshevOrbits:
+    """
+    Piecewise Chebyshev interpolants of the satellite orbits over a time span
+    """
+
+    def __init__(
+        self, epoch: GPSTime, prns: Sequence[str], coeffs: numpy.ndarray
+    ) -> None:
+        """
+        Args:
+            epoch: start of the first segment
+            prns: the satellites, in the order of coeffs
+            coeffs: ECEF XYZ coefficients in meters for each satellite and segment,
+                shape (len(prns), segments, DEGREE + 1, 3), NaN where unknown
+        """
+        self.epoch = epoch
+        self.prns = {prn: idx for idx, prn in enumerate(prns)}
+        self.coeffs = coeffs
+        # d/dt of the series, in meters per second
+        self.vel_coeffs = numpy.zeros_like(coeffs)
+        self.vel_coeffs[:, :, :-1] = chebyshev.chebder(
+            coeffs, axis=2, scl=2 / SEGMENT_SECONDS
+        )
+
+    def __contains__(self, prn: str) -> bool:
+        return prn in self.prns
+
+    def _locate(self, seconds: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Find the segment and scaled time for each time
+
+        Args:
+            seconds: seconds since self.epoch
+
+        Returns:
+            segment index and the time scaled to [-1, 1] within that segment
+        """
+        seconds = numpy.asarray(seconds, dtype=float)
+        # times a little outside the span (eg from light time) extrapolate the ends
+        segment = numpy.clip(
+            (seconds // SEGMENT_SECONDS).astype(int), 0, self.coeffs.shape[1] - 1
+        )
+        scaled = 2 * (seconds - segment * SEGMENT_SECONDS) / SEGMENT_SECONDS - 1
+        return segment, scaled
+
+    def position(self, prn: str, seconds: numpy.ndarray) -> numpy.ndarray:
+        """
+        Satellite positions at arbitrary times
+
+        Args:
+            prn: the satellite of interest
+            seconds: seconds since self.epoch, shape (n,)
+
+        Returns:
+            ECEF XYZ positions in meters, shape (n, 3), NaN where unknown
+        """
+        segment, scaled = self._locate(seconds)
+        return _chebval(scaled, self.coeffs[self.prns[prn]][segment])
+
+    def velocity(self, prn: str, seconds: numpy.ndarray) -> numpy.ndarray:
+        """
+        Satellite velocities at arbitrary times
+
+        Args:
+            prn: the satellite of interest
+            seconds: seconds since self.epoch, shape (n,)
+
+        Returns:
+            ECEF XYZ velocities in meters per second, shape (n, 3), NaN where unknown
+        """
+        segment, scaled = self._locate(seconds)
+        return _chebval(scaled, self.vel_coeffs[self.prns[prn]][segment])
+
+    @classmethod
+    def build(
+        cls,
+        sat_info: SatInfoFunc,
+        start_time: GPSTime,
+        duration: timedelta,
+        cache_dir: str,
+    ) -> "ChebyshevOrbits":
+        """
+        Fit (or load from cache) interpolants covering a span of time
+
+        Args:
+            sat_info: function giving dog.get_all_sat_info style results for a time
+            start_time: start of the span
+            duration: length of the span
+            cache_dir: directory in which fitted days are cached
+
+        Returns:
+            interpolants covering at least [start_time, start_time + duration]
+        """
+        epoch = _day_start(start_time)
+        first = int((start_time - epoch) // SEGMENT_SECONDS)
+        last = int((start_time + duration.total_seconds() - epoch) // SEGMENT_SECONDS)
+
+        days = []
+        day = epoch
+        while day - epoch <= last * SEGMENT_SECONDS:
+            day_first = max(first - (day - epoch) // SEGMENT_SECONDS, 0)
+            day_last = min(
+                last - (day - epoch) // SEGMENT_SECONDS, SEGMENTS_PER_DAY - 1
+            )
+            days.append(
+                _OrbitDay.load(cache_dir, day).fit(
+                    sat_info, range(int(day_first), int(day_last) + 1)
+                )
+            )
+            day += SECS_IN_DAY
+
+        prns = sorted(set().union(*(day.prns for day in days)))
+        coeffs = numpy.full(
+            (len(prns), len(days) * SEGMENTS_PER_DAY, DEGREE + 1, 3), numpy.nan
+        )
+        for i, orbit_day in enumerate(days):
+            rows = [prns.index(prn) for prn in orbit_day.prns]
+            coeffs[
+                rows, i * SEGMENTS_PER_DAY : (i + 1) * SEGMENTS_PER_DAY
+            ] = orbit_day.coeffs
+        return cls(epoch, prns, coeffs)
+
+
+class _OrbitDay:
+    """
+    The fitted segments for one GPS day, as stored on disk
+    """
+
+    def __init__(self, path: str, day: GPSTime) -> None:
+        self.path = path
+        self.day = day
+        self.prns: List[str] = []
+        self.coeffs = numpy.zeros((0, SEGMENTS_PER_DAY, DEGREE + 1, 3))
+        self.fitted = numpy.zeros(SEGMENTS_PER_DAY, dtype=bool)
+
+    @classmethod
+    def load(cls, cache_dir: str, day: GPSTime) -> "_OrbitDay":
+        """
+        Load whatever has already been fitted for a day
+
+        Args:
+            cache_dir: directory in which fitted days are cached
+            day: start of the GPS day
+
+        Returns:
+            the fitted day, possibly with nothing fitted yet
+        """
+        path = os.path.join(cache_dir, day.as_datetime().strftime("%Y/%j.npz"))
+        orbit_day = cls(path, day)
+        try:
+            with numpy.load(path) as cached:
+                if cached["coeffs"].shape[1:] == orbit_day.coeffs.shape[1:]:
+                    orbit_day.prns = list(cached["prns"])
+                    orbit_day.coeffs = cached["coeffs"]
+                    orbit_day.fitted = cached["fitted"]
+        except (OSError, KeyError, ValueError):
+            pass
+        return orbit_day
+
+    def fit(self, sat_info: SatInfoFunc, segments: Sequence[int]) -> "_OrbitDay":
+        """
+        Fit any of the given segments that aren't fitted yet, saving the results
+
+        Args:
+            sat_info: function giving dog.get_all_sat_info style results for a time
+            segments: the segment indices of interest
+
+        Returns:
+            self, for convenience
+        """
+        todo = [seg for seg in segments if not self.fitted[seg]]
+        if not todo:
+            return self
+        LOG.info("fitting %d orbit segments for %s", len(todo), self.path)
+
+        # Chebyshev nodes on [-1, 1]: sampling there keeps the fit well conditioned
+        nodes = numpy.cos(numpy.pi * (numpy.arange(DEGREE + 1) + 0.5) / (DEGREE + 1))
+        for seg in todo:
+            samples: Dict[str, numpy.ndarray] = {}
+            # whether every node's ephemerides came through
+            complete = True
+            for k, node in enumerate(nodes):
+                time = self.day + SEGMENT_SECONDS * (seg + (node + 1) / 2)
+                infos = sat_info(time)
+                complete = complete and bool(infos)
+                for prn, info in infos.items():
+                    if prn not in samples:
+                        samples[prn] = numpy.full((len(nodes), 3), numpy.nan)
+                    samples[prn][k] = info[0]
+
+            for prn in samples:
+                if prn not in self.prns:
+                    self.prns.append(prn)
+                    self.coeffs = numpy.concatenate(
+                        (
+                            self.coeffs,
+                            numpy.full((1,) + self.coeffs.shape[1:], numpy.nan),
+                        )
+                    )
+            for idx, prn in enumerate(self.prns):
+                if prn not in samples:
+                    self.coeffs[idx, seg] = numpy.nan
+                    continue
+                # missing any node leaves the whole segment NaN (unknown)
+                self.coeffs[idx, seg] = chebyshev.chebfit(nodes, samples[prn], DEGREE)
+                complete = complete and not numpy.isnan(samples[prn]).any()
+            # gaps may just be a failed download, so try again next time
+            # rather than remembering the satellites as unknown for good
+            self.fitted[seg] = complete
+            if not complete:
+                LOG.warning("orbit segment %d of %s has gaps", seg, self.path)
+
+        self._save()
+        return self
+
+    def _save(self) -> None:
+        """
+        Persist the fitted segments, if the ephemerides they came from are final
+        """
+        day_end = self.day + SECS_IN_DAY
+        if datetime.utcnow() - day_end.as_datetime() < FINAL_AFTER:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_write(self.path, mode="wb", overwrite=True) as fout:
+            numpy.savez(
+                fout,
+                prns=numpy.array(self.prns),
+                coeffs=self.coeffs,
+                fitted=self.fitted,
+            )
+
+
+def light_time_positions(
+    pos: numpy.ndarray, vel: numpy.ndarray, pseudoranges: numpy.ndarray
+) -> numpy.ndarray:
+    """
+    Where the satellites were when they sent the signals we received
+
+    Signals take ~70ms to get to us, during which the satellite moves ~250m.
+    Rather than evaluating the Chebyshev fit at the transmission time, we step
+    back along the tabulated velocity: scenarios only keep (and cache, and roll
+    forward) the per-tick table, not the fit. Ignoring the satellite's
+    acceleration (~0.6m/s^2) over that time is off by 0.5 * a * tau^2, a few
+    millimeters, which is far below the pseudorange noise.
+
+    Args:
+        pos: satellite positions at reception time, shape (n, 3)
+        vel: satellite velocities at reception time, shape (n, 3)
+        pseudoranges: the measured pseudoranges in meters, shape (n,)
+
+    Returns:
+        satellite positions at transmission time, shape (n, 3)
+    """
+    return pos - vel * (pseudoranges / SPEED_OF_LIGHT)[:, numpy.newaxis]
+
+
+class OrbitTable:
+    """
+    Position and velocity of every satellite at every tick of a scenario,
+    shared by all of the stations' observations
+    """
+
+    def __init__(
+        self, prns: Sequence[str], pos: numpy.ndarray, vel: numpy.ndarray
+    ) -> None:
+        """
+        Args:
+            prns: the satellites, in the order of pos and vel
+            pos: ECEF XYZ positions in meters, shape (len(prns), ticks, 3)
+            vel: ECEF XYZ velocities in meters per second, shape (len(prns), ticks, 3)
+        """
+        self.prns = {prn: idx for idx, prn in enumerate(prns)}
+        self.pos = pos
+        self.vel = vel
+
+    def __contains__(self, prn: str) -> bool:
+        return prn in self.prns
+
+    @property
+    def tick_count(self) -> int:
+        """
+        Number of ticks the table covers, starting at tick 0
+        """
+        return self.pos.shape[1]
+
+    @classmethod
+    def from_orbits(
+        cls, sat_orbits: ChebyshevOrbits, start_time: GPSTime, tick_count: int
+    ) -> "OrbitTable":
+        """
+        Tabulate interpolated orbits at each tick
+
+        Args:
+            sat_orbits: the orbit interpolants
+            start_time: when the 0th tick occurs
+            tick_count: how many ticks to tabulate
+
+        Returns:
+            the table, NaN where the orbit is unknown
+        """
+        prns = sorted(sat_orbits.prns)
+        seconds = (
+            start_time - sat_orbits.epoch + util.DATA_RATE * numpy.arange(tick_count)
+        )
+        pos = numpy.empty((len(prns), tick_count, 3))
+        vel = numpy.empty((len(prns), tick_count, 3))
+        for i, prn in enumerate(prns):
+            pos[i] = sat_orbits.position(prn, seconds)
+            vel[i] = sat_orbits.velocity(prn, seconds)
+        return cls(prns, pos, vel)
+
+    def rolled(self, evict: int, offset: int, following: "OrbitTable") -> "OrbitTable":
+        """
+        Drop ticks from the start of the table and add a later table to the end,
+        eg to move a live scenario's window along
+
+        Args:
+            evict: how many ticks to drop from the start
+            offset: the tick of ours at which the later table's tick 0 occurs
+            following: the later table
+
+        Returns:
+            the combined table, its tick 0 being our tick `evict`
+        """
+        prns = sorted(set(self.prns) | set(following.prns))
+        kept = offset - evict
+        pos = numpy.full((len(prns), kept + following.tick_count, 3), numpy.nan)
+        vel = numpy.full_like(pos, numpy.nan)
+        for i, prn in enumerate(prns):
+            if prn in self.prns:
+                pos[i, :kept] = self.pos[self.prns[prn], evict:offset]
+                vel[i, :kept] = self.vel[self.prns[prn], evict:offset]
+            if prn in following.prns:
+                pos[i, kept:] = following.pos[following.prns[prn]]
+                vel[i, kept:] = following.vel[following.prns[prn]]
+        return OrbitTable(prns, pos, vel)
+
+    def known(self, prn: str, ticks: numpy.ndarray) -> numpy.ndarray:
+        """
+        Which ticks we have orbit data for
+
+        Args:
+            prn: the satellite of interest
+            ticks: tick numbers
+
+        Returns:
+            boolean mask, same shape as ticks
+        """
+        ticks = numpy.asarray(ticks)
+        in_range = (ticks >= 0) & (ticks < self.tick_count)
+        res = numpy.zeros(ticks.shape, dtype=bool)
+        res[in_range] = numpy.isfinite(self.pos[self.prns[prn], ticks[in_range]]).all(
+            axis=-1
+        )
+        return res
+
+    def sat_pos(
+        self, prn: str, ticks: numpy.ndarray, pseudoranges: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        Light time corrected satellite positions for some observations
+
+        Args:
+            prn: the satellite of interest
+            ticks: the tick of each observation
+            pseudoranges: the C1C pseudorange of each observation, in meters
+
+        Returns:
+            ECEF XYZ positions in meters, shape (len(ticks), 3)
+        """
+        idx = self.prns[prn]
+        return light_time_positions(
+            self.pos[idx, ticks], self.vel[idx, ticks], pseudoranges
+        )
@@ -84,29 +84,32 @@ def plot_map(
         extent = scenario.get_extent()
     axis.set_extent(extent)
 
-    vtec_map, coord_map = scenario.get_vtec_data(raw=raw)
+    table = scenario.connection_table()
+    vtecs = table.vtecs[0] if raw else table.filtered_vtecs()[0]
+
+    # lay every link's data out along the ticks, so each frame is just a column
+    links = table.station * len(table.prns) + table.prn
+    _, link_rows = numpy.unique(links[table.con_ids], return_inverse=True)
+    link_count = int(link_rows.max()) + 1 if len(link_rows) else 0
+    tick_count = int(table.ticks.max()) + 1 if len(table.ticks) else 0
+    link_vtecs = numpy.zeros((link_count, tick_count))
+    link_coords = numpy.zeros((link_count, tick_count, 2))
+    link_valid = numpy.zeros((link_count, tick_count), dtype=bool)
+    link_vtecs[link_rows, table.ticks] = vtecs
+    link_coords[link_rows, table.ticks] = table.latlons
+    link_valid[link_rows, table.ticks] = True
 
     def animate(i):
         title.set_text(str(timedelta(seconds=i * 30) + scenario.start_date) + " UTC")
 
-        lons = []
-        lats = []
-        vals = []
-        for station in vtec_map.keys():
-            for prn in vtec_map[station].keys():
-                if coord_map[station][prn][i] is None:
-                    continue
-
-                lat, lon = coord_map[station][prn][i]
-                lon = lon % 360  # make sure it's positive, cartopy needs that
-                lons.append(lon)
-                lats.append(lat)
-                vals.append(vtec_map[station][prn][i])
+        shown = link_valid[:, i] if i < tick_count else numpy.zeros(link_count, bool)
+        lats, lons = link_coords[shown, i].T
+        lons = lons % 360  # make sure it's positive, cartopy needs that
 
         scatter.set_offsets(numpy.array((lons, lats)).T)
         # scale = (0, 25) if raw else (-TID_SCALE, TID_SCALE)
         scale = (20, 30) if raw else (-TID_SCALE, TID_SCALE)
-        nvals = numpy.array(vals)
+        nvals = link_vtecs[shown, i]
         if len(nvals) > 0:
             # re-center about 0 and clip
             nvals = numpy.clip(nvals - scale[0], 0, scale[1] - scale[0])
@@ -0,0 +1,356 @@
+"""
+Native parser for RINEX 2 observation files.
+
+georinex is thorough but slow: it builds Python objects for every epoch and
+every satellite. We only ever want a handful of observables for GPS and GLONASS,
+and the file format is fixed width, so here everything is pulled out of the
+(memory mapped) file with NumPy gathers instead.
+"""
+import math
+import mmap
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy
+
+import hatanaka
+
+# the observables we care about, in RINEX 2 naming
+OBS_TYPES = ("C1", "C2", "P2", "L1", "L2")
+
+# fixed width layout of RINEX 2 observation records
+SATS_PER_LINE = 12  # satellites listed per epoch line
+OBS_PER_LINE = 5  # observations per record line
+OBS_WIDTH = 16  # F14.3 value, then LLI and signal strength
+VALUE_WIDTH = 14
+DECIMAL_COL = 10  # where the '.' of a F14.3 value sits
+
+# epoch flags whose records are satellite observations (6 is cycle slip records)
+OBSERVATION_FLAGS = (0, 1, 6)
+
+_SPACE = ord(" ")
+
+
+class RinexObs(NamedTuple):
+    """
+    Observations from a RINEX file, as flat columns with one row per record
+    (that is, per epoch and satellite)
+    """
+
+    position: Optional[numpy.ndarray]  # approximate receiver ECEF XYZ, meters
+    svs: List[str]  # the satellites seen, eg "G01"
+    sv_idx: numpy.ndarray  # index into svs for each record
+    times: numpy.ndarray  # numpy.datetime64[ns] epoch for each record
+    obs: Dict[str, numpy.ndarray]  # observable name to values, NaN when missing
+    glonass_slots: Dict[str, int]  # GLONASS PRN to frequency channel, if given
+
+
+def _read_header(header: bytes) -> Dict[str, Any]:
+    """
+    Pull out the header fields we need
+
+    Args:
+        header: the raw header, up to and including END OF HEADER
+
+    Returns:
+        dictionary with the RINEX version, observation types, position and
+        GLONASS frequency channels
+
+    Raises:
+        ValueError if this is not a RINEX 2 observation file
+    """
+    info: Dict[str, Any] = {"position": None, "glonass_slots": {}}
+    obs_types: List[str] = []
+    type_count = 0
+    for line in header.decode("ascii", "replace").splitlines():
+        label = line[60:].strip()
+        if label == "RINEX VERSION / TYPE":
+            info["version"] = float(line[:9])
+            if not 2 <= info["version"] < 3 or line[20] != "O":
+                raise ValueError("not a RINEX 2 observation file")
+        elif label == "# / TYPES OF OBSERV":
+            if line[:6].strip():
+                type_count = int(line[:6])
+            obs_types += line[6:60].split()
+        elif label == "APPROX POSITION XYZ":
+            info["position"] = numpy.array([float(x) for x in line[:42].split()])
+        elif label == "GLONASS SLOT / FRQ #":
+            fields = line[4:60].split()
+            for prn, channel in zip(fields[::2], fields[1::2]):
+                info["glonass_slots"][prn.replace(" ", "0")] = int(channel)
+
+    if "version" not in info or len(obs_types) != type_count:
+        raise ValueError("malformed RINEX header")
+    info["obs_types"] = obs_types
+    return info
+
+
+def _parse_values(chars: numpy.ndarray) -> numpy.ndarray:
+    """
+    Convert F14.3 fields into floats without going through Python strings
+
+    Args:
+        chars: uint8 array of shape (n, VALUE_WIDTH)
+
+    Returns:
+        float array of the values, NaN where the field was blank
+    """
+    blank = numpy.all(chars == _SPACE, axis=1)
+    digits = chars.astype(numpy.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    # weights in thousandths: the digits left of the decimal, then the 3 right of it
+    weights = 10 ** numpy.r_[
+        numpy.arange(DECIMAL_COL + 2, 2, -1), 0, numpy.arange(2, -1, -1)
+    ].astype(numpy.int64)
+    values = (numpy.where(is_digit, digits, 0) * weights).sum(axis=1) / 1000.0
+    values[numpy.any(chars == ord("-"), axis=1)] *= -1
+    values[blank] = numpy.nan
+
+    # anything not laid out like F14.3 gets the slow treatment
+    irregular = ~blank & (chars[:, DECIMAL_COL] != ord("."))
+    for row in numpy.flatnonzero(irregular):
+        values[row] = float(chars[row].tobytes())
+    return values
+
+
+def _epoch_times(lines: numpy.ndarray) -> numpy.ndarray:
+    """
+    Parse the epoch times from epoch lines
+
+    Args:
+        lines: uint8 array of epoch lines, shape (n, >=26)
+
+    Returns:
+        numpy.datetime64[ns] array of the epochs
+    """
+
+    def _int_field(start: int, end: int) -> numpy.ndarray:
+        digits = lines[:, start:end].astype(numpy.int64) - ord("0")
+        digits = numpy.where((digits >= 0) & (digits <= 9), digits, 0)
+        return (digits * 10 ** numpy.arange(end - start - 1, -1, -1)).sum(axis=1)
+
+    year = _int_field(1, 3)
+    year += numpy.where(year >= 80, 1900, 2000)
+    days = (
+        (year - 1970).astype("datetime64[Y]")
+        + (_int_field(4, 6) - 1).astype("timedelta64[M]")
+    ).astype("datetime64[D]") + (_int_field(7, 9) - 1).astype("timedelta64[D]")
+    seconds = numpy.ascontiguousarray(lines[:, 15:26]).view("S11")[:, 0].astype(float)
+    return (
+        days.astype("datetime64[ns]")
+        + (_int_field(10, 12) * 3600 + _int_field(13, 15) * 60).astype("timedelta64[s]")
+        + numpy.round(seconds * 1e9).astype("timedelta64[ns]")
+    )
+
+
+def _find_epochs(
+    char_at: Callable[[int], numpy.ndarray], content_end: int, obs_lines: int
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Locate the epoch lines of the body
+
+    Args:
+        char_at: function giving the character in a column of every line
+        content_end: index one past the last non-blank line of the body
+        obs_lines: how many lines each satellite record takes
+
+    Returns:
+        the line index, flag, and satellite/record count for each epoch
+
+    Raises:
+        ValueError if the epochs don't chain together
+    """
+    # normal epochs have the decimal point of the seconds field in column 18,
+    # which observation lines never do. Event epochs may have a blank date.
+    flag_digit = (char_at(28) >= ord("0")) & (char_at(28) <= ord("9"))
+    blank_date = (char_at(1) == _SPACE) & (char_at(18) == _SPACE)
+    candidates = numpy.flatnonzero(
+        flag_digit & (char_at(26) == _SPACE) & ((char_at(18) == ord(".")) | blank_date)
+    )
+    if len(candidates) == 0 or candidates[0] != 0:
+        raise ValueError("RINEX body does not start with an epoch")
+
+    flags = char_at(28)[candidates].astype(int) - ord("0")
+    counts = numpy.zeros(len(candidates), dtype=int)
+    for col, scale in ((29, 100), (30, 10), (31, 1)):
+        digit = char_at(col)[candidates].astype(int) - ord("0")
+        counts += numpy.where((digit >= 0) & (digit <= 9), digit, 0) * scale
+
+    is_obs = numpy.isin(flags, OBSERVATION_FLAGS)
+    sat_lines = numpy.maximum(-(-counts // SATS_PER_LINE), 1)
+    next_epoch = candidates + numpy.where(
+        is_obs, sat_lines + counts * obs_lines, 1 + counts
+    )
+
+    if not numpy.array_equal(next_epoch[:-1], candidates[1:]):
+        # something in an event record looked like an epoch, walk the chain instead
+        lookup = {line: i for i, line in enumerate(candidates)}
+        keep = [0]
+        while next_epoch[keep[-1]] in lookup:
+            keep.append(lookup[next_epoch[keep[-1]]])
+        candidates, flags, counts = candidates[keep], flags[keep], counts[keep]
+        next_epoch = next_epoch[keep]
+
+    # a truncated last epoch is tolerated, lines we couldn't account for are not
+    if next_epoch[-1] < content_end:
+        raise ValueError("RINEX epochs do not chain together")
+    return candidates, flags, counts
+
+
+def _parse_body(
+    body: numpy.ndarray, obs_types: List[str], systems: str, interval: Optional[int]
+) -> Dict[str, Any]:
+    """
+    Parse the observation records
+
+    Args:
+        body: uint8 array of everything after the header
+        obs_types: the observation types listed in the header
+        systems: which GNSS systems to keep, eg "GR"
+        interval: only keep epochs on multiples of this many seconds
+
+    Returns:
+        dictionary of the fields of RinexObs, except position
+    """
+    newlines = numpy.flatnonzero(body == ord("\n"))
+    starts = numpy.r_[0, newlines + 1]
+    ends = numpy.r_[newlines, len(body)]
+    if starts[-1] == len(body):
+        starts, ends = starts[:-1], ends[:-1]
+    # windows line endings
+    ends = ends - ((ends > starts) & (body[numpy.maximum(ends - 1, 0)] == ord("\r")))
+    lengths = ends - starts
+
+    def gather(
+        lines: numpy.ndarray, cols: Union[int, numpy.ndarray], width: int
+    ) -> numpy.ndarray:
+        """characters [col, col+width) of the given lines, space padded"""
+        offsets = numpy.reshape(cols, (-1, 1)) + numpy.arange(width)
+        inside = offsets < lengths[lines][:, numpy.newaxis]
+        idx = numpy.where(inside, starts[lines][:, numpy.newaxis] + offsets, 0)
+        return numpy.where(inside, body[idx], _SPACE).astype(numpy.uint8)
+
+    all_lines = numpy.arange(len(starts))
+    obs_lines = max(1, math.ceil(len(obs_types) / OBS_PER_LINE))
+    epoch_lines, flags, counts = _find_epochs(
+        lambda col: gather(all_lines, col, 1)[:, 0],
+        numpy.flatnonzero(lengths)[-1] + 1 if lengths.any() else 0,
+        obs_lines,
+    )
+
+    # only real observations, not cycle slip records or events
+    normal = flags <= 1
+    epoch_lines, counts = epoch_lines[normal], counts[normal]
+    epoch_times = _epoch_times(gather(epoch_lines, 0, 26))
+    if interval:
+        since_midnight = (
+            epoch_times - epoch_times.astype("datetime64[D]")
+        ) / numpy.timedelta64(1, "s")
+        on_interval = numpy.isclose(since_midnight % interval, 0)
+        epoch_lines, counts = epoch_lines[on_interval], counts[on_interval]
+        epoch_times = epoch_times[on_interval]
+
+    # one entry per (epoch, satellite) record
+    record_epoch = numpy.repeat(numpy.arange(len(epoch_lines)), counts)
+    sat_num = numpy.arange(len(record_epoch)) - numpy.repeat(
+        numpy.cumsum(counts) - counts, counts
+    )
+    sat_lines = numpy.maximum(-(-counts // SATS_PER_LINE), 1)
+    record_line = (
+        epoch_lines[record_epoch] + sat_lines[record_epoch] + sat_num * obs_lines
+    )
+
+    # satellite ids from the epoch line (and its continuation lines)
+    sv_chars = gather(
+        epoch_lines[record_epoch] + sat_num // SATS_PER_LINE,
+        32 + 3 * (sat_num % SATS_PER_LINE),
+        3,
+    )
+    # blank system means GPS, blank tens digit means 0
+    sv_chars[:, 0] = numpy.where(sv_chars[:, 0] == _SPACE, ord("G"), sv_chars[:, 0])
+    sv_chars[:, 1:] = numpy.where(sv_chars[:, 1:] == _SPACE, ord("0"), sv_chars[:, 1:])
+
+    wanted = numpy.isin(sv_chars[:, 0], numpy.frombuffer(systems.encode(), numpy.uint8))
+    sv_codes, sv_idx = numpy.unique(
+        numpy.ascontiguousarray(sv_chars[wanted]).view("S3")[:, 0],
+        return_inverse=True,
+    )
+    record_epoch, record_line = record_epoch[wanted], record_line[wanted]
+
+    obs = {}
+    for obs_type in OBS_TYPES:
+        if obs_type not in obs_types:
+            continue
+        pos = obs_types.index(obs_type)
+        obs[obs_type] = _parse_values(
+            gather(
+                record_line + pos // OBS_PER_LINE,
+                OBS_WIDTH * (pos % OBS_PER_LINE),
+                VALUE_WIDTH,
+            )
+        )
+
+    return {
+        "svs": [code.decode() for code in sv_codes],
+        "sv_idx": sv_idx.reshape(-1),
+        "times": epoch_times[record_epoch],
+        "obs": obs,
+    }
+
+
+def read_obs(
+    path: str, systems: str = "GR", interval: Optional[int] = None
+) -> RinexObs:
+    """
+    Read a RINEX 2 observation file
+
+    Args:
+        path: path to the file, which may be compressed or Hatanaka compressed
+        systems: which GNSS systems to keep, eg "GR" for GPS and GLONASS
+        interval: optional, only keep epochs on multiples of this many seconds
+
+    Returns:
+        the observations as flat columns
+
+    Raises:
+        ValueError if the file can't be parsed as RINEX 2 observations
+    """
+    with open(path, "rb") as fin:
+        head = fin.read(80)
+        if not head:
+            raise ValueError("empty RINEX file")
+        if head.startswith((b"\x1f\x8b", b"\x1f\x9d")) or b"CRINEX" in head:
+            # compressed, so it can't be mapped directly
+            fin.seek(0)
+            return _read_buffer(hatanaka.decompress(fin.read()), systems, interval)
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _read_buffer(mapped, systems, interval)
+
+
+def _read_buffer(data, systems: str = "GR", interval: Optional[int] = None) -> RinexObs:
+    """
+    Read RINEX 2 observations out of a buffer
+
+    Args:
+        data: bytes-like object holding the whole file
+        systems: which GNSS systems to keep
+        interval: optional, only keep epochs on multiples of this many seconds
+
+    Returns:
+        the observations as flat columns
+    """
+    header_end = data.find(b"END OF HEADER")
+    if header_end < 0:
+        raise ValueError("no RINEX header found")
+    body_start = data.find(b"\n", header_end) + 1
+    info = _read_header(bytes(data[:body_start]))
+
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    try:
+        parsed = _parse_body(buf[body_start:], info["obs_types"], systems, interval)
+    finally:
+        # release our view so a memory map can be closed
+        del buf
+    return RinexObs(
+        position=info["position"], glonass_slots=info["glonass_slots"], **parsed
+    )
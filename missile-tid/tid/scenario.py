@@ -7,7 +7,8 @@ from __future__ import annotations  # defer type annotations due to circular stu
 
 from datetime import datetime, timedelta
 from functools import lru_cache
-from typing import cast, Dict, Iterable, Optional, Sequence, Tuple, Union
+from typing import cast, Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from multiprocessing import shared_memory
 from pathlib import Path
 import hashlib
 from laika.constants import (
@@ -25,17 +26,129 @@ from laika.gps_time import GPSTime
 from laika.lib import coordinates
 
 from tid.config import Configuration
-from tid.connections import Connection, ConnTickMap
-from tid import bias_solve, get_data, tec, types, util
+from tid.connections import Connection, ConnectionTable, ConnTickMap, TickSeries
+from tid import bias_solve, get_data, orbits, scheduler, tec, types, util
 
 from tid.util import get_dates_in_range as _get_dates_in_range
 
 # load configuration data
 conf = Configuration()
 
+# bump this whenever the way connections and biases are worked out or saved
+# changes (cached ones are then recomputed, the downloaded data is kept)
+SCENARIO_VERSION = 3
+
+# bump this whenever the layout of the downloaded data in cached scenarios
+# changes (it is part of the cache key, so they are then downloaded again)
+LAYOUT_VERSION = 1
+
+# how connections are stored in the scenario cache
+CONNECTION_TYPE = [
+    ("idx_start", "i4"),
+    ("idx_end", "i4"),
+    ("offset", "f8"),
+    ("offset_error", "f8"),
+]
+
+# what is worked out about each observation from where its satellite was,
+# kept next to the station's observations so it is only worked out once
+GEOMETRY_TYPE = [
+    ("el", "f8"),  # elevation of the satellite, in radians
+    ("ipp", "3f8"),  # ionospheric pierce point, ECEF XYZ in meters
+    ("latlon", "2f8"),  # latitude and longitude of the pierce point, in degrees
+    ("s_to_v", "f8"),  # unitless slant to vertical factor
+]
+
 MIN_CON_LENGTH = 20  # 10 minutes worth of connection
 DISCON_TIME = 4  # cycle slip for >= 4 samples without info
 EL_CUTOFF = 0.15  # elevation cutoff in radians, shallower than this ignored
+WINDOW_HOURS = 3  # default trailing window kept by a RollingScenario
+# stations each process should get before making connections in parallel is
+# worth starting the processes for
+STATIONS_PER_WORKER = 8
+
+
+def connection_bounds(
+    ticks: numpy.ndarray,
+    mw_signal: numpy.ndarray,
+    elevations: numpy.ndarray,
+    phase_diffs: numpy.ndarray,
+    el_cutoff: float = EL_CUTOFF,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Find the periods of continuous lock in a satellite's observations
+
+    Args:
+        ticks: the tick of each observation, at least MIN_CON_LENGTH of them
+        mw_signal: the Melbourne Wubbena combination for each observation
+        elevations: the satellite's elevation for each observation, in radians
+        phase_diffs: L1C / f1 - L2C / f2 for each observation
+        el_cutoff: ignore signals below this number in radians
+
+    Returns:
+        index of the first and of the last observation of each connection
+    """
+    count = len(ticks)
+
+    # observations that can't be in any connection, and so split them up:
+    # when tickcount jumps by >= DISCON_TIME,
+    breaks = numpy.zeros(count, dtype=bool)
+    breaks[:-1] |= numpy.diff(ticks) >= DISCON_TIME
+    # when mw_signal value is NaN,
+    breaks |= numpy.isnan(mw_signal)
+    # below the elevation cutoff,
+    breaks |= elevations < el_cutoff
+    # and either side of l1 - l2 discontinuities
+    slips = numpy.abs(numpy.diff(phase_diffs, n=2)) > 1e-10
+    breaks[:-2] |= slips
+    breaks[2:] |= slips
+
+    bkpoints = numpy.flatnonzero(breaks)
+    if len(bkpoints) == 0:
+        return numpy.array([0]), numpy.array([count - 1])
+
+    # then run the segmenter on the long enough mw_signal chunks between those
+    # (the last one stopping short of the final observation)
+    chunk_starts = numpy.concatenate(([0], bkpoints + 1))
+    chunk_stops = numpy.concatenate((bkpoints, [count - 1]))
+    long_enough = chunk_stops - chunk_starts >= MIN_CON_LENGTH
+    segmenter_bkpoints = util.chunked_segmenter(
+        mw_signal, chunk_starts[long_enough], chunk_stops[long_enough]
+    )
+    if long_enough[-1]:
+        # the last chunk's are counted from its start, not the start of the data
+        in_last = segmenter_bkpoints >= chunk_starts[-1]
+        segmenter_bkpoints[in_last] -= chunk_starts[-1]
+    breaks[segmenter_bkpoints] = True
+
+    # connections are what's between those, if they're long enough
+    partition_points = numpy.flatnonzero(breaks)
+    starts = numpy.concatenate(([0], partition_points + 1))
+    ends = numpy.concatenate((partition_points - 1, [count - 1]))
+    long_enough = ends - starts >= MIN_CON_LENGTH
+    return starts[long_enough], ends[long_enough]
+
+
+def _connection_records(connections: Iterable[Connection]) -> numpy.ndarray:
+    """
+    The compact form of some connections, for saving or sending elsewhere
+
+    Args:
+        connections: the connections
+
+    Returns:
+        their boundaries and offsets, as CONNECTION_TYPE records
+    """
+    connections = list(connections)
+    records = numpy.zeros(len(connections), dtype=CONNECTION_TYPE)
+    for i, con in enumerate(connections):
+        records[i] = (
+            con.idx_start,
+            con.idx_end,
+            numpy.nan if con.offset is None else con.offset,
+            numpy.nan if con.offset_error is None else con.offset_error,
+        )
+    return records
 
 
 class Scenario:
@@ -52,6 +165,7 @@ class Scenario:
         duration: timedelta,
         station_locs: Dict[str, types.ECEF_XYZ],
         station_data: types.StationPrnMap[types.Observations],
+        orbit_table: orbits.OrbitTable,
         dog: AstroDog,
         conn_map: Optional[types.StationPrnMap[ConnTickMap]] = None,
     ) -> None:
@@ -60,6 +174,7 @@ class Scenario:
 
         Args:
             start_date: start of the scenario
+            orbit_table: satellite positions at each tick, shared by all stations
 
         """
         self.dog = dog
@@ -70,6 +185,9 @@ class Scenario:
 
         self.station_locs = station_locs
         self.station_data = station_data
+        self.orbit_table = orbit_table
+        # GEOMETRY_TYPE columns lined up with station_data, filled in as needed
+        self.geometry: types.StationPrnMap[numpy.ndarray] = {}
 
         if conn_map is None:
             self.conn_map = cast(types.StationPrnMap[ConnTickMap], {})
@@ -81,6 +199,13 @@ class Scenario:
         self.bias_solver: Optional[bias_solve.BiasSolver] = None
         self.sat_biases: Dict[str, float] = {}
         self.rcvr_biases: Dict[str, Tuple[float, float, float]] = {}
+        # bumped whenever the biases change, so vtecs worked out before are redone
+        self.bias_version = 0
+        # connection -> (bias_version, vtecs) for the vtecs worked out so far
+        self.vtec_cache: Dict[Connection, Tuple[int, numpy.ndarray]] = {}
+
+        # where connections and biases get saved once worked out, if anywhere
+        self.cache_path: Optional[Path] = None
 
     def to_hdf5(self, fname: Path, *, overwrite=False) -> None:
         """
@@ -97,17 +222,113 @@ class Scenario:
                     fout.create_dataset(f"data/{station}/{prn}", data=data)
             for station, loc in self.station_locs.items():
                 fout[f"loc/{station}"] = loc
+            fout["orbits/prns"] = numpy.array(list(self.orbit_table.prns), dtype="S")
+            fout["orbits/pos"] = self.orbit_table.pos
+            fout["orbits/vel"] = self.orbit_table.vel
             fout.attrs.update(
                 {
                     "start_date": self.start_date.timestamp(),
                     "duration": self.duration.total_seconds(),
                 }
             )
+            self._write_processed(fout)
+
+    def _write_processed(self, fout: h5py.File) -> None:
+        """
+        Save whatever connections and biases have been worked out,
+        replacing any saved before
+
+        Args:
+            fout: the open hdf5 file
+        """
+        for group in ("connections", "biases"):
+            if group in fout:
+                del fout[group]
+        fout.attrs["version"] = SCENARIO_VERSION
+
+        if self.conn_map:
+            fout.create_group("connections")
+        for station, prn_map in self.conn_map.items():
+            group = fout.require_group(f"connections/{station}")
+            for prn, conn_tick_map in prn_map.items():
+                group.create_dataset(
+                    prn, data=_connection_records(conn_tick_map.connections)
+                )
+
+        if self.sat_biases or self.rcvr_biases:
+            fout.create_group("biases/sat")
+            fout.create_group("biases/rcvr")
+        for prn, bias in self.sat_biases.items():
+            fout[f"biases/sat/{prn}"] = bias
+        for station, biases in self.rcvr_biases.items():
+            fout[f"biases/rcvr/{station}"] = numpy.asarray(biases)
+
+    def _read_processed(self, fin: h5py.File) -> None:
+        """
+        Restore saved connections and biases, if they were worked out the
+        way we would work them out now
+
+        Args:
+            fin: the open hdf5 file
+        """
+        if fin.attrs.get("version") != SCENARIO_VERSION:
+            return
+
+        for station, group in fin.get("connections", {}).items():
+            self.conn_map[station] = {
+                prn: self._restore_connections(station, prn, records[:])
+                for prn, records in group.items()
+            }
+
+        if "biases" in fin:
+            self.sat_biases = {
+                prn: float(ds[()]) for prn, ds in fin["biases/sat"].items()
+            }
+            self.rcvr_biases = {
+                station: tuple(float(x) for x in ds[:])
+                for station, ds in fin["biases/rcvr"].items()
+            }
+            self._biases_changed()
+
+    def _restore_connections(
+        self, station: str, prn: str, records: numpy.ndarray
+    ) -> ConnTickMap:
+        """
+        Recreate connections from their compact form
+
+        Args:
+            station: the station name
+            prn: the satellite
+            records: the connections, as from _connection_records
+
+        Returns:
+            the connections
+        """
+        connections = []
+        for record in records:
+            con = Connection(
+                self, station, prn, int(record["idx_start"]), int(record["idx_end"])
+            )
+            if not numpy.isnan(record["offset"]):
+                con.offset = float(record["offset"])
+                con.offset_error = float(record["offset_error"])
+            connections.append(con)
+        return ConnTickMap(connections)
+
+    def _update_cache(self) -> None:
+        """
+        Add newly worked out connections and biases to the cached scenario
+        """
+        if self.cache_path is None:
+            return
+        with h5py.File(self.cache_path, "a") as fout:
+            self._write_processed(fout)
 
     @classmethod
     def from_hdf5(cls, fname: Path, *, dog: Optional[AstroDog] = None) -> Scenario:
         """
-        Deserialize/fetch the scenario from an hdf5 save file
+        Deserialize/fetch the scenario from an hdf5 save file, along with its
+        connections and biases if they were saved by this version
 
         Args:
             fname: the path from which the data should be restored
@@ -127,14 +348,22 @@ class Scenario:
                 for station, group in fin["data"].items()
             }
             station_locs = {station: ds[:] for station, ds in fin["loc"].items()}
+            orbit_table = orbits.OrbitTable(
+                [prn.decode() for prn in fin["orbits/prns"][:]],
+                fin["orbits/pos"][:],
+                fin["orbits/vel"][:],
+            )
 
-        return cls(
-            start_date,
-            duration,
-            station_locs,
-            cast(types.StationPrnMap[types.Observations], station_data),
-            dog,
-        )
+            scn = cls(
+                start_date,
+                duration,
+                station_locs,
+                cast(types.StationPrnMap[types.Observations], station_data),
+                orbit_table,
+                dog,
+            )
+            scn._read_processed(fin)
+        return scn
 
     @classmethod
     def from_daterange(
@@ -145,6 +374,7 @@ class Scenario:
         dog: Optional[AstroDog] = None,
         *,
         use_cache: bool = True,
+        progress: Optional[scheduler.ProgressCallback] = None,
     ) -> Scenario:
         """
         Args:
@@ -153,6 +383,7 @@ class Scenario:
             stations: list of stations to use
             dog: Optional, AstroDog instance to use to manage data access
             use_cache: Optional, if should consider TID's cache
+            progress: Optional, called as station downloads finish
 
         Returns:
             scenario: The requested Scenario
@@ -165,19 +396,22 @@ class Scenario:
         cache_key = cls.compute_cache_key(start_date, duration, stations)
         cache_path = Path(conf.cache_dir) / "scenarios" / f"{cache_key}.hdf5"
         if use_cache and cache_path.exists():
-            return cls.from_hdf5(cache_path, dog=dog)
+            scn = cls.from_hdf5(cache_path, dog=dog)
+            scn.cache_path = cache_path
+            return scn
 
         # date_list = _get_dates_in_range(start_date, duration)
         stations = set(stations)
-        locs, data = get_data.parallel_populate_data(
-            stations, GPSTime.from_datetime(start_date), duration, dog
+        locs, data, orbit_table = get_data.parallel_populate_data(
+            stations, GPSTime.from_datetime(start_date), duration, dog, progress
         )
         # locs, data = _populate_data(stations, date_list, dog)
-        scn = cls(start_date, duration, locs, data, dog)
+        scn = cls(start_date, duration, locs, data, orbit_table, dog)
 
         if use_cache:
             cache_path.parent.mkdir(exist_ok=True)
             scn.to_hdf5(cache_path, overwrite=True)
+            scn.cache_path = cache_path
         return scn
 
     @staticmethod
@@ -196,6 +430,9 @@ class Scenario:
             unique string for the given arguments
         """
         hasher = hashlib.md5()
+        # observations and orbits are stored as is, so their layout is key too
+        hasher.update(repr(LAYOUT_VERSION).encode())
+        hasher.update(repr(numpy.dtype(get_data.DENSE_TYPE).descr).encode())
         hasher.update(repr(sorted(stations)).encode())
         hasher.update(start_date.isoformat().encode())
         hasher.update(repr(duration.total_seconds()).encode())
@@ -233,6 +470,70 @@ class Scenario:
         sat_range = numpy.linalg.norm(sat_ned, axis=1)
         return numpy.arcsin(-sat_ned[..., 2] / sat_range)
 
+    def sat_positions(
+        self, prn: str, observations: types.Observations
+    ) -> types.ECEF_XYZ_LIST:
+        """
+        Where the satellite was when it sent each of these observations
+
+        Args:
+            prn: the satellite of interest
+            observations: the observations of that satellite
+
+        Returns:
+            numpy array of XYZ ECEF satellite positions in meters, shape (?, 3)
+        """
+        return cast(
+            types.ECEF_XYZ_LIST,
+            self.orbit_table.sat_pos(prn, observations["tick"], observations["C1C"]),
+        )
+
+    def observation_geometry(self, station: str, prn: str) -> numpy.ndarray:
+        """
+        Elevations, ionospheric pierce points and slant factors for a
+        station's observations of a satellite, one per observation in its
+        station_data. The first time any are needed, they are worked out for
+        all of the station's satellites at once.
+
+        Args:
+            station: station name
+            prn: the satellite of interest
+
+        Returns:
+            numpy array of GEOMETRY_TYPE
+        """
+        geometry = self.geometry.setdefault(station, {})
+        if prn not in geometry:
+            missing = [sat for sat in self.station_data[station] if sat not in geometry]
+            geometry.update(self._station_geometry(station, missing))
+        return geometry[prn]
+
+    def _station_geometry(
+        self, station: str, prns: Sequence[str]
+    ) -> Dict[str, numpy.ndarray]:
+        """
+        Work out the geometry for a station's observations of some satellites,
+        in one batch
+
+        Args:
+            station: station name
+            prns: the satellites to work it out for
+
+        Returns:
+            map of prn -> numpy array of GEOMETRY_TYPE
+        """
+        observations = [self.station_data[station][prn] for prn in prns]
+        sat_pos = numpy.concatenate(
+            [self.sat_positions(prn, obs) for prn, obs in zip(prns, observations)]
+        )
+        geometry = numpy.zeros(len(sat_pos), dtype=GEOMETRY_TYPE)
+        geometry["el"] = self.station_el(station, sat_pos)
+        geometry["ipp"] = tec.ion_locs(self.station_locs[station], sat_pos)
+        geometry["latlon"] = coordinates.ecef2geodetic(geometry["ipp"])[..., 0:2]
+        geometry["s_to_v"] = tec.s_to_v_factor(geometry["el"])
+        splits = numpy.cumsum([len(obs) for obs in observations])[:-1]
+        return dict(zip(prns, numpy.split(geometry, splits)))
+
     def get_extent(self) -> Tuple[float, float, float, float]:
         """
         Get a rough idea of the geographic region we are working with.
@@ -256,10 +557,7 @@ class Scenario:
     def get_vtec_data(
         self,
         raw: bool = False,
-    ) -> Tuple[
-        types.StationPrnMap[Sequence[float]],
-        types.StationPrnMap[Sequence[Optional[Tuple[float, float]]]],
-    ]:
+    ) -> Tuple[types.StationPrnMap[TickSeries], types.StationPrnMap[TickSeries]]:
         """
         Get organized vtec data for this scenario.
 
@@ -267,8 +565,8 @@ class Scenario:
             map of station -> prn -> filtered vtec data, one per tick
             map of station -> prn -> (lat, lon values or None if no data), one per tick
         """
-        vtecs = cast(types.StationPrnMap[Sequence[float]], {})
-        ipps = cast(types.StationPrnMap[Sequence[Optional[Tuple[float, float]]]], {})
+        vtecs = cast(types.StationPrnMap[TickSeries], {})
+        ipps = cast(types.StationPrnMap[TickSeries], {})
         for station in self.conn_map.keys():
             for prn in self.conn_map[station].keys():
                 if not self.conn_map[station][prn].connections:
@@ -286,6 +584,16 @@ class Scenario:
                 ipps[station][prn] = self.conn_map[station][prn].get_ipps_latlon()
         return vtecs, ipps
 
+    def connection_table(self) -> ConnectionTable:
+        """
+        All of the connections made so far, as one table for working on them
+        all at once. It is built afresh each time, so hold on to it.
+
+        Returns:
+            the ConnectionTable of this scenario's connections
+        """
+        return ConnectionTable(self)
+
     def export_vtec_data(self, fname: Path) -> None:
         """
         Write out a big matrix with filtered vtec data to easily share it around
@@ -295,36 +603,22 @@ class Scenario:
         """
         tick_count = int(self.duration.total_seconds() / util.DATA_RATE)
         stations = sorted(self.station_data.keys())
-        sats = sorted(
-            set(
-                sum(
-                    [
-                        list(station_map.keys())
-                        for station_map in self.conn_map.values()
-                    ],
-                    start=[],
-                )
-            )
-        )
+        table = self.connection_table()
+        sats = table.prns
         max_obs = len(stations) * len(sats)
 
         res = numpy.zeros(
             (tick_count, max_obs), dtype=[("vtec", "f8"), ("latlon", "2f8")]
         )
 
-        for station in self.conn_map.keys():
-            station_idx = stations.index(station)
-            for prn in self.conn_map[station].keys():
-                sat_idx = sats.index(prn)
-                if not self.conn_map[station][prn].connections:
-                    continue
-                vtecs = self.conn_map[station][prn].get_filtered_vtecs()
-                ipps = self.conn_map[station][prn].get_ipps_latlon()
-                for tick in range(tick_count):
-                    latlon = ipps[tick]
-                    if latlon is None:
-                        continue
-                    res[tick][station_idx * len(sats) + sat_idx] = (vtecs[tick], latlon)
+        station_idxs = numpy.array(
+            [stations.index(station) for station in table.stations], dtype=int
+        )
+        columns = (station_idxs[table.station] * len(sats) + table.prn)[table.con_ids]
+        vtecs, _ = table.filtered_vtecs()
+        kept = table.ticks < tick_count
+        res["vtec"][table.ticks[kept], columns[kept]] = vtecs[kept]
+        res["latlon"][table.ticks[kept], columns[kept]] = table.latlons[kept]
         with h5py.File(fname, "w") as fout:
             fout.create_dataset("data", data=res, compression="gzip")
 
@@ -386,6 +680,7 @@ class Scenario:
         prn,
         observations: types.Observations,
         el_cutoff: float = EL_CUTOFF,
+        offset: int = 0,
     ) -> Iterable[Connection]:
         """
         Get a list of Connections given observations
@@ -393,6 +688,8 @@ class Scenario:
         Args:
             observations: the observations to use
             el_cutoff: ignore signals below this number in radians
+            offset: index of observations[0] in the station's data for this
+                satellite, when only some of the data is being looked at
 
         Returns:
             a list of Connection objects
@@ -400,11 +697,6 @@ class Scenario:
         if len(observations) < MIN_CON_LENGTH:
             return []
 
-        bkpoints = set()
-
-        # first pass: when tickcount jumps by >= DISCON_TIME
-        bkpoints |= set(numpy.where(numpy.diff(observations["tick"]) >= DISCON_TIME)[0])
-
         freqs = self.get_frequencies(prn, observations)
         if freqs is None:
             return []
@@ -415,102 +707,41 @@ class Scenario:
         if mw_signal is None:
             return []
 
-        # second pass: when mw_signal value is NaN
-        bkpoints |= set(numpy.where(numpy.isnan(mw_signal))[0])
-
-        # third pass: elevation cutoff
-        bkpoints |= set(
-            numpy.where(
-                self.station_el(station, cast(types.ECEF_XYZ, observations["sat_pos"]))
-                < el_cutoff
-            )[0]
+        starts, ends = connection_bounds(
+            observations["tick"],
+            mw_signal,
+            self.observation_geometry(station, prn)["el"][
+                offset : offset + len(observations)
+            ],
+            observations["L1C"] / f1 - observations["L2C"] / f2,
+            el_cutoff,
         )
+        return [
+            Connection(self, station, prn, offset + int(start), offset + int(end))
+            for start, end in zip(starts, ends)
+        ]
 
-        # fourth pass: l1 - l2 discontinuities
-        discontinuities = numpy.where(
-            numpy.abs(
-                numpy.diff(observations["L1C"] / f1 - observations["L2C"] / f2, n=2)
-            )
-            > 1e-10
-        )[0]
-        bkpoints |= set(discontinuities)
-        bkpoints |= set(discontinuities + 2)
-
-        # final pass: run segmenter on the remaining mw_signal contiguous chunks
-        bkpoint_list = sorted(bkpoints)
-        segmenter_bkpoints = set()
-        for i, bkpoint in enumerate(bkpoint_list):
-            if i == 0:  # first breakpoint
-                start = 0
-            else:
-                start = bkpoint_list[i - 1] + 1
-            count = bkpoint - start
-            if count < MIN_CON_LENGTH:
-                continue
-            bkpts = util.segmenter(mw_signal[start:bkpoint])
-            segmenter_bkpoints |= set(start + bkpt for bkpt in bkpts)
-
-        if len(bkpoint_list) > 0:
-            # and one for the last section
-            start = bkpoint_list[-1] + 1
-            bkpoint = len(observations) - 1
-            count = bkpoint - start
-            if count >= MIN_CON_LENGTH:
-                bkpts = util.segmenter(mw_signal[start:bkpoint])
-                segmenter_bkpoints |= set(bkpts)
-
-        # include everything EXCEPT for these points
-        # and separate chunks by these points
-        # don't include segments that are too short
-        partition_points = sorted(segmenter_bkpoints | set(bkpoints))
-
-        connections = []
-        for i, bkpoint in enumerate(partition_points):
-            if i == 0:
-                start = 0
-            else:
-                # not inclusive--start one after
-                start = partition_points[i - 1] + 1
-            count = (bkpoint - 1) - start
-            if count < MIN_CON_LENGTH:
-                continue
-
-            connections.append(
-                Connection(
-                    self,
-                    station,
-                    prn,
-                    start,
-                    bkpoint - 1,
-                )
-            )
-        if len(partition_points) > 0:
-            start = partition_points[-1] + 1
-            bkpoint = len(observations) - 1
-            count = bkpoint - start
-            if count >= MIN_CON_LENGTH:
-                connections.append(
-                    Connection(
-                        self,
-                        station,
-                        prn,
-                        start,
-                        bkpoint,
-                    )
-                )
-        else:
-            connections.append(Connection(self, station, prn, 0, len(observations) - 1))
-
-        return connections
-
-    def make_connections(self):
+    def make_connections(self, workers: Optional[int] = None):
         """
         Generate and store our lists of connections
+
+        Args:
+            workers: how many processes to spread the stations across, by default
+                as many as there are CPUs to keep busy (1 works in this process)
         """
         if len(self.conn_map):
             return
 
+        if workers is None:
+            workers = min(
+                scheduler.DECODE_WORKERS, len(self.station_data) // STATIONS_PER_WORKER
+            )
         self.conn_map = cast(types.StationPrnMap[ConnTickMap], {})
+        if workers > 1 and self.station_data:
+            self._make_connections_parallel(workers)
+            self._update_cache()
+            return
+
         for station, svmap in self.station_data.items():
             self.conn_map[station] = {}
             for prn, observations in svmap.items():
@@ -518,11 +749,473 @@ class Scenario:
                 for con in cons:
                     con.correct_ambiguities()
                 self.conn_map[station][prn] = ConnTickMap(cons)
+        self._update_cache()
+
+    def _make_connections_parallel(self, workers: int) -> None:
+        """
+        Generate our lists of connections with a pool of processes, each
+        station being independent of the others.
+
+        The observations and orbits are shared with the workers rather than
+        sent to them, and the workers send back just the connections'
+        boundaries and offsets.
+
+        Args:
+            workers: how many processes to use
+        """
+        total = sum(
+            len(obs) for svmap in self.station_data.values() for obs in svmap.values()
+        )
+        dtype = numpy.dtype(get_data.DENSE_TYPE)
+        blocks = {
+            "observations": _SharedArray.create((total,), dtype),
+            "pos": _SharedArray.create(self.orbit_table.pos.shape, numpy.dtype(float)),
+            "vel": _SharedArray.create(self.orbit_table.vel.shape, numpy.dtype(float)),
+        }
+        try:
+            blocks["pos"].array[...] = self.orbit_table.pos
+            blocks["vel"].array[...] = self.orbit_table.vel
+
+            tasks = []
+            start = 0
+            for station, svmap in self.station_data.items():
+                prns = []
+                for prn, observations in svmap.items():
+                    stop = start + len(observations)
+                    blocks["observations"].array[start:stop] = observations
+                    # the AstroDog stays here, so look up what the workers need
+                    frequencies = None
+                    if len(observations) >= MIN_CON_LENGTH:
+                        frequencies = self.get_frequencies(prn, observations)
+                    prns.append((prn, start, stop, frequencies))
+                    start = stop
+                tasks.append((station, self.station_locs.get(station), prns))
+
+            with scheduler.process_pool(
+                workers,
+                initializer=_init_connection_worker,
+                initargs=(
+                    self.start_date,
+                    self.duration,
+                    list(self.orbit_table.prns),
+                    {key: block.spec for key, block in blocks.items()},
+                ),
+            ) as pool:
+                for station, records in pool.map(
+                    _station_connections,
+                    tasks,
+                    chunksize=max(1, len(tasks) // (4 * workers)),
+                ):
+                    self.conn_map[station] = {
+                        prn: self._restore_connections(station, prn, prn_records)
+                        for prn, prn_records in records.items()
+                    }
+        finally:
+            for block in blocks.values():
+                block.release(unlink=True)
 
     def solve_biases(self):
         """
         Attempt to find the satellite and station clock biases for this scenario
         """
+        if self.sat_biases or self.rcvr_biases:
+            return
+
         assert len(self.conn_map) > 0
         self.bias_solver = bias_solve.SimpleBiasSolver(self)
         self.sat_biases, self.rcvr_biases = self.bias_solver.solve_biases()
+        self._biases_changed()
+        self._update_cache()
+
+    def _biases_changed(self) -> None:
+        """
+        Note that the biases have changed, so the vtecs need working out again
+        """
+        self.bias_version += 1
+        self.clear_vtec_cache()
+
+    def clear_vtec_cache(self) -> None:
+        """
+        Forget all of the connections' vtecs worked out so far
+        """
+        self.vtec_cache.clear()
+
+    def vtec_cache_bytes(self) -> int:
+        """
+        How much memory the cached vtecs are using
+
+        Returns:
+            the size of all the cached vtec arrays, in bytes
+        """
+        return sum(vtecs.nbytes for _, vtecs in self.vtec_cache.values())
+
+
+class RollingScenario(Scenario):
+    """
+    A scenario over a trailing window of time (eg the last 3 hours), for live use.
+
+    Each new hour of data is appended rather than everything being rebuilt: the
+    oldest data is dropped, connections wholly inside the window are kept as
+    they are, and only those at its ends are truncated, extended or recomputed.
+    Connections crossing an hour boundary therefore stay whole.
+    """
+
+    def __init__(
+        self,
+        start_date: datetime,
+        duration: timedelta,
+        station_locs: Dict[str, types.ECEF_XYZ],
+        station_data: types.StationPrnMap[types.Observations],
+        orbit_table: orbits.OrbitTable,
+        dog: AstroDog,
+        *,
+        stations: Iterable[str],
+        window: timedelta,
+    ) -> None:
+        """
+        Args:
+            start_date: start of the scenario
+            duration: how much time the data covers so far, at most window
+            orbit_table: satellite positions at each tick, shared by all stations
+            stations: the stations to fetch each new hour of data for
+            window: how much time to keep
+        """
+        super().__init__(
+            start_date, duration, station_locs, station_data, orbit_table, dog
+        )
+        self.stations = sorted(set(stations))
+        self.window = window
+
+    @classmethod
+    def from_window(
+        cls,
+        end_date: datetime,
+        window: timedelta,
+        stations: Iterable[str],
+        dog: Optional[AstroDog] = None,
+        *,
+        progress: Optional[scheduler.ProgressCallback] = None,
+    ) -> RollingScenario:
+        """
+        Args:
+            end_date: when the window ends, on the hour
+            window: how much time to keep
+            stations: list of stations to use
+            dog: Optional, AstroDog instance to use to manage data access
+            progress: Optional, called as station downloads finish
+
+        Returns:
+            scenario: the window of time up to end_date
+        """
+        if dog is None:
+            dog = AstroDog(cache_dir=conf.cache_dir)
+        start_date = end_date - window
+        locs, data, orbit_table = get_data.parallel_populate_data(
+            stations, GPSTime.from_datetime(start_date), window, dog, progress
+        )
+        return cls(
+            start_date,
+            window,
+            locs,
+            data,
+            orbit_table,
+            dog,
+            stations=stations,
+            window=window,
+        )
+
+    def advance(self, progress: Optional[scheduler.ProgressCallback] = None) -> None:
+        """
+        Fetch the hour of data following the window, and move the window along
+
+        Args:
+            progress: Optional, called as station downloads finish
+        """
+        end_date = self.start_date + self.duration
+        locs, data, orbit_table = get_data.parallel_populate_data(
+            self.stations,
+            GPSTime.from_datetime(end_date),
+            util.HOURS,
+            self.dog,
+            progress,
+        )
+        self.append(locs, data, orbit_table, util.HOURS)
+
+    def append(
+        self,
+        station_locs: Dict[str, types.ECEF_XYZ],
+        station_data: types.StationPrnMap[types.Observations],
+        orbit_table: orbits.OrbitTable,
+        duration: timedelta,
+    ) -> None:
+        """
+        Add data for the time just after the window, and drop whatever no
+        longer fits in it. If connections have been made, they are kept up to
+        date, but the biases need solving again.
+
+        Args:
+            station_locs: dictionary of station names to their locations
+            station_data: the new measurements, tick 0 being the end of the window
+            orbit_table: satellite positions for the new data, from the same tick 0
+            duration: how much time the new data covers
+        """
+        evict = max(self.duration + duration - self.window, timedelta(0))
+        evict_ticks = int(evict.total_seconds() / util.DATA_RATE)
+        end_tick = int(self.duration.total_seconds() / util.DATA_RATE)
+
+        self.orbit_table = self.orbit_table.rolled(evict_ticks, end_tick, orbit_table)
+        # only stations with data, as evicted ones are forgotten in _replace
+        for station, loc in station_locs.items():
+            if station in station_data:
+                self.station_locs.setdefault(station, loc)
+        # connections are only kept up to date once they have been made
+        connected = bool(self.conn_map)
+
+        for station in set(self.station_data) | set(station_data):
+            old_data = self.station_data.get(station, {})
+            new_data = station_data.get(station, {})
+            for prn in set(old_data) | set(new_data):
+                old = old_data.get(prn, numpy.zeros(0, dtype=get_data.DENSE_TYPE))
+                new = new_data.get(prn, numpy.zeros(0, dtype=get_data.DENSE_TYPE))
+                evicted = int(numpy.searchsorted(old["tick"], evict_ticks))
+                combined = numpy.concatenate((old[evicted:], new))
+                combined["tick"][: len(old) - evicted] -= evict_ticks
+                combined["tick"][len(old) - evicted :] += end_tick - evict_ticks
+                self._replace(
+                    station,
+                    prn,
+                    cast(types.Observations, combined),
+                    evicted,
+                    evict_ticks,
+                    len(new) > 0 and connected,
+                )
+
+        self.start_date += evict
+        self.duration += duration - evict
+        self.date_list = _get_dates_in_range(self.start_date, self.duration)
+        self.sat_biases, self.rcvr_biases = {}, {}
+        self._biases_changed()
+
+    def _replace(
+        self,
+        station: str,
+        prn: str,
+        observations: types.Observations,
+        evicted: int,
+        evict_ticks: int,
+        extended: bool,
+    ) -> None:
+        """
+        Swap in a satellite's rolled observations for a station, and roll its
+        connections to match
+
+        Args:
+            station: the station name
+            prn: the satellite
+            observations: the observations now in the window
+            evicted: how many of the old observations were dropped
+            evict_ticks: how many ticks the start of the window moved forward by
+            extended: whether any new observations were added, and the
+                connections should be extended with them
+        """
+        self.geometry.get(station, {}).pop(prn, None)
+        if len(observations) == 0:
+            self.station_data.get(station, {}).pop(prn, None)
+            self.conn_map.get(station, {}).pop(prn, None)
+            if station in self.station_data and not self.station_data[station]:
+                del self.station_data[station]
+                self.station_locs.pop(station, None)
+                self.conn_map.pop(station, None)
+                self.geometry.pop(station, None)
+            return
+        self.station_data.setdefault(station, {})[prn] = observations
+
+        if station not in self.conn_map and not extended:
+            return
+        old = list(self.conn_map.get(station, {}).get(prn, ConnTickMap([])).connections)
+        # the last connection may carry on into the new data, so redo it with that
+        rolled = []
+        for con in old[:-1] if extended else old:
+            if con.idx_end < evicted:
+                continue
+            if con.idx_start < evicted:
+                # lost its start, what is left of it stands on its own
+                if con.idx_end - evicted < MIN_CON_LENGTH:
+                    continue
+                con = Connection(self, station, prn, 0, con.idx_end - evicted)
+                con.correct_ambiguities()
+            else:
+                con.shift(evicted, evict_ticks)
+            rolled.append(con)
+
+        if extended:
+            # the observation after a connection is what ended it, so skip that
+            start = rolled[-1].idx_end + 2 if rolled else 0
+            cons = self._get_connections_internal(
+                station, prn, observations[start:], offset=start
+            )
+            for con in cons:
+                con.correct_ambiguities()
+            rolled.extend(cons)
+        self.conn_map.setdefault(station, {})[prn] = ConnTickMap(rolled)
+
+
+class _SharedArray:
+    """
+    A numpy array in shared memory, so worker processes can use it without
+    it being copied to each of them
+    """
+
+    def __init__(
+        self, block: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype
+    ) -> None:
+        self.block = block
+        self.array: numpy.ndarray = numpy.ndarray(shape, dtype, buffer=block.buf)
+        # what another process needs to attach to it
+        self.spec = (block.name, shape, dtype)
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype: numpy.dtype) -> _SharedArray:
+        """
+        Args:
+            shape: the shape of the array
+            dtype: the type of its elements
+
+        Returns:
+            a new, uninitialized, shared array
+        """
+        size = max(int(numpy.prod(shape)) * dtype.itemsize, 1)
+        return cls(shared_memory.SharedMemory(create=True, size=size), shape, dtype)
+
+    @classmethod
+    def attach(cls, spec: Tuple[str, Tuple[int, ...], Any]) -> _SharedArray:
+        """
+        Args:
+            spec: the spec of an array created by another process
+
+        Returns:
+            that array
+        """
+        name, shape, dtype = spec
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+    def release(self, unlink: bool = False) -> None:
+        """
+        Stop using the array
+
+        Args:
+            unlink: whether to free the memory too, for the creating process
+        """
+        # the buffer can't be closed while the array still refers to it
+        del self.array
+        self.block.close()
+        if unlink:
+            self.block.unlink()
+
+
+class _ShardScenario(Scenario):
+    """
+    One station's part of a scenario, as seen by a connection worker. The
+    AstroDog stays with the parent, so the frequencies come already looked up.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(
+        self,
+        start_date: datetime,
+        duration: timedelta,
+        station: str,
+        station_loc: types.ECEF_XYZ,
+        data: Dict[str, types.Observations],
+        orbit_table: orbits.OrbitTable,
+        frequencies: Dict[str, Optional[Tuple[float, float]]],
+    ) -> None:
+        self.start_date = start_date
+        self.duration = duration
+        self.station_locs = {station: station_loc}
+        self.station_data = cast(
+            types.StationPrnMap[types.Observations], {station: data}
+        )
+        self.orbit_table = orbit_table
+        self.geometry = {}
+        self.frequencies = frequencies
+
+    def get_frequencies(
+        self, prn: str, observations: types.Observations
+    ) -> Optional[Tuple[float, float]]:
+        return self.frequencies.get(prn)
+
+
+# a connection worker's view of the scenario, set up by _init_connection_worker
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_connection_worker(
+    start_date: datetime,
+    duration: timedelta,
+    prns: List[str],
+    specs: Dict[str, Tuple[str, Tuple[int, ...], Any]],
+) -> None:
+    """
+    Attach a connection worker to the scenario's shared arrays
+
+    Args:
+        start_date: start of the scenario
+        duration: how long the scenario lasts
+        prns: the satellites of the orbit table, in order
+        specs: the shared observations and orbit positions and velocities
+    """
+    blocks = {key: _SharedArray.attach(spec) for key, spec in specs.items()}
+    _worker_state.update(
+        {
+            "start_date": start_date,
+            "duration": duration,
+            "blocks": blocks,
+            "orbit_table": orbits.OrbitTable(
+                prns, blocks["pos"].array, blocks["vel"].array
+            ),
+        }
+    )
+
+
+def _station_connections(
+    task: Tuple[
+        str,
+        types.ECEF_XYZ,
+        List[Tuple[str, int, int, Optional[Tuple[float, float]]]],
+    ]
+) -> Tuple[str, Dict[str, numpy.ndarray]]:
+    """
+    Make the connections for one station, in a connection worker
+
+    Args:
+        task: the station, its location, and for each satellite where its
+            observations are in the shared array and its frequencies
+
+    Returns:
+        the station, and its connections for each satellite as from
+        _connection_records
+    """
+    station, station_loc, prns = task
+    observations = _worker_state["blocks"]["observations"].array
+    data = {
+        prn: cast(types.Observations, observations[start:stop])
+        for prn, start, stop, _ in prns
+    }
+    scn = _ShardScenario(
+        _worker_state["start_date"],
+        _worker_state["duration"],
+        station,
+        station_loc,
+        data,
+        _worker_state["orbit_table"],
+        {prn: frequencies for prn, _, _, frequencies in prns},
+    )
+    records = {}
+    for prn, prn_data in data.items():
+        # pylint: disable=protected-access
+        cons = scn._get_connections_internal(station, prn, prn_data)
+        for con in cons:
+            con.correct_ambiguities()
+        records[prn] = _connection_records(cons)
+    return station, records
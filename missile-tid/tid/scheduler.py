@@ -0,0 +1,265 @@
+"""
+Concurrent scheduling of station downloads.
+
+Fetching RINEX files is almost entirely waiting on the network, so it is done
+on threads, with a separate cap on how many requests may be outstanding against
+each mirror at once. Decoding the fetched files is CPU bound, so only that step
+is handed to worker processes.
+"""
+import concurrent.futures
+import contextlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from atomicwrites import atomic_write
+import requests
+from requests.adapters import HTTPAdapter
+
+LOG = logging.getLogger(__name__)
+
+# placeholder type generic name
+# pylint: disable=invalid-name
+T = TypeVar("T")
+
+DOWNLOAD_THREADS = 48  # how many downloads may be in flight in total
+DECODE_WORKERS = os.cpu_count() or 1  # how many processes to spawn for decoding
+# how many tasks may be fetched or decoded but not yet consumed, so a slow consumer
+# doesn't let finished files pile up without bound
+MAX_IN_FLIGHT = 4 * DOWNLOAD_THREADS
+
+# how many simultaneous requests each mirror will tolerate from us
+HOST_LIMITS = {
+    "noaa": 12,  # NOAA CORS
+    "cddis": 4,  # NASA CDDIS (and the Wuhan mirror of it)
+    "garner": 6,  # UCSD garner / UNAVCO
+    "gnssdata": 2,  # gnssdata.or.kr (Korea)
+    "copyfighter": 8,  # copyfighter.org (Japan)
+    "monpos": 2,  # monpos.gazar.gov.mn (Mongolia)
+}
+DEFAULT_HOST_LIMIT = 4
+
+PROGRESS_FILE = "progress.json"
+
+# modules worker processes need, imported before they are started
+PRELOAD = ["tid.get_data", "tid.scenario"]
+
+
+class Progress(NamedTuple):
+    """
+    How far along a batch of downloads is
+    """
+
+    total: int  # how many tasks there are
+    done: int  # how many tasks finished successfully
+    failed: int  # how many tasks could not be fetched or decoded
+    # how much raw RINEX has been fetched, decompressed as it is on disk
+    # (so more than was transferred, which was usually compressed)
+    rinex_bytes: int
+
+
+ProgressCallback = Callable[[Progress], None]
+
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_host_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+@contextlib.contextmanager
+def host_slot(host: str) -> Iterator[None]:
+    """
+    Hold one of the limited request slots for a mirror while the body runs.
+    Blocks until a slot is free.
+
+    Args:
+        host: the mirror name, one of the keys of HOST_LIMITS (or anything else,
+            which gets DEFAULT_HOST_LIMIT slots)
+    """
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(
+                HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+            )
+        semaphore = _host_semaphores[host]
+    with semaphore:
+        yield
+
+
+def session() -> requests.Session:
+    """
+    Get the requests session for the current thread, so repeated requests to
+    the same mirror re-use pooled keep-alive connections.
+
+    Returns:
+        a requests Session private to this thread
+    """
+    sess = getattr(_thread_local, "session", None)
+    if sess is None:
+        sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(HOST_LIMITS), pool_maxsize=4)
+        sess.mount("http://", adapter)
+        sess.mount("https://", adapter)
+        _thread_local.session = sess
+    return sess
+
+
+def progress_file(path: str) -> ProgressCallback:
+    """
+    Make a progress callback that keeps a JSON file up to date, for anything
+    watching from another process (eg the web dashboard)
+
+    Args:
+        path: the file to write
+
+    Returns:
+        the callback
+    """
+
+    def write(progress: Progress) -> None:
+        with atomic_write(path, mode="w", overwrite=True, encoding="utf-8") as fout:
+            json.dump(progress._asdict(), fout)
+
+    return write
+
+
+def _file_size(path: str) -> int:
+    """
+    Size of a file, or 0 if it has gone missing
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def process_pool(workers: int, **kwargs) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    A pool of worker processes, started from a clean server process where the
+    platform allows rather than forked from this one.
+
+    Workers are started on demand, while other threads may be running
+    subprocesses (eg crx2rnx). Forking then would hand the workers the ends of
+    those pipes, and the subprocesses would never see end of input.
+
+    Workers started this way import the main script again, so scripts using
+    the pool must keep their work under `if __name__ == "__main__":`.
+
+    Args:
+        workers: how many processes to use
+        kwargs: passed on to ProcessPoolExecutor, eg an initializer
+
+    Returns:
+        the pool
+    """
+    mp_context = None
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        # import what the workers run once, in the server, not in every worker
+        mp_context.set_forkserver_preload(PRELOAD)
+    return concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=mp_context, **kwargs
+    )
+
+
+class DownloadScheduler:
+    """
+    Runs fetches on a thread pool and decodes on a process pool, yielding
+    each result as soon as it is ready rather than waiting for the slowest one.
+    """
+
+    def __init__(
+        self,
+        threads: int = DOWNLOAD_THREADS,
+        decode_workers: int = DECODE_WORKERS,
+        max_in_flight: int = MAX_IN_FLIGHT,
+    ) -> None:
+        """
+        Args:
+            threads: number of threads used for fetching
+            decode_workers: number of processes used for decoding
+            max_in_flight: number of tasks that may be started but not yet consumed
+        """
+        self.threads = threads
+        self.decode_workers = decode_workers
+        self.max_in_flight = max(max_in_flight, 1)
+
+    def stream(
+        self,
+        tasks: Iterable[T],
+        fetch: Callable[[T], Optional[str]],
+        decode: Callable[[str], str],
+        is_decoded: Callable[[str], bool],
+        progress: Optional[ProgressCallback] = None,
+    ) -> Iterator[Tuple[T, Optional[str]]]:
+        """
+        Fetch (and if needed decode) every task, in completion order
+
+        Args:
+            tasks: the things to fetch
+            fetch: I/O bound function giving a path for a task, or None on failure
+            decode: CPU bound function converting a fetched path into its final
+                form, must be picklable
+            is_decoded: whether a fetched path is already in its final form
+            progress: called with the running totals each time a task finishes
+
+        Yields:
+            tuples of the task and its final path, or None if it failed
+        """
+        tasks = list(tasks)
+        counts = {"done": 0, "failed": 0, "rinex_bytes": 0}
+
+        def finish(task: T, path: Optional[str]) -> Tuple[T, Optional[str]]:
+            counts["done" if path is not None else "failed"] += 1
+            if progress is not None:
+                progress(Progress(total=len(tasks), **counts))
+            return task, path
+
+        with concurrent.futures.ThreadPoolExecutor(
+            self.threads
+        ) as io_pool, process_pool(self.decode_workers) as cpu_pool:
+            waiting = iter(tasks)
+            pending: Dict[concurrent.futures.Future, Tuple[T, bool]] = {}
+
+            def top_up() -> None:
+                room = self.max_in_flight - len(pending)
+                for task in itertools.islice(waiting, max(room, 0)):
+                    pending[io_pool.submit(fetch, task)] = (task, False)
+
+            top_up()
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    task, decoded = pending.pop(future)
+                    try:
+                        path = future.result()
+                    # a single bad station should not take the whole run down
+                    # pylint: disable=broad-except
+                    except Exception:
+                        LOG.exception(
+                            "failed to %s %s", "decode" if decoded else "fetch", task
+                        )
+                        yield finish(task, None)
+                        continue
+
+                    if path is None or decoded or is_decoded(path):
+                        yield finish(task, path)
+                    else:
+                        # a raw file, count what we fetched
+                        counts["rinex_bytes"] += _file_size(path)
+                        pending[cpu_pool.submit(decode, path)] = (task, True)
+                top_up()
@@ -6,7 +6,7 @@ belong in here
 """
 from __future__ import annotations  # defer type annotations due to circular stuff
 
-from typing import cast, TYPE_CHECKING, Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
 import numpy
 
 from laika import constants
@@ -16,7 +16,7 @@ from tid import types
 
 # deal with circular type definitions
 if TYPE_CHECKING:
-    from tid.connections import Connection
+    from tid.connections import Connection, ConnectionTable
 
 K = 40.308e16
 M_TO_TEC = 6.158  # meters of L1 error to TEC
@@ -146,15 +146,60 @@ def calculate_vtecs(connection: Connection) -> numpy.ndarray:
     """
     delay_factor = calc_delay_factor(connection)
     delays = calc_carrier_delays(connection, delay_factor)
-    elevations = connection.elevation(
-        cast(types.ECEF_XYZ, connection.observations["sat_pos"])
-    )
 
     # total electron count integrated across the whole ionosphere
     slant_tec = delays * delay_factor / K
     # correction factor due to angle
-    s_to_v_factors = s_to_v_factor(elevations)
+    s_to_v_factors = connection.geometry["s_to_v"]
+
+    return numpy.array([slant_tec * s_to_v_factors, s_to_v_factors])
+
+
+def calculate_table_vtecs(
+    table: ConnectionTable,
+    chan1_phases: numpy.ndarray,
+    chan2_phases: numpy.ndarray,
+    s_to_v_factors: numpy.ndarray,
+) -> numpy.ndarray:
+    """
+    calculate_vtecs for every connection in a table at once
+
+    Args:
+        table: the connections of interest
+        chan1_phases: L1C carrier phase of each of their observations, in cycles
+        chan2_phases: L2C carrier phase of each of their observations, in cycles
+        s_to_v_factors: unitless slant factor of each of their observations
+
+    Returns:
+        numpy array of (
+            TEC counts in TECu (1e16 electrons/m^2),
+            unitless slant factors
+        )
+    """
+    scenario = table.scenario
+    con_ids = table.con_ids
+    f1, f2 = table.frequencies[con_ids].T
+    delay_factor = ((f1**2) * (f2**2)) / ((f1**2) - (f2**2))
+
+    sat_biases = numpy.array([scenario.sat_biases.get(prn, 0) for prn in table.prns])
+    station_bias_vectors = numpy.array(
+        [scenario.rcvr_biases.get(station, (0, 0, 0)) for station in table.stations]
+    ).reshape((-1, 3))
+    vectors = station_bias_vectors[table.station]
+    # glonass station bias has a channel dependence
+    station_biases = numpy.where(
+        table.is_glonass,
+        vectors[:, 1] + table.glonass_chan * vectors[:, 2],
+        vectors[:, 0],
+    )
+    bias_terms = sat_biases[table.prn] - station_biases
 
+    delays = (
+        C * (chan1_phases / f1 - chan2_phases / f2)
+        + table.carrier_correction[con_ids]
+        + bias_terms[con_ids] * K / delay_factor
+    )
+    slant_tec = delays * delay_factor / K
     return numpy.array([slant_tec * s_to_v_factors, s_to_v_factors])
 
 
@@ -186,19 +231,10 @@ def ion_locs(
 
     common = numpy.sqrt(b**2 - (4 * a * c)) / (2 * a)
     b_scaled = -b / (2 * a)
-    # TODO, I think the there is a clever way to vectorize the loop below
-    # solutions = numpy.stack((b_scaled + common, b_scaled - common), axis=1)
+    x, y = b_scaled + common, b_scaled - common
 
     # for each solution, use the one with the smallest absolute value
     # (that is the closest intersection, the other is the further intersection)
-    scale = numpy.zeros(sat_pos.shape)
-    for i, (x, y) in enumerate(zip(b_scaled + common, b_scaled - common)):
-        if abs(x) < abs(y):
-            smallest = x
-        else:
-            smallest = y
-        scale[i][0] = smallest
-        scale[i][1] = smallest
-        scale[i][2] = smallest
-
-    return rec_pos + (sat_pos - rec_pos) * scale
+    scale = numpy.where(numpy.abs(x) < numpy.abs(y), x, y)
+
+    return rec_pos + (sat_pos - rec_pos) * scale[:, numpy.newaxis]
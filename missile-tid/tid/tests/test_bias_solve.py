@@ -1,6 +1,7 @@
 """
 Tests for bias solving routines
 """
+import collections
 from dataclasses import dataclass
 import random
 from tid import bias_solve
@@ -8,28 +9,31 @@ from typing import cast, Any, Dict, List
 
 import numpy
 
-from laika.lib import coordinates
-
 
 @dataclass
-class ConnTickMap:
-    connections: List
-
+class FakeTable:
+    """
+    The columns of a ConnectionTable the bias solver uses
+    """
 
-@dataclass
-class FakeConnection:
-    station: str
-    prn: str
+    stations: List[str]
+    prns: List[str]
+    station: numpy.ndarray
+    prn: numpy.ndarray
+    is_glonass: numpy.ndarray
+    glonass_chan: numpy.ndarray
+    con_ids: numpy.ndarray
     ticks: numpy.ndarray
-    ipps: numpy.ndarray
+    latlons: numpy.ndarray
     vtecs: numpy.ndarray
-    is_glonass: bool
-    glonass_chan: int
 
 
 @dataclass
 class FakeScenario:
-    conn_map: Dict
+    table: FakeTable
+
+    def connection_table(self):
+        return self.table
 
 
 def generate_data(station_count=4, sat_count=4, duration=240):
@@ -58,17 +62,14 @@ def generate_data(station_count=4, sat_count=4, duration=240):
         (numpy.reshape(lats, 16), numpy.reshape(lons, 16), numpy.zeros(16)), axis=1
     )
 
-    # ipps from connections are ECEF XYZ
-    ipps_allowed = coordinates.geodetic2ecef(coords)
-
     # pick TECu values for each IPP and each tick
     TEC_truths = numpy.random.rand(duration, 16) * 50
 
-    connection_data = cast(Dict[str, Dict[str, Any]], {})
-    for station in stations:
-        connection_data[station] = dict()
-        for sat in sats:
-            ipps = numpy.zeros((duration, 3))
+    # one connection per station and satellite, lasting the whole time
+    columns = cast(Dict[str, List[Any]], collections.defaultdict(list))
+    for station_idx, station in enumerate(stations):
+        for sat_idx, sat in enumerate(sats):
+            latlons = numpy.zeros((duration, 2))
             vtecs = numpy.zeros((duration, 2))
             ticks = numpy.arange(duration)
 
@@ -82,7 +83,7 @@ def generate_data(station_count=4, sat_count=4, duration=240):
                 slant = numpy.random.rand() * 0.5 + 0.25
 
                 TEC = TEC_truths[tick][loc]
-                ipps[tick] = ipps_allowed[loc]
+                latlons[tick] = coords[loc, 0:2]
 
                 if not is_glonass:
                     station_bias = station_biases[station][0]
@@ -94,15 +95,28 @@ def generate_data(station_count=4, sat_count=4, duration=240):
                 measurement = TEC + (station_bias - sat_biases[sat]) * slant
                 vtecs[tick] = (measurement, slant)
 
-            connection_data[station][sat] = ConnTickMap(
-                [
-                    FakeConnection(
-                        station, sat, ticks, ipps, vtecs.T, is_glonass, glonass_chan
-                    )
-                ]
-            )
-
-    return FakeScenario(connection_data), sat_biases, station_biases
+            columns["station"].append(station_idx)
+            columns["prn"].append(sat_idx)
+            columns["is_glonass"].append(is_glonass)
+            columns["glonass_chan"].append(glonass_chan)
+            columns["con_ids"].append(numpy.full(duration, len(columns["con_ids"])))
+            columns["ticks"].append(ticks)
+            columns["latlons"].append(latlons)
+            columns["vtecs"].append(vtecs)
+
+    table = FakeTable(
+        stations,
+        sats,
+        numpy.array(columns["station"]),
+        numpy.array(columns["prn"]),
+        numpy.array(columns["is_glonass"]),
+        numpy.array(columns["glonass_chan"]),
+        numpy.concatenate(columns["con_ids"]),
+        numpy.concatenate(columns["ticks"]),
+        numpy.concatenate(columns["latlons"]),
+        numpy.concatenate(columns["vtecs"]).T,
+    )
+    return FakeScenario(table), sat_biases, station_biases
 
 
 def true_error(
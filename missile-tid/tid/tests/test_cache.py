@@ -0,0 +1,140 @@
+"""
+Tests for the on-disk caches
+"""
+from datetime import datetime, timedelta
+import json
+
+import numpy
+
+from tid import cache
+
+DTYPE = numpy.dtype([("tick", "i4"), ("C1C", "f8"), ("L1C", "f8")])
+
+
+def _observations(ticks):
+    data = numpy.zeros(len(ticks), dtype=DTYPE)
+    data["tick"] = ticks
+    data["C1C"] = numpy.random.rand(len(ticks)) * 2e7
+    data["L1C"] = numpy.random.rand(len(ticks)) * 1e8
+    return data
+
+
+def test_station_day_roundtrip(tmp_path):
+    """
+    What we write is what we get back, and writes to it stay in memory
+    """
+    data = {"G01": _observations(range(10)), "R05": _observations(range(3, 40))}
+    path = cache.station_day_path(str(tmp_path / "abcd1630.19o"))
+    epoch = numpy.datetime64("2019-06-12T00:00:00")
+    cache.write_station_day(
+        path, data, epoch, numpy.array([1.0, 2.0, 3.0]), {"R05": -2}
+    )
+
+    assert cache.is_station_day(path, DTYPE)
+    restored = cache.read_station_day(path, DTYPE)
+    assert restored is not None
+    assert restored.epoch == epoch
+    assert restored.glonass_slots == {"R05": -2}
+    numpy.testing.assert_array_equal(restored.position, [1.0, 2.0, 3.0])
+    assert sorted(restored.data) == ["G01", "R05"]
+    for prn, observations in data.items():
+        numpy.testing.assert_array_equal(restored.data[prn], observations)
+
+    # copy-on-write: the cache itself is untouched
+    restored.data["G01"]["tick"] += 100
+    again = cache.read_station_day(path, DTYPE)
+    assert again is not None
+    numpy.testing.assert_array_equal(again.data["G01"]["tick"], range(10))
+
+
+def test_station_day_dtype_mismatch(tmp_path):
+    """
+    Entries written with a different record layout are treated as missing
+    """
+    path = cache.station_day_path(str(tmp_path / "abcd1630.19o"))
+    cache.write_station_day(
+        path, {"G01": _observations(range(5))}, numpy.datetime64("2019-06-12"), None
+    )
+    assert cache.read_station_day(path, [("tick", "i4"), ("C1C", "f8")]) is None
+    assert cache.read_station_day(str(tmp_path / "missing.dense.json"), DTYPE) is None
+    assert not cache.is_station_day(path, [("tick", "i4"), ("C1C", "f8")])
+
+
+def test_station_day_stale_version(tmp_path):
+    """
+    Entries written by another cache version don't count as cached
+    """
+    path = cache.station_day_path(str(tmp_path / "abcd1630.19o"))
+    cache.write_station_day(
+        path, {"G01": _observations(range(5))}, numpy.datetime64("2019-06-12"), None
+    )
+    assert cache.is_station_day(path, DTYPE)
+
+    with open(path, encoding="utf-8") as fin:
+        sidecar = json.load(fin)
+    sidecar["version"] = cache.CACHE_VERSION - 1
+    with open(path, "w", encoding="utf-8") as fout:
+        json.dump(sidecar, fout)
+
+    assert not cache.is_station_day(path, DTYPE)
+    assert cache.read_station_day(path, DTYPE) is None
+
+
+def test_negative_cache(tmp_path):
+    """
+    Failures should be remembered across instances, for longer the older the
+    data, and only briefly when they might have been temporary
+    """
+    path = str(tmp_path / "sub" / cache.UNAVAILABLE_FILE)
+    now = datetime(2022, 3, 1, 12)
+    recent, old = datetime(2022, 3, 1, 6), datetime(2021, 1, 1)
+
+    negative = cache.NegativeCache(path)
+    assert negative.check("a/b/1", old, now=now) is None
+    negative.record("a/b/1", old, "not found", now=now)
+    negative.record("a/b/2", recent, "not found", now=now)
+    negative.record("a/b/3", old, "TimeoutError()", missing=False, now=now)
+
+    # a fresh instance (eg another process) sees the same thing
+    negative = cache.NegativeCache(path)
+    later = now + timedelta(hours=1)
+    assert negative.check("a/b/1", old, now=later)["error"] == "not found"
+    assert negative.check("a/b/2", recent, now=later) is None
+    assert negative.check("a/b/3", old, now=later) is None
+    assert negative.check("a/b/1", old, now=now + timedelta(days=91)) is None
+
+    # newer records replace older ones
+    negative.record("a/b/1", old, "still not found", now=later)
+    assert cache.NegativeCache(path).check("a/b/1", old, now=later)["error"] == (
+        "still not found"
+    )
+
+
+def test_negative_cache_compaction(tmp_path, monkeypatch):
+    """
+    Expired and superseded records are dropped, from memory and from the file
+    """
+    monkeypatch.setattr(cache, "UNAVAILABLE_COMPACT_AFTER", 10)
+    path = str(tmp_path / cache.UNAVAILABLE_FILE)
+    now = datetime(2022, 3, 1, 12)
+    old = datetime(2021, 1, 1)
+
+    negative = cache.NegativeCache(path)
+    # briefly unavailable, then long gone
+    for i in range(20):
+        negative.record(f"a/b/{i}", old, "TimeoutError()", missing=False, now=now)
+    later = now + timedelta(hours=1)
+    negative.record("a/b/0", old, "not found", now=later)
+    negative.record("a/b/1", old, "not found", now=later)
+
+    with open(path, encoding="utf-8") as fin:
+        assert [json.loads(line)["key"] for line in fin] == ["a/b/0", "a/b/1"]
+    # pylint: disable=protected-access
+    assert sorted(negative._entries) == ["a/b/0", "a/b/1"]
+
+    # others notice the file was replaced, and keep appending to the new one
+    other = cache.NegativeCache(path)
+    assert other.check("a/b/0", old, now=later)["error"] == "not found"
+    negative.record("a/b/2", old, "not found", now=later)
+    assert other.check("a/b/2", old, now=later)["error"] == "not found"
+    assert other.check("a/b/5", old, now=later) is None
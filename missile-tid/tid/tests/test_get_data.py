@@ -0,0 +1,364 @@
+"""
+Tests for the conversions into our dense data format
+"""
+import concurrent.futures
+from datetime import datetime, timedelta
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import types
+from unittest import mock
+import zipfile
+
+from atomicwrites import atomic_write
+import numpy
+import pytest
+import xarray
+
+from laika.gps_time import GPSTime
+
+from tid import cache, get_data, mirrors, orbits
+from tid.tests.test_rinex import write_rinex
+
+START = datetime(2019, 6, 12)
+STATION_POS = numpy.array([-3.9e6, 3.4e6, 3.6e6])
+
+
+def fake_dataset(epochs: int = 2880, sats: int = 64, seed: int = 0) -> xarray.Dataset:
+    """
+    Something that looks like what georinex gives for a day of 30s data:
+    satellites come and go, fields are sometimes missing, and one satellite
+    has no C2 at all (so needs P2 instead)
+    """
+    rand = numpy.random.default_rng(seed)
+    svs = [f"G{i:02d}" for i in range(1, 33)] + [f"R{i:02d}" for i in range(1, 33)]
+    svs = svs[:sats]
+    times = numpy.datetime64(START) + numpy.arange(epochs) * numpy.timedelta64(30, "s")
+
+    # each satellite is visible for one contiguous stretch
+    rise = rand.integers(0, epochs, len(svs))
+    visible = numpy.arange(epochs)[:, None] - rise[None, :]
+    visible = (visible >= 0) & (visible < epochs // 3)
+
+    data = {}
+    for name in ("C1", "C2", "P2", "L1", "L2"):
+        values = rand.uniform(2e7, 2.6e7, (epochs, len(svs)))
+        values[~visible | (rand.random((epochs, len(svs))) < 0.02)] = numpy.nan
+        data[name] = (("time", "sv"), values)
+    data["C2"][1][:, 1] = numpy.nan
+    return xarray.Dataset(data, coords={"time": times, "sv": svs})
+
+
+def test_from_xarray_matches_per_satellite():
+    """
+    The batch conversion should give exactly what converting satellite by
+    satellite gives, and be a good deal faster about it
+    """
+    dataset = fake_dataset()
+    start_date = GPSTime.from_datetime(START)
+
+    begin = time.perf_counter()
+    expected = {
+        sv: get_data.from_xarray_sat(dataset.sel(sv=sv), start_date)
+        for sv in dataset.sv.to_numpy()
+    }
+    loop_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    actual = get_data.from_xarray(dataset, start_date)
+    batch_time = time.perf_counter() - begin
+
+    assert sorted(actual) == sorted(expected)
+    for prn, data in expected.items():
+        assert len(data) > 0
+        for field in ("tick", "C1C", "C2C", "L1C", "L2C"):
+            numpy.testing.assert_array_equal(data[field], actual[prn][field])
+    assert not numpy.isnan(actual["G02"]["C2C"]).all()
+
+    print(f"per satellite: {loop_time:.3f}s, batch: {batch_time:.3f}s")
+    assert batch_time * 3 < loop_time
+
+
+def _chunk(ticks, value):
+    data = numpy.zeros(len(ticks), dtype=get_data.DENSE_TYPE)
+    data["tick"] = ticks
+    data["C1C"] = value
+    return data
+
+
+def test_accumulator():
+    """
+    Chunks should come out sorted by tick, with the first chunk winning
+    where they overlap, and a lone chunk should not be copied
+    """
+    accumulator = get_data.DenseAccumulator()
+    assert not accumulator
+    accumulator.add({"G01": _chunk([120, 121, 122], 2.0), "G02": _chunk([5, 6], 1.0)})
+    accumulator.add({"G01": _chunk([0, 1, 2, 120], 1.0)})
+    accumulator.add({"G01": _chunk([], 3.0)})
+    assert accumulator
+
+    merged = accumulator.merged()
+    numpy.testing.assert_array_equal(merged["G01"]["tick"], [0, 1, 2, 120, 121, 122])
+    numpy.testing.assert_array_equal(merged["G01"]["C1C"], [1, 1, 1, 2, 2, 2])
+    assert merged["G02"] is accumulator.chunks["G02"][0]
+
+
+class FakeKoreanServer:
+    """
+    Stands in for gnssdata.or.kr: one zip holding a zip per station
+    """
+
+    def __init__(self, have):
+        self.have = have
+        self.posts = []
+
+    def post(self, url, data):
+        self.posts.append(data)
+        return types.SimpleNamespace(text=json.dumps({"result": True, "key": 7}))
+
+    def get(self, url, stream=False):
+        assert stream
+        outer = io.BytesIO()
+        with zipfile.ZipFile(outer, "w") as outer_zip:
+            for station in self.posts[-1]["corsId"].split(","):
+                if station.lower() not in self.have:
+                    continue
+                inner = io.BytesIO()
+                with zipfile.ZipFile(inner, "w") as inner_zip:
+                    inner_zip.writestr(f"{station}1630.19o", f"obs for {station}")
+                    inner_zip.writestr(f"{station}1630.19n", "nav")
+                outer_zip.writestr(f"{station}.zip", inner.getvalue())
+        content = outer.getvalue()
+        return mock.MagicMock(
+            __enter__=lambda self: self,
+            iter_content=lambda size: [
+                content[i : i + size] for i in range(0, len(content), size)
+            ],
+        )
+
+
+def test_korean_batch(tmp_path, monkeypatch):
+    """
+    All of a day's planned Korean stations should come in one request
+    """
+    server = FakeKoreanServer(have={"suwn", "daej", "chlw"})
+    monkeypatch.setattr(get_data.scheduler, "session", lambda: server)
+    dog = types.SimpleNamespace(cache_dir=str(tmp_path) + "/")
+    day = GPSTime.from_datetime(START)
+
+    batches = get_data.KoreanBatches()
+    batches.plan(day, ["suwn", "daej", "chlw", "gone"])
+    path = batches.fetch(dog, day, "daej")
+    assert open(path, encoding="utf-8").read() == "obs for DAEJ"
+    assert server.posts[0]["corsId"] == "CHLW,DAEJ,GONE,SUWN"
+
+    assert batches.fetch(dog, day, "suwn").endswith("suwn1630.19o")
+    assert batches.fetch(dog, day, "gone") is None
+    # not planned, so on its own
+    assert batches.fetch(dog, day, "nope") is None
+    assert [post["corsId"] for post in server.posts] == ["CHLW,DAEJ,GONE,SUWN", "NOPE"]
+
+
+def _logged(log_path: str, func):
+    """
+    Wrap a function to note each call in a file shared between processes
+    """
+
+    def wrapper(*args, **kwargs):
+        with open(log_path, "a", encoding="utf-8") as fout:
+            fout.write(f"{func.__name__} {os.path.basename(str(args[0]))}\n")
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _run_job(tasks):
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        return [
+            result[2] and os.path.normpath(result[2])
+            for result in pool.map(get_data.download_and_process, tasks)
+        ]
+
+
+def test_single_flight(tmp_path, monkeypatch):
+    """
+    Jobs running at the same time against the same cache should each get
+    every station-day, but it should only be fetched and decoded once
+    """
+    cache_dir = str(tmp_path / "cache") + "/"
+    log_path = str(tmp_path / "calls.log")
+    monkeypatch.setattr(get_data.conf, "cache_dir", cache_dir)
+    monkeypatch.setattr(
+        get_data,
+        "unavailable",
+        cache.NegativeCache(os.path.join(cache_dir, cache.UNAVAILABLE_FILE)),
+    )
+    source = tmp_path / "source.19o"
+    write_rinex(source, epochs=10)
+    day = GPSTime.from_datetime(START)
+
+    def fetch(station, date):
+        time.sleep(0.1)  # give the others a chance to pile in
+        if station == "miss":
+            return None
+        path = cache_dir + date.as_datetime().strftime(
+            f"cors_obs/%Y/%j/{station}%j0.%yo"
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, mode="wb", overwrite=True) as fout:
+            fout.write(source.read_bytes())
+        return path
+
+    def fetch_rinex_for_station(dog, date, station, partial):
+        # like the real downloaders, use what's already been downloaded
+        path = cache_dir + date.as_datetime().strftime(
+            f"cors_obs/%Y/%j/{station}%j0.%yo"
+        )
+        if os.path.isfile(path):
+            return path
+        return _logged(log_path, fetch)(station, date)
+
+    monkeypatch.setattr(get_data, "fetch_rinex_for_station", fetch_rinex_for_station)
+    monkeypatch.setattr(
+        get_data.rinex, "read_obs", _logged(log_path, get_data.rinex.read_obs)
+    )
+
+    stations = ["aaaa", "bbbb", "cccc", "dddd", "miss"]
+    tasks = [(day, station, False) for station in stations]
+    with multiprocessing.get_context("fork").Pool(8) as pool:
+        jobs = pool.map(_run_job, [tasks] * 8)
+
+    for results in jobs:
+        assert results[:-1] == jobs[0][:-1]
+        assert all(get_data._is_processed(path) for path in results[:-1])
+        assert results[-1] is None
+    with open(log_path, encoding="utf-8") as fin:
+        calls = sorted(fin.read().splitlines())
+    assert calls == sorted(
+        [f"fetch {station}" for station in stations]
+        + [f"read_obs {station}1630.19o" for station in stations[:-1]]
+    )
+
+
+def test_stale_station_day(tmp_path, monkeypatch):
+    """
+    A station-day cached by another cache version is decoded again, in place
+    """
+    monkeypatch.setattr(get_data.conf, "cache_dir", str(tmp_path))
+    raw = str(tmp_path / "cors_obs/2019/163/abcd1630.19o")
+    os.makedirs(os.path.dirname(raw))
+    write_rinex(raw, epochs=10)
+    day = GPSTime.from_datetime(START)
+
+    path = get_data.decode_rinex(raw)
+    assert get_data._processed_path(day, "abcd", False) == path
+
+    with open(path, encoding="utf-8") as fin:
+        sidecar = json.load(fin)
+    sidecar["version"] = cache.CACHE_VERSION - 1
+    with open(path, "w", encoding="utf-8") as fout:
+        json.dump(sidecar, fout)
+    assert get_data._processed_path(day, "abcd", False) is None
+
+    assert get_data.decode_rinex(raw) == path
+    assert get_data._is_processed(path)
+    assert get_data._processed_path(day, "abcd", False) == path
+
+
+def test_fetch_failure_is_not_missing(tmp_path, monkeypatch):
+    """
+    A station-day whose mirrors failed isn't remembered as missing,
+    but one they don't have is
+    """
+    monkeypatch.setattr(get_data.conf, "cache_dir", str(tmp_path))
+    unavailable = cache.NegativeCache(str(tmp_path / cache.UNAVAILABLE_FILE))
+    monkeypatch.setattr(get_data, "unavailable", unavailable)
+    day = GPSTime.from_datetime(START)
+
+    def fetch_rinex_for_station(dog, date, station, partial):
+        if station == "busy":
+            raise mirrors.FetchError("https://busy.example/file.gz: timed out")
+        return None
+
+    monkeypatch.setattr(get_data, "fetch_rinex_for_station", fetch_rinex_for_station)
+
+    with pytest.raises(mirrors.FetchError):
+        get_data.fetch_station_day((day, "busy", False))
+    assert get_data.fetch_station_day((day, "gone", False)) is None
+
+    with open(unavailable.path, encoding="utf-8") as fin:
+        entries = {entry["key"].split("/")[1]: entry for entry in map(json.loads, fin)}
+    assert not entries["busy"]["missing"]
+    assert entries["gone"]["missing"]
+
+
+def test_parallel_populate_orbit_race(monkeypatch):
+    """
+    Stations that finish before the orbits are ready get checked against them
+    once they are, and stations that finish after get checked straight away
+    """
+    orbit_table = orbits.OrbitTable(
+        ["G01"], numpy.ones((1, 11, 3)), numpy.zeros((1, 11, 3))
+    )
+    release = threading.Event()
+    ready = threading.Event()
+
+    def build_orbit_table(dog, start_time, duration):
+        release.wait(5)
+        ready.set()
+        return orbit_table
+
+    def observations(ticks):
+        data = numpy.zeros(len(ticks), dtype=get_data.DENSE_TYPE)
+        data["tick"] = ticks
+        return data
+
+    stations = {
+        # G05 isn't in the orbit table, and the table ends at tick 10
+        name: {"G01": observations(numpy.arange(15)), "G05": observations([1, 2])}
+        for name in ("early", "late")
+    }
+    checked = []
+    drop_unknown_orbits = get_data.drop_unknown_orbits
+
+    def logged_drop(table, station, data):
+        checked.append(station)
+        drop_unknown_orbits(table, station, data)
+
+    class FakeScheduler:
+        def __init__(self, **kwargs):
+            pass
+
+        def stream(self, tasks, fetch, decode, is_decoded, progress=None):
+            by_station = {task[1]: task for task in tasks}
+            yield by_station["early"], "early"
+            assert not checked
+            release.set()
+            ready.wait(5)
+            time.sleep(0.1)  # for the future to be marked done
+            yield by_station["late"], "late"
+            # both checked as soon as the orbits were in
+            assert checked == ["early", "late"]
+
+    monkeypatch.setattr(get_data, "build_orbit_table", build_orbit_table)
+    monkeypatch.setattr(get_data, "drop_unknown_orbits", logged_drop)
+    monkeypatch.setattr(get_data.scheduler, "DownloadScheduler", FakeScheduler)
+    monkeypatch.setattr(
+        get_data,
+        "_load_station_chunks",
+        lambda results, start_date: (STATION_POS, stations[results[0]]),
+    )
+
+    locs, data, table = get_data.parallel_populate_data(
+        ["early", "late"], GPSTime.from_datetime(START), timedelta(hours=1), None
+    )
+    assert table is orbit_table
+    assert sorted(checked) == ["early", "late"]
+    assert sorted(locs) == ["early", "late"]
+    for name in ("early", "late"):
+        assert list(data[name]) == ["G01"]
+        numpy.testing.assert_array_equal(data[name]["G01"]["tick"], range(11))
@@ -0,0 +1,94 @@
+"""
+Tests for parsing and caching archive directory listings
+"""
+from datetime import datetime, timedelta
+import os
+
+from tid import listings
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "listings")
+DATE = datetime(2019, 6, 12)
+
+
+def _fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as fin:
+        return fin.read()
+
+
+def test_parse_noaa():
+    """
+    The day's directory has one subdirectory per station
+    """
+    listing = listings.parse_html(_fixture("noaa_2019_163.html"))
+    assert listing == {
+        "1lsu": None,
+        "1nsu": None,
+        "ab01": None,
+        "slac": None,
+        "zdc1": None,
+        "brdc1630.19n.gz": 97 * 1024,
+    }
+
+
+def test_parse_japan():
+    """
+    Table style indexes have each column in its own cell
+    """
+    listing = listings.parse_html(_fixture("japan_2019_163.html"))
+    assert listing == {
+        "00011630.19o.gz": int(1.4 * 1024 * 1024),
+        "00021630.19o.gz": int(1.3 * 1024 * 1024),
+        "0003163a.19o.gz": 61 * 1024,
+    }
+
+
+def test_parse_cddis():
+    listing = listings.parse_cddis(_fixture("cddis_2019_163_19d.txt"))
+    assert len(listing) == 4
+    assert listing["slac1630.19d.Z"] == 1020455
+
+
+def test_parse_ftp():
+    listing = listings.parse_ftp(_fixture("garner_2019_163.txt").splitlines())
+    assert listing == {
+        "ac601630.19o.Z": 812345,
+        "ac611630.19o.Z": 790111,
+        "p4941630.19o.Z": 655360,
+        "latest": 14,
+    }
+
+
+def test_index(tmp_path, monkeypatch):
+    """
+    Listings should be fetched once and cached on disk, and listings of
+    recent days fetched again once they may have changed
+    """
+    fetched = []
+
+    def fetch(url: str) -> listings.Listing:
+        fetched.append(url)
+        if "broken" in url:
+            raise IOError("connection reset")
+        return listings.parse_html(_fixture("noaa_2019_163.html"))
+
+    monkeypatch.setattr(listings, "_fetch", fetch)
+    url = "https://geodesy.noaa.gov/corsdata/rinex/2019/163/"
+
+    index = listings.ListingIndex(str(tmp_path))
+    assert index.has("noaa", url, "slac", DATE)
+    assert not index.has("noaa", url, "zzzz", DATE)
+    assert fetched == [url]
+
+    # another process picks it up from disk
+    assert "slac" in listings.ListingIndex(str(tmp_path)).get("noaa", url, DATE)
+    assert fetched == [url]
+
+    # if we can't get a listing, we just don't know
+    assert index.has("noaa", "https://broken.example/2019/163/", "zzzz", DATE)
+
+    recent = datetime.utcnow()
+    index.get("noaa", url + "recent/", recent, now=recent)
+    index.get("noaa", url + "recent/", recent, now=recent + timedelta(minutes=5))
+    assert fetched.count(url + "recent/") == 1
+    index.get("noaa", url + "recent/", recent, now=recent + timedelta(hours=1))
+    assert fetched.count(url + "recent/") == 2
@@ -0,0 +1,92 @@
+"""
+Tests for racing mirrors against each other
+"""
+import gzip
+import threading
+import time
+
+import pytest
+import requests
+
+from tid import mirrors
+
+RINEX = b"     2.11           OBSERVATION DATA    G (GPS)             RINEX VERSION / TYPE\n"
+
+
+def test_fetch_first(tmp_path, monkeypatch):
+    """
+    A slow mirror shouldn't hold us up, a broken one shouldn't stop us, and
+    next time the mirror that won should be tried first
+    """
+    monkeypatch.setattr(
+        mirrors, "stats", mirrors.MirrorStats(str(tmp_path / mirrors.STATS_FILE))
+    )
+    started = []
+    cancelled = threading.Event()
+
+    def download(url: str, cancel: threading.Event) -> bytes:
+        started.append(url)
+        if "slow" in url:
+            cancel.wait(5)
+            cancelled.set()
+            raise mirrors._Cancelled  # pylint: disable=protected-access
+        if "broken" in url:
+            return b"<html>Not Found</html>"
+        time.sleep(0.05)
+        return gzip.compress(RINEX)
+
+    monkeypatch.setattr(mirrors, "_download_http", download)
+
+    mirror_list = [
+        mirrors.Mirror("test", "https://slow.example/file.gz"),
+        mirrors.Mirror("test", "https://broken.example/file.gz"),
+        mirrors.Mirror("test", "https://good.example/file.gz"),
+    ]
+    dest = tmp_path / "file.o"
+    begin = time.perf_counter()
+    assert mirrors.fetch_first(mirror_list, str(dest), stagger=0.1) == str(dest)
+    assert time.perf_counter() - begin < 1
+    assert dest.read_bytes() == RINEX
+    assert cancelled.is_set()
+
+    assert mirrors.stats.servers["good.example"]["successes"] == 1
+    assert mirrors.stats.servers["broken.example"]["successes"] == 0
+    assert "slow.example" not in mirrors.stats.servers
+
+    reloaded = mirrors.MirrorStats(str(tmp_path / mirrors.STATS_FILE))
+    assert reloaded.order(mirror_list)[0].url == "https://good.example/file.gz"
+
+    # nothing to fetch once it's cached
+    started.clear()
+    assert mirrors.fetch_first(mirror_list, str(dest)) == str(dest)
+    assert not started
+
+    # an error page doesn't mean the file isn't there
+    with pytest.raises(mirrors.FetchError):
+        mirrors.fetch_first(mirror_list[1:2], str(tmp_path / "other.o"))
+
+
+def test_fetch_first_missing(tmp_path, monkeypatch):
+    """
+    Only a mirror saying it doesn't have the file counts as not found,
+    anything else might work next time
+    """
+    monkeypatch.setattr(
+        mirrors, "stats", mirrors.MirrorStats(str(tmp_path / mirrors.STATS_FILE))
+    )
+
+    def download(url: str, cancel: threading.Event) -> bytes:
+        response = requests.Response()
+        response.status_code = 404 if "gone" in url else 503
+        response.raise_for_status()
+        return b""
+
+    monkeypatch.setattr(mirrors, "_download_http", download)
+
+    gone = mirrors.Mirror("test", "https://gone.example/file.gz")
+    busy = mirrors.Mirror("test", "https://busy.example/file.gz")
+    dest = str(tmp_path / "file.o")
+    assert mirrors.fetch_first([gone], dest, stagger=0.01) is None
+    with pytest.raises(mirrors.FetchError, match="busy.example"):
+        mirrors.fetch_first([gone, busy], dest, stagger=0.01)
+    assert mirrors.stats.servers["busy.example"]["attempts"] == 1
@@ -0,0 +1,159 @@
+"""
+Tests for the Chebyshev orbit interpolants
+"""
+from datetime import datetime, timedelta
+
+import numpy
+import pytest
+
+from laika.gps_time import GPSTime
+
+from tid import orbits
+
+RADIUS = 26_560e3  # GPS orbit radius, meters
+RATE = 2 * numpy.pi / 43_082  # GPS orbits twice per sidereal day, radians/second
+START = GPSTime.from_datetime(datetime(2019, 6, 12, 3, 20))
+
+
+def fake_orbit(seconds, phase):
+    """
+    Circular orbit inclined 55 degrees, position and velocity at some times
+    (seconds since the GPS epoch)
+    """
+    angle = RATE * numpy.asarray(seconds) + phase
+    incl = numpy.radians(55)
+    pos = RADIUS * numpy.stack(
+        [
+            numpy.cos(angle),
+            numpy.sin(angle) * numpy.cos(incl),
+            numpy.sin(angle) * numpy.sin(incl),
+        ],
+        axis=-1,
+    )
+    vel = (
+        RADIUS
+        * RATE
+        * numpy.stack(
+            [
+                -numpy.sin(angle),
+                numpy.cos(angle) * numpy.cos(incl),
+                numpy.cos(angle) * numpy.sin(incl),
+            ],
+            axis=-1,
+        )
+    )
+    return pos, vel
+
+
+def fake_sat_info(time):
+    """
+    Stand in for get_sat_info_old_okay: two satellites, one of which is only
+    known before 05:00
+    """
+    seconds = time.week * 604800 + time.tow
+    res = {"G01": fake_orbit(seconds, 0.0) + (0.0, 0.0)}
+    if time - START < 100 * 60:
+        res["R02"] = fake_orbit(seconds, 1.0) + (0.0, 0.0)
+    return res
+
+
+def test_interpolation(tmp_path):
+    """
+    Interpolated positions and velocities should match the orbit they were
+    fit from, and unknown spans should be NaN
+    """
+    sat_orbits = orbits.ChebyshevOrbits.build(
+        fake_sat_info, START, timedelta(hours=3), str(tmp_path)
+    )
+    assert "G01" in sat_orbits and "R02" in sat_orbits and "G02" not in sat_orbits
+
+    seconds = START - sat_orbits.epoch + numpy.linspace(0, 3 * 3600, 1000)
+    epoch = sat_orbits.epoch.week * 604800 + sat_orbits.epoch.tow
+    pos, vel = fake_orbit(epoch + seconds, 0.0)
+    numpy.testing.assert_allclose(sat_orbits.position("G01", seconds), pos, atol=1e-3)
+    numpy.testing.assert_allclose(sat_orbits.velocity("G01", seconds), vel, atol=1e-6)
+
+    glonass = sat_orbits.position("R02", seconds)
+    assert numpy.isfinite(glonass[seconds < 4 * 3600]).all()
+    assert numpy.isnan(glonass[seconds >= 5 * 3600]).all()
+
+
+def test_cached(tmp_path):
+    """
+    Fitted days should be re-used without going back to the ephemerides
+    """
+    first = orbits.ChebyshevOrbits.build(
+        fake_sat_info, START, timedelta(hours=1), str(tmp_path)
+    )
+
+    def no_ephemerides(time):
+        raise AssertionError("should have been cached")
+
+    second = orbits.ChebyshevOrbits.build(
+        no_ephemerides, START, timedelta(hours=1), str(tmp_path)
+    )
+    numpy.testing.assert_array_equal(first.coeffs, second.coeffs)
+
+    with pytest.raises(AssertionError):
+        orbits.ChebyshevOrbits.build(
+            no_ephemerides, START, timedelta(hours=2), str(tmp_path)
+        )
+
+
+def test_orbit_table(tmp_path):
+    """
+    The tabulated orbits plus light time kernel should agree with evaluating
+    the interpolants at the transmission time
+    """
+    sat_orbits = orbits.ChebyshevOrbits.build(
+        fake_sat_info, START, timedelta(hours=3), str(tmp_path)
+    )
+    table = orbits.OrbitTable.from_orbits(sat_orbits, START, 361)
+    assert table.tick_count == 361
+
+    ticks = numpy.arange(0, 361, 7)
+    pseudoranges = numpy.linspace(2.0e7, 2.6e7, len(ticks))
+    sent = START - sat_orbits.epoch + 30 * ticks - pseudoranges / 2.99792458e8
+    numpy.testing.assert_allclose(
+        table.sat_pos("G01", ticks, pseudoranges),
+        sat_orbits.position("G01", sent),
+        atol=1e-2,
+    )
+
+    known = table.known("R02", numpy.array([-1, 0, 199, 200, 360, 361]))
+    numpy.testing.assert_array_equal(known, [False, True, True, False, False, False])
+
+
+def test_gaps_refit(tmp_path):
+    """
+    Segments with ephemerides missing (eg a failed download) aren't saved as
+    fitted, so they are fitted again next time
+    """
+    # only fitted days whose ephemerides are final get saved
+    day = GPSTime.from_datetime(datetime(2019, 6, 12))
+    failing = {"count": 0}
+
+    def flaky_sat_info(time):
+        failing["count"] += 1
+        if failing["count"] == 3:
+            return {}
+        return fake_sat_info(time)
+
+    seconds = numpy.linspace(0, 3599, 100)
+    first = orbits.ChebyshevOrbits.build(
+        flaky_sat_info, day, timedelta(minutes=30), str(tmp_path)
+    )
+    assert numpy.isnan(first.position("G01", seconds)).all()
+
+    second = orbits.ChebyshevOrbits.build(
+        fake_sat_info, day, timedelta(minutes=30), str(tmp_path)
+    )
+    assert numpy.isfinite(second.position("G01", seconds)).all()
+
+    def no_ephemerides(time):
+        raise AssertionError("should have been cached")
+
+    third = orbits.ChebyshevOrbits.build(
+        no_ephemerides, day, timedelta(minutes=30), str(tmp_path)
+    )
+    numpy.testing.assert_array_equal(third.coeffs, second.coeffs)
@@ -0,0 +1,124 @@
+"""
+Tests for the native RINEX 2 parser
+"""
+from datetime import datetime, timedelta
+import random
+
+import georinex
+import numpy
+import pytest
+
+from laika.gps_time import GPSTime
+
+from tid import get_data, rinex
+
+OBS_TYPES = ["C1", "L1", "L2", "P1", "P2", "S1", "C2"]
+SATS = [f"G{i:02d}" for i in range(1, 12)] + ["R03", "R07", "R21", "E11"]
+
+
+def _header_line(content: str, label: str) -> str:
+    return f"{content:<60}{label}"
+
+
+def write_rinex(path, epochs: int = 40, seed: int = 0) -> None:
+    """
+    Write a small but awkward RINEX 2.11 file: mixed systems, more than 12
+    satellites per epoch, multi-line records, blank fields, an event record
+    and a satellite whose C2 is never reported.
+
+    Args:
+        path: where to write the file
+        epochs: how many 30 second epochs to write
+        seed: random seed for the values
+    """
+    rand = random.Random(seed)
+    start = datetime(2019, 6, 12)
+    lines = [
+        _header_line(
+            "     2.11           OBSERVATION DATA    M (MIXED)",
+            "RINEX VERSION / TYPE",
+        ),
+        _header_line("TEST", "MARKER NAME"),
+        _header_line(
+            "  -2705293.5530 -4283932.0120  3853329.4860", "APPROX POSITION XYZ"
+        ),
+        _header_line(
+            f"{len(OBS_TYPES):6d}" + "".join(f"{t:>6}" for t in OBS_TYPES),
+            "# / TYPES OF OBSERV",
+        ),
+        _header_line("    30.000", "INTERVAL"),
+        _header_line(
+            "  2019     6    12     0     0    0.0000000     GPS",
+            "TIME OF FIRST OBS",
+        ),
+        _header_line("", "END OF HEADER"),
+    ]
+    for epoch in range(epochs):
+        when = start + timedelta(seconds=30 * epoch)
+        if epoch == epochs // 2:
+            # event: header information follows
+            lines.append(f"{'':28}4  2")
+            lines.append(_header_line("mid-file comment", "COMMENT"))
+            lines.append(_header_line("another comment", "COMMENT"))
+        sats = [sat for sat in SATS if rand.random() > 0.1]
+        epoch_line = (
+            when.strftime(" %y %m %d %H %M")
+            + f"{when.second:11.7f}  0{len(sats):3d}"
+            + "".join(sats[:12])
+        )
+        lines.append(epoch_line)
+        for i in range(12, len(sats), 12):
+            lines.append(" " * 32 + "".join(sats[i : i + 12]))
+        for sat in sats:
+            fields = []
+            for obs_type in OBS_TYPES:
+                if rand.random() < 0.05 or (sat == "G02" and obs_type == "C2"):
+                    fields.append(" " * 16)
+                    continue
+                value = rand.uniform(-3e7, 3e7 if obs_type[0] == "L" else 2.6e7)
+                fields.append(f"{value:14.3f}{rand.choice(' 01')}{rand.randint(1, 9)}")
+            for i in range(0, len(fields), 5):
+                lines.append("".join(fields[i : i + 5]).rstrip())
+    with open(path, "w", encoding="ascii") as fout:
+        fout.write("\n".join(lines) + "\n")
+
+
+def test_matches_georinex(tmp_path):
+    """
+    The native parser should give exactly what georinex + from_xarray gives
+    """
+    path = tmp_path / "test1630.19o"
+    write_rinex(path)
+    start_date = GPSTime.from_datetime(datetime(2019, 6, 12))
+
+    expected = get_data.from_xarray(
+        georinex.load(path, interval=30, use=["G", "R"], fast=False), start_date
+    )
+    obs = rinex.read_obs(str(path), interval=30)
+    actual = get_data.from_rinex(obs, start_date)
+
+    numpy.testing.assert_allclose(
+        obs.position, [-2705293.553, -4283932.012, 3853329.486]
+    )
+    assert sorted(actual) == sorted(expected)
+    for prn, data in expected.items():
+        assert data.dtype == actual[prn].dtype
+        for field in ("tick", "C1C", "C2C", "L1C", "L2C"):
+            numpy.testing.assert_array_equal(data[field], actual[prn][field])
+
+
+def test_rejects_rinex3(tmp_path):
+    """
+    RINEX 3 files are not handled, so the caller can fall back to georinex
+    """
+    path = tmp_path / "test.rnx"
+    path.write_text(
+        _header_line(
+            "     3.03           OBSERVATION DATA    M", "RINEX VERSION / TYPE"
+        )
+        + "\n"
+        + _header_line("", "END OF HEADER")
+        + "\n"
+    )
+    with pytest.raises(ValueError):
+        rinex.read_obs(str(path))
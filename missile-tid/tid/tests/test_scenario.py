@@ -0,0 +1,633 @@
+"""
+Tests for scenarios
+"""
+from datetime import datetime
+import hashlib
+from types import SimpleNamespace
+
+import h5py
+import numpy
+import pytest
+
+from laika.lib import coordinates
+
+from tid import bias_solve, connections, get_data, orbits, scenario, tec, util
+
+F1, F2 = 1575.42e6, 1227.60e6
+START = datetime(2019, 6, 12, 3)
+STATION = coordinates.geodetic2ecef((35, 139, 0))
+
+
+class FakeDog:
+    """
+    Just enough of an AstroDog for making connections
+    """
+
+    cache_dir = "/tmp/"
+    nav: dict = {}
+
+    def get_frequency(self, prn, time, band):
+        return F1 if band == "C1C" else F2
+
+    def get_glonass_channel(self, prn, time):
+        return None
+
+
+def fake_observations(ticks):
+    """
+    A steady signal (so connections only break at gaps) at the given ticks
+    """
+    observations = numpy.zeros(len(ticks), dtype=get_data.DENSE_TYPE)
+    observations["tick"] = ticks
+    observations["C1C"] = observations["C2C"] = 2e7
+    observations["L2C"] = 1e8
+    observations["L1C"] = 1e8 * F1 / F2
+    return observations
+
+
+def fake_orbits(prns, tick_count):
+    """
+    Every satellite stays directly above the station
+    """
+    pos = numpy.tile(STATION * 4, (len(prns), tick_count, 1))
+    return orbits.OrbitTable(prns, pos, numpy.zeros_like(pos))
+
+
+def connection_spans(scn):
+    return {
+        (station, prn): [
+            (con.idx_start, con.idx_end, con.tick_start, con.tick_end, con.offset)
+            for con in conn_tick_map.connections
+        ]
+        for station, prn_map in scn.conn_map.items()
+        for prn, conn_tick_map in prn_map.items()
+    }
+
+
+def test_rolling_scenario():
+    """
+    Appending an hour should give the same connections as building the new
+    window from scratch, and keep the one crossing the hour boundary whole
+    """
+    prns = ["G01", "G02", "G03"]
+    old_data = {
+        "stat": {
+            "G01": fake_observations(numpy.arange(0, 240)),
+            "G02": fake_observations(
+                numpy.concatenate((numpy.arange(0, 100), numpy.arange(150, 240)))
+            ),
+            "G03": fake_observations(numpy.arange(0, 100)),
+        },
+        "gone": {"G01": fake_observations(numpy.arange(0, 60))},
+    }
+    new_data = {
+        "stat": {"G01": fake_observations(numpy.arange(0, 120))},
+        "new": {"G03": fake_observations(numpy.arange(30, 120))},
+    }
+    locs = {"stat": STATION, "gone": STATION, "new": STATION}
+
+    rolling = scenario.RollingScenario(
+        START,
+        2 * util.HOURS,
+        dict(locs),
+        old_data,
+        fake_orbits(prns, 241),
+        FakeDog(),
+        stations=locs,
+        window=2 * util.HOURS,
+    )
+    rolling.make_connections()
+    rolling.append(locs, new_data, fake_orbits(prns, 121), util.HOURS)
+
+    assert rolling.start_date == START + util.HOURS
+    assert rolling.duration == 2 * util.HOURS
+    assert rolling.orbit_table.tick_count == 241
+    assert set(rolling.station_data) == {"stat", "new"}
+    assert set(rolling.station_locs) == {"stat", "new"}
+    assert set(rolling.station_data["stat"]) == {"G01", "G02"}
+    numpy.testing.assert_array_equal(
+        rolling.station_data["stat"]["G01"]["tick"], numpy.arange(0, 240)
+    )
+    numpy.testing.assert_array_equal(
+        rolling.station_data["new"]["G03"]["tick"], numpy.arange(150, 240)
+    )
+
+    rebuilt = scenario.Scenario(
+        rolling.start_date,
+        rolling.duration,
+        rolling.station_locs,
+        {
+            station: {prn: obs.copy() for prn, obs in prn_map.items()}
+            for station, prn_map in rolling.station_data.items()
+        },
+        rolling.orbit_table,
+        FakeDog(),
+    )
+    rebuilt.make_connections()
+    assert connection_spans(rolling) == connection_spans(rebuilt)
+    assert connection_spans(rolling)[("stat", "G01")] == [(0, 239, 0, 239, 0.0)]
+    for station, prn_map in rebuilt.station_data.items():
+        for prn in prn_map:
+            numpy.testing.assert_array_equal(
+                rolling.observation_geometry(station, prn),
+                rebuilt.observation_geometry(station, prn),
+            )
+
+
+def test_cached_processing(tmp_path):
+    """
+    Connections and biases should come back from the cache, unless they were
+    saved by a different version
+    """
+    scn = scenario.Scenario(
+        START,
+        util.HOURS,
+        {"stat": STATION},
+        {
+            "stat": {
+                "G01": fake_observations(
+                    numpy.concatenate((numpy.arange(0, 50), numpy.arange(60, 120)))
+                ),
+                "G02": fake_observations(numpy.arange(0, 10)),
+            }
+        },
+        fake_orbits(["G01", "G02"], 121),
+        FakeDog(),
+    )
+    scn.make_connections()
+    scn.sat_biases = {"G01": 1.5, "G02": -0.5}
+    scn.rcvr_biases = {"stat": (0.1, 0.2, 0.3)}
+    path = tmp_path / "scenario.hdf5"
+    scn.to_hdf5(path)
+
+    restored = scenario.Scenario.from_hdf5(path, dog=FakeDog())
+    assert connection_spans(restored) == connection_spans(scn)
+    assert len(connection_spans(restored)[("stat", "G01")]) == 2
+    assert connection_spans(restored)[("stat", "G02")] == []
+    assert restored.sat_biases == scn.sat_biases
+    assert restored.rcvr_biases == scn.rcvr_biases
+    # nothing left to do
+    restored.solve_biases()
+    assert restored.bias_solver is None
+
+    with h5py.File(path, "a") as fout:
+        fout.attrs["version"] = scenario.SCENARIO_VERSION - 1
+    stale = scenario.Scenario.from_hdf5(path, dog=FakeDog())
+    assert not stale.conn_map
+    assert not stale.sat_biases
+    assert set(stale.station_data["stat"]) == {"G01", "G02"}
+
+
+def test_cache_version_bump(tmp_path, monkeypatch):
+    """
+    After a version bump, the cached scenario is still used but its
+    connections are worked out again, and saved for next time
+    """
+    monkeypatch.setattr(scenario.conf, "cache_dir", str(tmp_path))
+    populated = []
+
+    def parallel_populate_data(stations, start_date, duration, dog, progress):
+        populated.append(stations)
+        data = {"stat": {"G01": fake_observations(numpy.arange(0, 120))}}
+        return {"stat": STATION}, data, fake_orbits(["G01"], 121)
+
+    monkeypatch.setattr(get_data, "parallel_populate_data", parallel_populate_data)
+    scn = scenario.Scenario.from_daterange(START, util.HOURS, ["stat"], FakeDog())
+    scn.make_connections()
+    assert len(populated) == 1
+
+    monkeypatch.setattr(scenario, "SCENARIO_VERSION", scenario.SCENARIO_VERSION + 1)
+    stale = scenario.Scenario.from_daterange(START, util.HOURS, ["stat"], FakeDog())
+    assert stale.cache_path == scn.cache_path
+    assert len(populated) == 1
+    assert not stale.conn_map
+    stale.make_connections()
+
+    again = scenario.Scenario.from_daterange(START, util.HOURS, ["stat"], FakeDog())
+    assert connection_spans(again)[("stat", "G01")]
+    assert connection_spans(again) == connection_spans(scn)
+
+
+def test_cache_layout_change(tmp_path, monkeypatch):
+    """
+    Scenarios cached with another data layout (here, the one from before
+    orbit tables) aren't opened, the data is downloaded again
+    """
+    monkeypatch.setattr(scenario.conf, "cache_dir", str(tmp_path))
+    populated = []
+
+    def parallel_populate_data(stations, start_date, duration, dog, progress):
+        populated.append(stations)
+        data = {"stat": {"G01": fake_observations(numpy.arange(0, 120))}}
+        return {"stat": STATION}, data, fake_orbits(["G01"], 121)
+
+    monkeypatch.setattr(get_data, "parallel_populate_data", parallel_populate_data)
+
+    # the key and layout used before there was a layout version
+    hasher = hashlib.md5()
+    hasher.update(repr(["stat"]).encode())
+    hasher.update(START.isoformat().encode())
+    hasher.update(repr(util.HOURS.total_seconds()).encode())
+    old_path = tmp_path / "scenarios" / f"{hasher.hexdigest()}.hdf5"
+    old_path.parent.mkdir()
+    with h5py.File(old_path, "w") as fout:
+        fout["data/stat/G01"] = numpy.zeros(
+            3, dtype=[("tick", "i4"), ("sat_pos", "3f8")]
+        )
+        fout["loc/stat"] = STATION
+        fout.attrs.update({"start_date": START.timestamp(), "duration": 3600})
+
+    scn = scenario.Scenario.from_daterange(START, util.HOURS, ["stat"], FakeDog())
+    assert len(populated) == 1
+    assert scn.cache_path != old_path
+    assert "G01" in scn.orbit_table
+
+
+def test_observation_geometry():
+    """
+    The geometry worked out for a whole station at once should match working
+    it out for each satellite's observations separately
+    """
+    prns = ["G01", "G02"]
+    orbit_table = fake_orbits(prns, 121)
+    orbit_table.pos[0] += numpy.linspace((0, 0, 0), (1e7, 2e7, 0), 121)
+    orbit_table.pos[1] -= numpy.linspace((0, 0, 0), (0, 1e7, 3e7), 121)
+    scn = scenario.Scenario(
+        START,
+        util.HOURS,
+        {"stat": STATION},
+        {
+            "stat": {
+                "G01": fake_observations(numpy.arange(0, 120)),
+                "G02": fake_observations(numpy.arange(30, 90)),
+            }
+        },
+        orbit_table,
+        FakeDog(),
+    )
+    for prn, observations in scn.station_data["stat"].items():
+        geometry = scn.observation_geometry("stat", prn)
+        sat_pos = scn.sat_positions(prn, observations)
+        ipps = tec.ion_locs(STATION, sat_pos)
+        assert len(geometry) == len(observations)
+        numpy.testing.assert_allclose(geometry["el"], scn.station_el("stat", sat_pos))
+        numpy.testing.assert_allclose(geometry["ipp"], ipps)
+        numpy.testing.assert_allclose(
+            geometry["latlon"], coordinates.ecef2geodetic(ipps)[..., 0:2]
+        )
+        numpy.testing.assert_allclose(
+            geometry["s_to_v"], tec.s_to_v_factor(geometry["el"])
+        )
+        # the near intersection, between the station and the satellite
+        numpy.testing.assert_allclose(numpy.linalg.norm(ipps, axis=1), tec.IONOSPHERE_H)
+        assert numpy.all(
+            numpy.linalg.norm(ipps - STATION, axis=1)
+            < numpy.linalg.norm(sat_pos - STATION, axis=1)
+        )
+
+
+def test_tick_lookup(tmp_path):
+    """
+    Looking ticks up, one at a time or a whole array at once, should find
+    the observation with that tick, or nothing where there isn't one
+    """
+    ticks = numpy.concatenate(
+        (numpy.arange(0, 40), numpy.arange(42, 70, 3), numpy.arange(80, 121))
+    )
+    scn = scenario.Scenario(
+        START,
+        util.HOURS,
+        {"stat": STATION},
+        {"stat": {"G01": fake_observations(ticks)}},
+        fake_orbits(["G01"], 121),
+        FakeDog(),
+    )
+    scn.make_connections()
+    cons = scn.conn_map["stat"]["G01"].connections
+    assert len(cons) == 2
+
+    for con in cons:
+        lookup = {tick: idx for idx, tick in enumerate(con.observations["tick"])}
+        wanted = numpy.arange(con.tick_start - 2, con.tick_end + 3)
+        expected = [lookup.get(tick, -1) for tick in wanted]
+        assert con.tick_idxs(wanted).tolist() == expected
+        in_range = range(con.tick_start, con.tick_end + 1)
+        assert [con.tick_idx(tick) for tick in in_range] == [
+            lookup.get(tick) for tick in in_range
+        ]
+
+    scn.export_vtec_data(tmp_path / "export.hdf5")
+    with h5py.File(tmp_path / "export.hdf5", "r") as fin:
+        exported = fin["data"][:, 0]
+    latlons = scn.conn_map["stat"]["G01"].get_ipps_latlon(len(exported))
+    found = latlons.valid
+    numpy.testing.assert_allclose(
+        exported["latlon"][found], latlons.values[found], rtol=1e-6
+    )
+    assert not exported["latlon"][~found].any()
+
+
+def test_tick_series():
+    """
+    Per tick data for a link should read as the connections' data at their
+    ticks, and the default everywhere else
+    """
+    ticks = numpy.concatenate((numpy.arange(0, 40), numpy.arange(80, 121, 2)))
+    scn = scenario.Scenario(
+        START,
+        util.HOURS,
+        {"stat": STATION},
+        {"stat": {"G01": fake_observations(ticks)}},
+        fake_orbits(["G01"], 121),
+        FakeDog(),
+    )
+    scn.make_connections()
+    conn_tick_map = scn.conn_map["stat"]["G01"]
+    cons = conn_tick_map.connections
+    assert len(cons) == 2
+
+    latlons = conn_tick_map.get_ipps_latlon()
+    vtecs = conn_tick_map.get_vtecs()
+    assert len(latlons) == len(vtecs) == 121
+    for con_id, con in enumerate(cons):
+        con_ticks = con.observations["tick"]
+        numpy.testing.assert_allclose(
+            latlons.values[con_ticks], con.geometry["latlon"], rtol=1e-6
+        )
+        numpy.testing.assert_allclose(vtecs.values[con_ticks], con.vtecs[0], rtol=1e-6)
+        assert (latlons.con_ids[con_ticks] == con_id).all()
+    assert latlons.valid.sum() == sum(con.idx_end - con.idx_start + 1 for con in cons)
+    assert latlons[41] is None and latlons[81] is None and latlons[500] is None
+    assert vtecs[41] == 0.0 and vtecs[-1] == 0.0
+    assert [latlon is None for latlon in latlons] == (~latlons.valid).tolist()
+
+    window = vtecs[30:90]
+    assert isinstance(window, connections.TickSeries)
+    numpy.testing.assert_array_equal(window.valid, vtecs.valid[30:90])
+    picked = latlons[numpy.array([0, 41, 82])]
+    assert picked.valid.tolist() == [True, False, True]
+    assert numpy.isnan(numpy.asarray(picked)[1]).all()
+    numpy.testing.assert_array_equal(numpy.asarray(vtecs), vtecs.values)
+    assert len(conn_tick_map.get_filtered_vtecs(60)) == 60
+
+
+def test_conn_tick_map():
+    """
+    Ticks should map to the connection covering them, found by binary search
+    """
+    spans = [(3, 10), (11, 11), (20, 45), (47, 60)]
+    cons = [SimpleNamespace(tick_start=start, tick_end=end) for start, end in spans]
+    conn_tick_map = connections.ConnTickMap(cons)
+
+    ticks = numpy.arange(-2, 65)
+    expected = [
+        next((i for i, (start, end) in enumerate(spans) if start <= t <= end), -1)
+        for t in ticks
+    ]
+    assert conn_tick_map.lookup(ticks).tolist() == expected
+    for tick, idx in zip(ticks.tolist(), expected):
+        assert (tick in conn_tick_map) == (idx >= 0)
+        if idx >= 0:
+            assert conn_tick_map[tick] is cons[idx]
+        else:
+            with pytest.raises(KeyError):
+                conn_tick_map[tick]  # pylint: disable=pointless-statement
+
+    empty = connections.ConnTickMap([])
+    assert empty.lookup(ticks).tolist() == [-1] * len(ticks)
+    assert 5 not in empty
+
+
+class FakeBiasSolver:
+    """
+    Comes up with the same biases for any scenario
+    """
+
+    def __init__(self, scn):
+        self.scn = scn
+
+    def solve_biases(self):
+        return {"G01": 2.0}, {"stat": (1.0, 0.0, 0.0)}
+
+
+def test_vtec_cache(monkeypatch):
+    """
+    Connections' vtecs should be worked out once, until the biases change
+    """
+    scn = scenario.Scenario(
+        START,
+        util.HOURS,
+        {"stat": STATION},
+        {"stat": {"G01": fake_observations(numpy.arange(0, 120))}},
+        fake_orbits(["G01"], 121),
+        FakeDog(),
+    )
+    scn.make_connections()
+    (con,) = scn.conn_map["stat"]["G01"].connections
+    vtecs = con.vtecs
+    assert con.vtecs is vtecs
+    assert not vtecs.flags.writeable
+    assert scn.vtec_cache_bytes() == vtecs.nbytes
+
+    monkeypatch.setattr(bias_solve, "SimpleBiasSolver", FakeBiasSolver)
+    scn.solve_biases()
+    assert scn.vtec_cache_bytes() == 0
+    assert con.vtecs is not vtecs
+    assert not numpy.allclose(con.vtecs[0], vtecs[0])
+    numpy.testing.assert_allclose(
+        con.vtecs, tec.calculate_vtecs(con), rtol=1e-12, atol=1e-12
+    )
+
+    scn.clear_vtec_cache()
+    assert scn.vtec_cache_bytes() == 0
+
+
+def test_connection_table(monkeypatch):
+    """
+    Working on all the connections at once through the table should give
+    what working on them one at a time does
+    """
+    prns = ["G01", "G02", "G03"]
+    rand = numpy.random.default_rng(1)
+    data = {}
+    for station in ("st01", "st00"):
+        data[station] = {}
+        for prn in prns:
+            ticks = numpy.sort(rand.choice(240, size=200, replace=False))
+            data[station][prn] = fake_observations(ticks)
+            data[station][prn]["L1C"] += rand.normal(size=200) * 1e-3
+    scn = scenario.Scenario(
+        START,
+        2 * util.HOURS,
+        {station: STATION for station in data},
+        data,
+        fake_orbits(prns, 241),
+        FakeDog(),
+    )
+    scn.make_connections()
+
+    table = scn.connection_table()
+    cons = [
+        con
+        for station in sorted(scn.conn_map)
+        for prn in sorted(scn.conn_map[station])
+        for con in scn.conn_map[station][prn].connections
+    ]
+    assert len(table) == len(cons) > len(prns)
+    assert table.stations == ["st00", "st01"] and table.prns == prns
+    for row, con in enumerate(cons):
+        assert table[row] is con
+        assert table.stations[table.station[row]] == con.station
+        assert table.prns[table.prn[row]] == con.prn
+        assert (table.idx_start[row], table.idx_end[row]) == (
+            con.idx_start,
+            con.idx_end,
+        )
+        assert table.offset[row] == con.offset
+    numpy.testing.assert_array_equal(
+        table.ticks, numpy.concatenate([con.observations["tick"] for con in cons])
+    )
+    numpy.testing.assert_array_equal(
+        table.latlons, numpy.concatenate([con.geometry["latlon"] for con in cons])
+    )
+    numpy.testing.assert_array_equal(
+        table.con_ids,
+        numpy.concatenate(
+            [[row] * len(con.observations) for row, con in enumerate(cons)]
+        ),
+    )
+
+    monkeypatch.setattr(bias_solve, "SimpleBiasSolver", FakeBiasSolver)
+    vtecs = table.vtecs
+    numpy.testing.assert_array_equal(
+        vtecs, numpy.concatenate([con.vtecs for con in cons], axis=1)
+    )
+    scn.solve_biases()
+    assert table.vtecs is not vtecs
+    numpy.testing.assert_allclose(
+        table.vtecs,
+        numpy.concatenate([con.vtecs for con in cons], axis=1),
+        rtol=1e-12,
+        atol=1e-12,
+    )
+
+    filtered, valid = table.filtered_vtecs()
+    assert valid.any()
+    for row, con in enumerate(cons):
+        rows = table.con_ids == row
+        if con.idx_end - con.idx_start < util.BUTTER_MIN_LENGTH:
+            assert not valid[rows].any()
+        else:
+            assert valid[rows].all()
+            numpy.testing.assert_allclose(
+                filtered[rows], util.bpfilter(con.vtecs[0]), rtol=1e-12, atol=1e-12
+            )
+
+
+def test_parallel_connections():
+    """
+    Making connections across processes should give the same connections as
+    making them here
+    """
+    prns = ["G01", "G02", "G03"]
+    rand = numpy.random.default_rng(0)
+    data = {}
+    for i in range(6):
+        data[f"st{i:02d}"] = {}
+        for prn in prns:
+            ticks = numpy.sort(rand.choice(240, size=200, replace=False))
+            data[f"st{i:02d}"][prn] = fake_observations(ticks)
+    locs = {station: STATION for station in data}
+
+    def build():
+        return scenario.Scenario(
+            START,
+            2 * util.HOURS,
+            locs,
+            {
+                station: {prn: obs.copy() for prn, obs in prn_map.items()}
+                for station, prn_map in data.items()
+            },
+            fake_orbits(prns, 241),
+            FakeDog(),
+        )
+
+    serial = build()
+    serial.make_connections(workers=1)
+    parallel = build()
+    parallel.make_connections(workers=2)
+    assert connection_spans(parallel) == connection_spans(serial)
+    assert sum(len(spans) for spans in connection_spans(serial).values()) > 0
+
+
+def reference_bounds(ticks, mw_signal, elevations, phase_diffs):
+    """
+    The set based breakpoint search connection_bounds replaced
+    """
+    bkpoints = set(numpy.where(numpy.diff(ticks) >= scenario.DISCON_TIME)[0])
+    bkpoints |= set(numpy.where(numpy.isnan(mw_signal))[0])
+    bkpoints |= set(numpy.where(elevations < scenario.EL_CUTOFF)[0])
+    discontinuities = numpy.where(numpy.abs(numpy.diff(phase_diffs, n=2)) > 1e-10)[0]
+    bkpoints |= set(discontinuities)
+    bkpoints |= set(discontinuities + 2)
+
+    bkpoint_list = sorted(bkpoints)
+    segmenter_bkpoints = set()
+    for i, bkpoint in enumerate(bkpoint_list):
+        start = 0 if i == 0 else bkpoint_list[i - 1] + 1
+        if bkpoint - start < scenario.MIN_CON_LENGTH:
+            continue
+        bkpts = util.segmenter(mw_signal[start:bkpoint])
+        segmenter_bkpoints |= set(start + bkpt for bkpt in bkpts)
+    if len(bkpoint_list) > 0:
+        start = bkpoint_list[-1] + 1
+        bkpoint = len(ticks) - 1
+        if bkpoint - start >= scenario.MIN_CON_LENGTH:
+            segmenter_bkpoints |= set(util.segmenter(mw_signal[start:bkpoint]))
+
+    partition_points = sorted(segmenter_bkpoints | set(bkpoints))
+    bounds = []
+    for i, bkpoint in enumerate(partition_points):
+        start = 0 if i == 0 else partition_points[i - 1] + 1
+        if (bkpoint - 1) - start >= scenario.MIN_CON_LENGTH:
+            bounds.append((start, bkpoint - 1))
+    if len(partition_points) > 0:
+        start = partition_points[-1] + 1
+        if len(ticks) - 1 - start >= scenario.MIN_CON_LENGTH:
+            bounds.append((start, len(ticks) - 1))
+    else:
+        bounds.append((0, len(ticks) - 1))
+    return bounds
+
+
+def random_signals(rand, count):
+    """
+    Observation-like signals with gaps, NaNs, low elevations, cycle slips
+    and jumps in the Melbourne Wubbena combination, each only sometimes
+    """
+    ticks = numpy.sort(rand.choice(count * 11 // 10, size=count, replace=False))
+    mw_signal = rand.normal(size=count) * 0.1
+    for _ in range(rand.integers(0, 4)):
+        mw_signal[rand.integers(count) :] += rand.normal() * 10
+    if rand.random() < 0.3:
+        mw_signal[rand.integers(count, size=rand.integers(1, 4))] = numpy.nan
+    elevations = numpy.full(count, 0.5)
+    if rand.random() < 0.3:
+        elevations[: rand.integers(count)] = 0.1
+    phase_diffs = numpy.arange(count) * 1e-3
+    for _ in range(rand.integers(0, 3)):
+        phase_diffs[rand.integers(count) :] += 1e-6
+    if rand.random() < 0.2:
+        ticks = numpy.arange(count)
+    return ticks, mw_signal, elevations, phase_diffs
+
+
+def test_connection_bounds():
+    """
+    The vectorized breakpoint search should find exactly what the old one did
+    """
+    rand = numpy.random.default_rng(0)
+    for _ in range(500):
+        signals = random_signals(rand, int(rand.integers(20, 400)))
+        starts, ends = scenario.connection_bounds(*signals)
+        assert list(zip(starts.tolist(), ends.tolist())) == reference_bounds(*signals)
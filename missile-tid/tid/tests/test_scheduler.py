@@ -0,0 +1,107 @@
+"""
+Tests for the download scheduler
+"""
+import json
+import threading
+import time
+
+from tid import scheduler
+
+
+def decode(path: str) -> str:
+    """
+    Pretend decoding: the decoded form is a sibling file
+    """
+    with open(path + ".done", "w", encoding="utf-8") as fout:
+        fout.write("decoded")
+    return path + ".done"
+
+
+def broken_decode(path: str) -> str:
+    """
+    Decoding that always fails
+    """
+    raise ValueError(f"{path} is not RINEX")
+
+
+def test_stream(tmp_path):
+    """
+    Everything should come back (failures as None), with no more than
+    max_in_flight tasks outstanding and progress reported for each one
+    """
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, maximum
+
+    def fetch(task: int):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        if task % 5 == 0:
+            return None
+        if task % 7 == 0:
+            raise RuntimeError("mirror fell over")
+        path = tmp_path / f"{task}.raw"
+        path.write_bytes(b"x" * 10)
+        return str(path)
+
+    reports = []
+    results = dict(
+        scheduler.DownloadScheduler(
+            threads=8, decode_workers=2, max_in_flight=4
+        ).stream(
+            range(1, 41),
+            fetch,
+            decode,
+            lambda path: path.endswith(".done"),
+            progress=reports.append,
+        )
+    )
+
+    assert sorted(results) == list(range(1, 41))
+    failed = [task for task in results if task % 5 == 0 or task % 7 == 0]
+    assert all(results[task] is None for task in failed)
+    assert all(
+        results[task].endswith(".done") for task in results if task not in failed
+    )
+
+    assert in_flight[1] <= 4
+    assert len(reports) == 40
+    assert reports[-1] == scheduler.Progress(
+        total=40,
+        done=40 - len(failed),
+        failed=len(failed),
+        rinex_bytes=10 * (40 - len(failed)),
+    )
+
+
+def test_stream_decode_failure(tmp_path, caplog):
+    """
+    Failed decodes come back as None, and are logged as decode failures
+    """
+    path = tmp_path / "1.raw"
+    path.write_bytes(b"x")
+    results = list(
+        scheduler.DownloadScheduler(threads=1, decode_workers=1).stream(
+            [1], lambda task: str(path), broken_decode, lambda path: False
+        )
+    )
+    assert results == [(1, None)]
+    assert "failed to decode 1" in caplog.text
+
+
+def test_progress_file(tmp_path):
+    """
+    Progress written for other processes should be readable JSON
+    """
+    path = tmp_path / scheduler.PROGRESS_FILE
+    callback = scheduler.progress_file(str(path))
+    callback(scheduler.Progress(total=3, done=1, failed=1, rinex_bytes=100))
+    assert json.loads(path.read_text()) == {
+        "total": 3,
+        "done": 1,
+        "failed": 1,
+        "rinex_bytes": 100,
+    }
@@ -183,3 +183,67 @@ def segmenter(data_stream: numpy.ndarray) -> Sequence[int]:
             numpy.abs(numpy.diff(data_stream, prepend=data_stream[0])) > diff * 5
         )[0],
     )
+
+
+def chunked_segmenter(
+    data_stream: numpy.ndarray, starts: numpy.ndarray, stops: numpy.ndarray
+) -> numpy.ndarray:
+    """
+    Run segmenter over many chunks of a signal at once
+
+    Args:
+        data_stream: numpy array of 1d data, ~constant within each chunk
+        starts: index of the first element of each chunk, in increasing order
+        stops: index one past the last element of each chunk, chunks
+            must not overlap and need at least 2 elements each
+
+    Returns:
+        indices into data_stream of all the elements segmenter would remove
+        from each chunk, in increasing order
+    """
+    starts = numpy.asarray(starts, dtype=int)
+    stops = numpy.asarray(stops, dtype=int)
+    if len(starts) == 0:
+        return numpy.zeros(0, dtype=int)
+    abs_diffs = numpy.abs(numpy.diff(data_stream))
+
+    # each chunk's differences, with 4 zeros on either side: then the "valid"
+    # convolution of it all is every chunk's "full" convolution, back to back
+    diff_counts = stops - starts - 1
+    padded_starts = 4 + numpy.concatenate(([0], numpy.cumsum(diff_counts + 4)[:-1]))
+    padded = numpy.zeros(padded_starts[-1] + diff_counts[-1] + 4)
+    padded[concat_ranges(padded_starts, diff_counts)] = abs_diffs[
+        concat_ranges(starts, diff_counts)
+    ]
+    smoothed = numpy.convolve(padded, numpy.array([1, 1, 1, 1, 1]) / 5, mode="valid")
+
+    # median of each chunk's share of that, from the middle of each sorted share
+    smoothed_counts = diff_counts + 4
+    chunk_ids = numpy.repeat(numpy.arange(len(starts)), smoothed_counts)
+    smoothed = smoothed[numpy.lexsort((smoothed, chunk_ids))]
+    firsts = padded_starts - 4
+    diff = (
+        smoothed[firsts + (smoothed_counts - 1) // 2]
+        + smoothed[firsts + smoothed_counts // 2]
+    ) / 2
+
+    # the first element of each chunk never differs from itself
+    candidates = concat_ranges(starts + 1, diff_counts)
+    thresholds = numpy.repeat(diff * 5, diff_counts)
+    return candidates[abs_diffs[candidates - 1] > thresholds]
+
+
+def concat_ranges(starts: numpy.ndarray, counts: numpy.ndarray) -> numpy.ndarray:
+    """
+    Concatenated ranges of integers
+
+    Args:
+        starts: the first integer of each range
+        counts: how many integers are in each range
+
+    Returns:
+        numpy array of starts[0], starts[0] + 1, ..., starts[1], starts[1] + 1, ...
+    """
+    total = int(numpy.sum(counts))
+    ends = numpy.cumsum(counts)
+    return numpy.arange(total) + numpy.repeat(starts - (ends - counts), counts)